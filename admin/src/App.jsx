@@ -9,6 +9,8 @@ import FeedbackManagement from './FeedbackManagement';
 
 // API Configuration
 const API_BASE_URL = 'https://flowfinance.onrender.com';
+// Stop waiting on a broadcast after this long; the job keeps running server-side
+const BROADCAST_POLL_TIMEOUT_MS = 5 * 60 * 1000;
 
 // API Service (Kept exactly as original)
 const api = {
@@ -123,6 +125,13 @@ const api = {
     if (!response.ok) throw new Error('Failed to send broadcast notification');
     return response.json();
   },
+  async getBroadcastJob(token, jobId) {
+    const response = await fetch(`${API_BASE_URL}/api/admin/broadcast-jobs/${jobId}`, {
+      headers: { 'Authorization': `Bearer ${token}` }
+    });
+    if (!response.ok) throw new Error('Failed to fetch broadcast progress');
+    return response.json();
+  },
   async deleteAdmin(token, adminId) {
     const response = await fetch(`${API_BASE_URL}/api/admin/admins/${adminId}`, {
       method: 'DELETE',
@@ -565,12 +574,31 @@ const Dashboard = ({ token, admin, onLogout }) => {
 
     setBroadcastLoading(true);
     try {
-      const result = await api.sendBroadcastNotification(token, broadcastForm);
+      const queued = await api.sendBroadcastNotification(token, broadcastForm);
+      // The broadcast runs as a background job; poll until it finishes
+      const deadline = Date.now() + BROADCAST_POLL_TIMEOUT_MS;
+      let result = await api.getBroadcastJob(token, queued.job_id);
+      while ((result.status === 'queued' || result.status === 'running') && Date.now() < deadline) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        result = await api.getBroadcastJob(token, queued.job_id);
+      }
+      if (result.status === 'queued' || result.status === 'running') {
+        alert(
+          `Broadcast is still running in the background.\n\n` +
+          `Processed: ${result.processed} / ${result.total_users}\n` +
+          `Job ID: ${queued.job_id}`
+        );
+        return;
+      }
+      if (result.status === 'failed') {
+        throw new Error(result.error || 'Broadcast job failed');
+      }
       alert(
         `Broadcast sent successfully!\n\n` +
         `Total Users: ${result.total_users}\n` +
         `Notifications Sent: ${result.notifications_sent}\n` +
-        `Push Notifications: ${result.fcm_sent} sent, ${result.fcm_failed} failed`
+        `Skipped (preferences): ${result.skipped_by_preference}\n` +
+        `Push Notifications: ${result.push_queued} queued, ${result.without_push_token} without a device token`
       );
       setBroadcastForm({
         title: '',
@@ -128,12 +128,11 @@ class BroadcastNotificationRequest(BaseModel):
     notification_type: str = "system_broadcast"  # You can add this to NotificationType enum
 
 
-class BroadcastNotificationResponse(BaseModel):
+class BroadcastJobResponse(BaseModel):
     message: str
+    job_id: str
+    status: str
     total_users: int
-    notifications_sent: int
-    fcm_sent: int
-    fcm_failed: int
     
     
 class AdminFeedbackListResponse(BaseModel):
@@ -2,16 +2,14 @@ import uuid
 from datetime import datetime, timedelta, UTC
 from typing import Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException, status, Depends, Query, Path
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status, Depends, Query, Path
 
 from admin_utils import (
     create_admin_access_token,
     get_current_admin,
-    get_password_hash,
     log_admin_action,
     require_admin_or_super,
-    require_super_admin,
-    verify_password
+    require_super_admin
 )
 from admin_models import (
     AdminActionLog,
@@ -24,15 +22,13 @@ from admin_models import (
     AdminToken,
     AdminUpdate,
     BroadcastNotificationRequest,
-    BroadcastNotificationResponse,
+    BroadcastJobResponse,
     SystemStatsResponse,
     UpdateUserSubscriptionRequest,
     UserDetailResponse,
     UserListResponse,
     UserStatsResponse
 )
-from firebase_service import send_fcm_to_multiple
-from notification_service import should_send_notification
 from models import Currency, SubscriptionType
 from database import (
     admins_collection,
@@ -44,10 +40,30 @@ from database import (
     chat_sessions_collection,
     notifications_collection,
     ai_usage_collection,
-    feedback_collection
+    feedback_collection,
+    insight_jobs_collection,
+    broadcast_jobs_collection
 )
 from ai_usage_models import AIUsageResponse, UserAIUsageStats, AIUsageStatsResponse, AIFeatureType, AIProviderType
 from config import settings
+from recompute_queue_service import recompute_queue
+from fcm_delivery_service import fcm_delivery_queue
+from vector_store_service import vector_store_manager
+from utils import invalidate_principal, principal_cache_stats
+from insight_batch_service import get_insight_job_progress, list_insight_jobs, run_insight_job
+from broadcast_service import (
+    create_broadcast_job,
+    get_broadcast_job_progress,
+    list_broadcast_jobs,
+    requeue_failed_broadcast_job,
+    resume_broadcast_job,
+    run_broadcast_job
+)
+from ai_governor_service import ai_governor
+from ai_response_cache_service import ai_response_cache
+from password_service import (
+    check_login_allowed, client_ip, get_password_hash_async, password_service_stats, record_login_failure, record_login_success, verify_password_async
+)
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -55,16 +71,21 @@ router = APIRouter(prefix="/api/admin", tags=["admin"])
 # ==================== ADMIN AUTHENTICATION ====================
 
 @router.post("/login", response_model=AdminToken)
-async def admin_login(credentials: AdminLogin):
+async def admin_login(credentials: AdminLogin, request: Request):
     """Admin login"""
+    ip = client_ip(request)
+    check_login_allowed(ip, credentials.email)
+
     # [FIX] Added await
     admin = await admins_collection.find_one({"email": credentials.email})
     
-    if not admin or not verify_password(credentials.password, admin["password"]):
+    if not admin or not await verify_password_async(credentials.password, admin["password"]):
+        record_login_failure(ip, credentials.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
+    record_login_success(ip, credentials.email)
     
     # Update last login
     # [FIX] Added await
@@ -111,7 +132,7 @@ async def admin_change_password(
     current_admin: dict = Depends(get_current_admin)
 ):
     """Change admin password"""
-    if not verify_password(password_data.current_password, current_admin["password"]):
+    if not await verify_password_async(password_data.current_password, current_admin["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect"
@@ -129,7 +150,7 @@ async def admin_change_password(
             detail="New passwords do not match"
         )
     
-    hashed_password = get_password_hash(password_data.new_password)
+    hashed_password = await get_password_hash_async(password_data.new_password)
     # [FIX] Added await
     await admins_collection.update_one(
         {"_id": current_admin["_id"]},
@@ -224,7 +245,7 @@ async def create_admin(
         "_id": admin_id,
         "name": admin_data.name,
         "email": admin_data.email,
-        "password": get_password_hash(admin_data.password),
+        "password": await get_password_hash_async(admin_data.password),
         "role": admin_data.role.value,
         "created_at": datetime.now(UTC),
         "last_login": None
@@ -463,6 +484,7 @@ async def update_user_subscription(
         {"_id": user_id},
         {"$set": update_data}
     )
+    invalidate_principal(user["email"])
     
     await log_admin_action(
         admin_id=current_admin["_id"],
@@ -497,8 +519,11 @@ async def delete_user(
     await budgets_collection.delete_many({"user_id": user_id})
     await chat_sessions_collection.delete_many({"user_id": user_id})
     await notifications_collection.delete_many({"user_id": user_id})
+    if vector_store_manager:
+        await vector_store_manager.drop(user_id)
     
     result = await users_collection.delete_one({"_id": user_id})
+    invalidate_principal(user["email"])
     
     if result.deleted_count == 0:
         raise HTTPException(
@@ -624,109 +649,188 @@ async def get_system_stats(current_admin: dict = Depends(require_admin_or_super)
         active_users_today=len(active_today),
         active_users_this_week=len(active_week)
     )
-    
+
+
+@router.get("/stats/recompute-queue", response_model=Dict)
+async def get_recompute_queue_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get budget recompute queue depth, coalescing and latency for this worker"""
+    return recompute_queue.stats()
+
+
+@router.get("/stats/rag", response_model=Dict)
+async def get_rag_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get chatbot RAG cache statistics for this worker"""
+    embeddings = vector_store_manager.embeddings if vector_store_manager else None
+    return {
+        "vector_stores": vector_store_manager.stats() if vector_store_manager else None,
+        "embeddings": embeddings.stats() if hasattr(embeddings, "stats") else None
+    }
+
+
+@router.get("/stats/auth-cache", response_model=Dict)
+async def get_auth_cache_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get authenticated-user principal cache statistics for this worker"""
+    return principal_cache_stats()
+
+
+@router.get("/stats/password-hashing", response_model=Dict)
+async def get_password_hashing_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get bcrypt pool saturation and login rate limiting counters for this worker"""
+    return password_service_stats()
+
+
+@router.get("/stats/ai-governor", response_model=Dict)
+async def get_ai_governor_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get per-provider AI concurrency limits, rate buckets and lane wait times for this worker"""
+    return ai_governor.stats()
+
+
+@router.get("/stats/ai-response-cache", response_model=Dict)
+async def get_ai_response_cache_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get AI response cache hit rate and tokens saved for this worker, plus stored entry count"""
+    return await ai_response_cache.stats()
+
+
+@router.get("/stats/fcm-delivery", response_model=Dict)
+async def get_fcm_delivery_stats(current_admin: dict = Depends(require_admin_or_super)):
+    """Get push delivery queue depth, throughput, failures and pruned tokens for this worker"""
+    return fcm_delivery_queue.stats()
+
+
+# ==================== INSIGHT JOBS ====================
+
+@router.get("/insight-jobs", response_model=List[Dict])
+async def get_insight_jobs(
+    limit: int = Query(10, ge=1, le=50),
+    current_admin: dict = Depends(require_admin_or_super)
+):
+    """List recent weekly/monthly insight generation jobs with progress and throughput"""
+    return await list_insight_jobs(limit)
+
+
+@router.get("/insight-jobs/{job_id}", response_model=Dict)
+async def get_insight_job(
+    job_id: str = Path(...),
+    current_admin: dict = Depends(require_admin_or_super)
+):
+    """Get progress of one insight generation job"""
+    job = await insight_jobs_collection.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Insight job not found")
+    return await get_insight_job_progress(job)
+
+
+@router.post("/insight-jobs/{job_id}/resume", response_model=Dict)
+async def resume_insight_job(
+    background_tasks: BackgroundTasks,
+    job_id: str = Path(...),
+    current_admin: dict = Depends(require_super_admin)
+):
+    """Resume an unfinished insight job on this worker (safe alongside other workers)"""
+    job = await insight_jobs_collection.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Insight job not found")
+    if job["status"] == "completed":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insight job already completed")
+
+    background_tasks.add_task(run_insight_job, job)
+    await log_admin_action(
+        admin_id=current_admin["_id"],
+        admin_email=current_admin["email"],
+        action="resumed_insight_job",
+        details=f"Resumed insight job {job_id}"
+    )
+    return {"message": "Insight job resumed", "job_id": job_id}
+
     
     
 # ==================== NOTIFICATION BROADCAST ====================
 
-@router.post("/broadcast-notification", response_model=BroadcastNotificationResponse)
+@router.post("/broadcast-notification", response_model=BroadcastJobResponse)
 async def broadcast_notification(
     broadcast_data: BroadcastNotificationRequest,
+    background_tasks: BackgroundTasks,
     current_admin: dict = Depends(require_admin_or_super)
 ):
-    """Broadcast notification to users based on criteria"""
+    """Queue a broadcast to users based on criteria; poll /broadcast-jobs/{job_id} for progress"""
     try:
-        # Build user query based on target
-        query = {}
-        if broadcast_data.target_users == "free":
-            query["subscription_type"] = "free"
-        elif broadcast_data.target_users == "premium":
-            query["subscription_type"] = "premium"
-        
-        # [FIX] Async find and to_list
-        cursor = users_collection.find(query)
-        users = await cursor.to_list(length=None)
-        total_users = len(users)
-        
-        if total_users == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No users found matching the criteria"
-            )
-        
-        # Create notifications and collect FCM tokens
-        notifications_sent = 0
-        fcm_tokens = []
-        
-        for user in users:
-            user_id = user["_id"]
-            
-            # [FIX] Added await to this imported async function
-            if not await should_send_notification(user_id, broadcast_data.notification_type):
-                continue
-            
-            notification_id = str(uuid.uuid4())
-            notification = {
-                "_id": notification_id,
-                "user_id": user_id,
-                "type": broadcast_data.notification_type,
-                "title": broadcast_data.title,
-                "message": broadcast_data.message,
-                "goal_id": None,
-                "goal_name": None,
-                "currency": None,
-                "created_at": datetime.now(UTC),
-                "is_read": False
-            }
-            
-            # [FIX] Added await
-            await notifications_collection.insert_one(notification)
-            notifications_sent += 1
-            
-            if user.get("fcm_token"):
-                fcm_tokens.append(user["fcm_token"])
-        
-        # Send FCM push notifications in batch
-        fcm_result = {"success": 0, "failure": 0}
-        if fcm_tokens:
-            fcm_data = {
-                "type": broadcast_data.notification_type,
-                "is_broadcast": "true"
-            }
-            # send_fcm_to_multiple is sync (uses firebase sdk), so it's fine
-            fcm_result = send_fcm_to_multiple(
-                fcm_tokens=fcm_tokens,
-                title=broadcast_data.title,
-                body=broadcast_data.message,
-                data=fcm_data
-            )
-        
-        await log_admin_action(
-            admin_id=current_admin["_id"],
-            admin_email=current_admin["email"],
-            action="broadcast_notification",
-            details=f"Sent '{broadcast_data.title}' to {broadcast_data.target_users} users ({notifications_sent} notifications, {fcm_result['success']} FCM sent)"
+        job = await create_broadcast_job(
+            title=broadcast_data.title,
+            message=broadcast_data.message,
+            target_users=broadcast_data.target_users,
+            notification_type=broadcast_data.notification_type,
+            admin=current_admin
         )
-        
-        return BroadcastNotificationResponse(
-            message=f"Broadcast notification sent successfully",
-            total_users=total_users,
-            notifications_sent=notifications_sent,
-            fcm_sent=fcm_result["success"],
-            fcm_failed=fcm_result["failure"]
-        )
-        
-    except HTTPException:
-        raise
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"Error broadcasting notification: {str(e)}")
-        import traceback
-        traceback.print_exc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to broadcast notification: {str(e)}"
         )
 
+    background_tasks.add_task(run_broadcast_job, job["_id"])
+    await log_admin_action(
+        admin_id=current_admin["_id"],
+        admin_email=current_admin["email"],
+        action="broadcast_notification",
+        details=f"Queued '{broadcast_data.title}' to {broadcast_data.target_users} users ({job['total_users']} users, job {job['_id']})"
+    )
+
+    return BroadcastJobResponse(
+        message="Broadcast notification queued",
+        job_id=job["_id"],
+        status=job["status"],
+        total_users=job["total_users"]
+    )
+
+
+@router.get("/broadcast-jobs", response_model=List[Dict])
+async def get_broadcast_jobs(
+    limit: int = Query(10, ge=1, le=50),
+    current_admin: dict = Depends(require_admin_or_super)
+):
+    """List recent broadcast jobs with progress"""
+    return await list_broadcast_jobs(limit)
+
+
+@router.get("/broadcast-jobs/{job_id}", response_model=Dict)
+async def get_broadcast_job(
+    job_id: str = Path(...),
+    current_admin: dict = Depends(require_admin_or_super)
+):
+    """Get progress of one broadcast job"""
+    job = await broadcast_jobs_collection.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Broadcast job not found")
+    return get_broadcast_job_progress(job)
+
+
+@router.post("/broadcast-jobs/{job_id}/resume", response_model=Dict)
+async def resume_broadcast(
+    background_tasks: BackgroundTasks,
+    job_id: str = Path(...),
+    current_admin: dict = Depends(require_super_admin)
+):
+    """Restart a failed or stalled broadcast from its last checkpoint (safe alongside other workers)"""
+    job = await broadcast_jobs_collection.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Broadcast job not found")
+    if job["status"] == "completed":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Broadcast job already completed")
+
+    if job["status"] == "failed":
+        await requeue_failed_broadcast_job(job_id)
+    background_tasks.add_task(resume_broadcast_job, job_id)
+    await log_admin_action(
+        admin_id=current_admin["_id"],
+        admin_email=current_admin["email"],
+        action="resumed_broadcast_job",
+        details=f"Resumed broadcast job {job_id}"
+    )
+    return {"message": "Broadcast job resumed", "job_id": job_id}
+
 
 @router.get("/broadcast-stats")
 async def get_broadcast_stats(
@@ -1,16 +1,18 @@
 import asyncio
 import os
 import json
+import time
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta, timezone
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
-from budget_service import update_budget_spent_amounts
+from budget_service import get_budgets_spent_view
 from database import transactions_collection, users_collection, goals_collection, budgets_collection
+from vector_store_service import vector_store_manager
+from ai_governor_service import ai_governor, estimate_tokens
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -40,8 +42,9 @@ def get_date_only(dt: datetime) -> str:
 class FinancialDataProcessor:
     """Processes user's financial data for RAG"""
     
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, snapshot: Optional["FinancialSnapshot"] = None):
         self.user_id = user_id
+        self.snapshot = snapshot
         
         
     def ensure_utc_datetime(self, dt) -> datetime:
@@ -87,11 +90,9 @@ class FinancialDataProcessor:
             print(f"Error fetching goals: {e}")
             return []
         
-    # [FIX] Changed to async
     async def get_user_budgets(self) -> List[Dict]:
-        """Get user's active budgets"""
-        try:         
-            # [FIX] Async find
+        """Get user's active budgets with current spent amounts (read-only)"""
+        try:
             cursor = budgets_collection.find({
                 "user_id": self.user_id,
                 "is_active": True,
@@ -99,22 +100,8 @@ class FinancialDataProcessor:
             }).sort("created_at", -1)
             budgets = await cursor.to_list(length=None)
             
-            # Update spent amounts for each budget
-            for budget in budgets:
-                try:
-                    # [FIX] Added await
-                    await update_budget_spent_amounts(self.user_id, budget["_id"])
-                except Exception as e:
-                    print(f"Error updating budget {budget['_id']}: {e}")
-            
-            # Refresh budget data after updates
-            # [FIX] Async find
-            cursor = budgets_collection.find({
-                "user_id": self.user_id,
-                "is_active": True,
-                "status": "active"
-            }).sort("created_at", -1)
-            budgets = await cursor.to_list(length=None)
+            # Spent amounts for every budget from one aggregation; nothing is written
+            budgets = await get_budgets_spent_view(self.user_id, budgets)
             
             print(f"Found {len(budgets)} active budgets for user {self.user_id}")
             return budgets
@@ -215,12 +202,17 @@ class FinancialDataProcessor:
     
     # [FIX] Changed to async
     async def create_financial_documents(self) -> List[Document]:
-        """Create optimized documents for GPT-4 with multi-currency support"""
-        # [FIX] Await async methods
-        transactions = await self.get_user_transactions()
-        goals = await self.get_user_goals()
-        budgets = await self.get_user_budgets()
-        summary = await self.get_financial_summary()
+        """
+        Create optimized documents for GPT-4 with multi-currency support.
+        Only absolute dates go in here: the text is embedded and hashed, so
+        "days ago"/"days remaining" would change every chunk every day.
+        Those come from build_time_context() at prompt time instead.
+        """
+        snapshot = self.snapshot or await get_financial_snapshot(self.user_id)
+        transactions = snapshot.transactions
+        goals = snapshot.goals
+        budgets = snapshot.budgets
+        summary = snapshot.summary
         documents = []
         
         # === FINANCIAL GOALS OVERVIEW (MULTI-CURRENCY) ===
@@ -270,13 +262,7 @@ class FinancialDataProcessor:
                         
                         if g.get("target_date"):
                             target_date = ensure_utc_datetime(g["target_date"])
-                            days_remaining = (target_date - datetime.now(timezone.utc)).days
                             goals_text += f"Target Date: {target_date.strftime('%B %d, %Y')}\n"
-                            goals_text += f"Days Remaining: {days_remaining}\n"
-                            
-                            if days_remaining > 0 and remaining > 0:
-                                daily_needed = remaining / days_remaining
-                                goals_text += f"Daily Savings Needed: {currency_symbol}{daily_needed:,.2f}\n"
                         
                         goals_text += f"Created: {ensure_utc_datetime(g['created_at']).strftime('%b %d, %Y')}\n\n"
                 
@@ -335,13 +321,11 @@ class FinancialDataProcessor:
                 for idx, b in enumerate(curr_budgets, 1):
                     start_date = ensure_utc_datetime(b["start_date"])
                     end_date = ensure_utc_datetime(b["end_date"])
-                    days_remaining = (end_date - datetime.now(timezone.utc)).days
                     days_total = (end_date - start_date).days + 1
                     
                     budgets_text += f"──── Budget #{idx}: {b['name']} ────\n"
                     budgets_text += f"Period: {b['period'].title()}\n"
-                    budgets_text += f"Duration: {start_date.strftime('%b %d, %Y')} - {end_date.strftime('%b %d, %Y')}\n"
-                    budgets_text += f"Days Remaining: {days_remaining} of {days_total}\n"
+                    budgets_text += f"Duration: {start_date.strftime('%b %d, %Y')} - {end_date.strftime('%b %d, %Y')} ({days_total} days)\n"
                     budgets_text += f"Total Budget: {currency_symbol}{b['total_budget']:,.2f}\n"
                     budgets_text += f"Total Spent: {currency_symbol}{b['total_spent']:,.2f}\n"
                     budgets_text += f"Remaining: {currency_symbol}{b['remaining_budget']:,.2f}\n"
@@ -391,16 +375,12 @@ class FinancialDataProcessor:
         
         for idx, t in enumerate(transactions[:25], 1):
             date_obj = ensure_utc_datetime(t["date"])
-            days_ago = (datetime.now(timezone.utc) - date_obj).days
             
             currency = t.get("currency", "usd")
             currency_symbol = "$" if currency == "usd" else ("K" if currency == "mmk" else "฿")
             currency_name = "USD" if currency == "usd" else ("MMK" if currency == "mmk" else "THB")
-
             
-            recency_indicator = "🔴 TODAY" if days_ago == 0 else f"📅 {days_ago} days ago"
-            
-            chronological_text += f"─── Transaction #{idx} ({recency_indicator}) ───\n"
+            chronological_text += f"─── Transaction #{idx} ───\n"
             chronological_text += f"Date: {date_obj.strftime('%A, %B %d, %Y')} ({get_date_only(t['date'])})\n"
             chronological_text += f"Type: {t['type'].title()}\n"
             chronological_text += f"Amount: {currency_symbol}{t['amount']:,.2f} ({currency_name})\n"
@@ -491,20 +471,6 @@ class FinancialDataProcessor:
             if goal.get("target_date"):
                 target_date = ensure_utc_datetime(goal["target_date"])
                 goal_text += f"Target Date: {target_date.strftime('%B %d, %Y')}\n"
-                
-                if goal["status"] == "active":
-                    days_remaining = (target_date - datetime.now(timezone.utc)).days
-                    goal_text += f"Days Remaining: {days_remaining}\n"
-                    
-                    if days_remaining > 0 and remaining > 0:
-                        daily_needed = remaining / days_remaining
-                        weekly_needed = daily_needed * 7
-                        monthly_needed = daily_needed * 30
-                        
-                        goal_text += f"\nSavings Needed:\n"
-                        goal_text += f"  • Daily: {currency_symbol}{daily_needed:,.2f}\n"
-                        goal_text += f"  • Weekly: {currency_symbol}{weekly_needed:,.2f}\n"
-                        goal_text += f"  • Monthly: {currency_symbol}{monthly_needed:,.2f}\n"
             
             goal_text += f"\nCreated: {ensure_utc_datetime(goal['created_at']).strftime('%B %d, %Y')}\n"
             
@@ -537,9 +503,7 @@ class FinancialDataProcessor:
             
             start_date = ensure_utc_datetime(budget["start_date"])
             end_date = ensure_utc_datetime(budget["end_date"])
-            days_remaining = (end_date - datetime.now(timezone.utc)).days
             days_total = (end_date - start_date).days + 1
-            days_elapsed = days_total - days_remaining
             
             budget_text = f"╔═══════════════════════════════════════════════════╗\n"
             budget_text += f"║   BUDGET: {budget['name'][:40].center(40)}   ║\n"
@@ -549,8 +513,7 @@ class FinancialDataProcessor:
             budget_text += f"Period: {budget['period'].title()}\n"
             budget_text += f"Start Date: {start_date.strftime('%B %d, %Y')}\n"
             budget_text += f"End Date: {end_date.strftime('%B %d, %Y')}\n"
-            budget_text += f"Days Elapsed: {days_elapsed} / {days_total}\n"
-            budget_text += f"Days Remaining: {days_remaining}\n\n"
+            budget_text += f"Total Days: {days_total}\n\n"
             
             budget_text += f"💰 OVERALL BUDGET:\n"
             budget_text += f"Total Budget: {currency_symbol}{budget['total_budget']:,.2f}\n"
@@ -563,18 +526,6 @@ class FinancialDataProcessor:
             elif budget['percentage_used'] >= 80:
                 budget_text += f"⚠️  CAUTION: High usage - {currency_symbol}{budget['remaining_budget']:,.2f} remaining\n"
             
-            # Daily rate analysis
-            if days_remaining > 0:
-                daily_rate_current = budget['total_spent'] / days_elapsed if days_elapsed > 0 else 0
-                daily_budget_remaining = budget['remaining_budget'] / days_remaining
-                
-                budget_text += f"\n📊 SPENDING RATE:\n"
-                budget_text += f"Current Daily Avg: {currency_symbol}{daily_rate_current:,.2f}\n"
-                budget_text += f"Daily Budget Left: {currency_symbol}{daily_budget_remaining:,.2f}\n"
-                
-                if daily_rate_current > daily_budget_remaining:
-                    budget_text += f"⚠️  Spending faster than budget allows!\n"
-            
             budget_text += f"\n📋 CATEGORY BUDGETS:\n\n"
             for cat in budget['category_budgets']:
                 cat_name = cat['main_category']
@@ -625,8 +576,6 @@ class FinancialDataProcessor:
             if date_obj < recent_cutoff:
                 continue
             
-            days_ago = (datetime.now(timezone.utc) - date_obj).days
-            
             # Group by currency
             currency_totals = {}
             for t in daily_transactions:
@@ -641,7 +590,7 @@ class FinancialDataProcessor:
                 
                 currency_totals[currency]["transactions"].append(t)
             
-            daily_text = f"─── {date_obj.strftime('%A, %B %d, %Y')} ({days_ago} days ago) ───\n\n"
+            daily_text = f"─── {date_obj.strftime('%A, %B %d, %Y')} ───\n\n"
             daily_text += f"Daily Summary: {len(daily_transactions)} transactions\n\n"
             
             for currency, totals in currency_totals.items():
@@ -669,8 +618,7 @@ class FinancialDataProcessor:
                 metadata={
                     "type": "daily_summary",
                     "user_id": self.user_id,
-                    "date": date_str,
-                    "days_ago": days_ago
+                    "date": date_str
                 }
             ))
         
@@ -721,6 +669,128 @@ class FinancialDataProcessor:
         return documents
 
 
+# ==================== FINANCIAL SNAPSHOT ====================
+
+# Chat turns a few seconds apart reuse the same snapshot
+SNAPSHOT_TTL_SECONDS = 15
+SNAPSHOT_CACHE_MAX_USERS = 256
+
+
+class FinancialSnapshot:
+    """
+    A user's transactions, goals, budgets and summary, loaded once with
+    concurrent queries and shared by prompt building, insights and RAG documents.
+    """
+    
+    def __init__(self, user_id: str, transactions: List[Dict], goals: List[Dict], budgets: List[Dict], summary: Dict[str, Any]):
+        self.user_id = user_id
+        self.transactions = transactions
+        self.goals = goals
+        self.budgets = budgets
+        self.summary = summary
+        self.loaded_at = time.monotonic()
+    
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+
+_snapshot_cache: "OrderedDict[str, FinancialSnapshot]" = OrderedDict()
+# user_id -> monotonic time of the last invalidation, so a load that was
+# already in flight when the data changed isn't cached
+_snapshot_invalidated_at: Dict[str, float] = {}
+
+
+async def get_financial_snapshot(user_id: str, max_age: float = SNAPSHOT_TTL_SECONDS) -> FinancialSnapshot:
+    """Return a cached snapshot younger than `max_age` seconds, or load a fresh one"""
+    cached = _snapshot_cache.get(user_id)
+    if cached and cached.age <= max_age:
+        _snapshot_cache.move_to_end(user_id)
+        return cached
+    
+    started_at = time.monotonic()
+    processor = FinancialDataProcessor(user_id)
+    transactions, goals, budgets, summary = await asyncio.gather(
+        processor.get_user_transactions(),
+        processor.get_user_goals(),
+        processor.get_user_budgets(),
+        processor.get_financial_summary()
+    )
+    snapshot = FinancialSnapshot(user_id, transactions, goals, budgets, summary)
+    
+    if _snapshot_invalidated_at.get(user_id, 0) < started_at:
+        _snapshot_cache[user_id] = snapshot
+        _snapshot_cache.move_to_end(user_id)
+        while len(_snapshot_cache) > SNAPSHOT_CACHE_MAX_USERS:
+            _snapshot_cache.popitem(last=False)
+    
+    return snapshot
+
+
+def invalidate_financial_snapshot(user_id: str):
+    """Drop the user's cached snapshot after their data changed"""
+    _snapshot_cache.pop(user_id, None)
+    now = time.monotonic()
+    _snapshot_invalidated_at[user_id] = now
+    
+    # Only recent invalidations can race with an in-flight load
+    for stale_user in [u for u, at in _snapshot_invalidated_at.items() if now - at > SNAPSHOT_TTL_SECONDS * 4]:
+        del _snapshot_invalidated_at[stale_user]
+
+
+def build_time_context(snapshot: FinancialSnapshot, now: Optional[datetime] = None) -> str:
+    """Figures relative to today (days ago/remaining, daily rates), computed per prompt"""
+    now = now or datetime.now(timezone.utc)
+    text = "═══════════════════════════════════════════════════\n"
+    text += "║   TIME-SENSITIVE FIGURES (AS OF TODAY)              ║\n"
+    text += "═══════════════════════════════════════════════════\n\n"
+    
+    if snapshot.transactions:
+        text += "🕒 MOST RECENT TRANSACTIONS:\n"
+        for idx, t in enumerate(snapshot.transactions[:5], 1):
+            date_obj = ensure_utc_datetime(t["date"])
+            days_ago = (now - date_obj).days
+            recency_indicator = "🔴 TODAY" if days_ago == 0 else f"📅 {days_ago} days ago"
+            text += f"  #{idx}: {date_obj.strftime('%b %d, %Y')} ({recency_indicator}) - {t['main_category']} > {t['sub_category']}\n"
+        text += "\n"
+    
+    active_goals = [g for g in snapshot.goals if g["status"] == "active" and g.get("target_date")]
+    if active_goals:
+        text += "🎯 GOAL DEADLINES:\n"
+        for g in active_goals:
+            currency = g.get("currency", "usd")
+            currency_symbol = "$" if currency == "usd" else ("K" if currency == "mmk" else "฿")
+            days_remaining = (ensure_utc_datetime(g["target_date"]) - now).days
+            remaining = g["target_amount"] - g["current_amount"]
+            text += f"  • {g['name']}: {days_remaining} days remaining"
+            if days_remaining > 0 and remaining > 0:
+                daily_needed = remaining / days_remaining
+                text += f" - needs {currency_symbol}{daily_needed:,.2f}/day, {currency_symbol}{daily_needed * 7:,.2f}/week, {currency_symbol}{daily_needed * 30:,.2f}/month"
+            text += "\n"
+        text += "\n"
+    
+    if snapshot.budgets:
+        text += "📊 BUDGET PERIODS:\n"
+        for b in snapshot.budgets:
+            currency = b.get("currency", "usd")
+            currency_symbol = "$" if currency == "usd" else ("K" if currency == "mmk" else "฿")
+            start_date = ensure_utc_datetime(b["start_date"])
+            end_date = ensure_utc_datetime(b["end_date"])
+            days_total = (end_date - start_date).days + 1
+            days_remaining = (end_date - now).days
+            days_elapsed = days_total - days_remaining
+            text += f"  • {b['name']}: day {days_elapsed} of {days_total}, {days_remaining} days remaining"
+            if days_remaining > 0:
+                daily_rate_current = b['total_spent'] / days_elapsed if days_elapsed > 0 else 0
+                daily_budget_remaining = b['remaining_budget'] / days_remaining
+                text += f" - spending {currency_symbol}{daily_rate_current:,.2f}/day, {currency_symbol}{daily_budget_remaining:,.2f}/day left"
+                if daily_rate_current > daily_budget_remaining:
+                    text += " ⚠️ spending faster than budget allows"
+            text += "\n"
+    
+    return text
+
+
 class FinancialChatbot:
     """AI Chatbot with GPT-4 + Optimized RAG (Recommended Approach)"""
     
@@ -730,77 +800,29 @@ class FinancialChatbot:
         if not self.openai_api_key:
             print("Warning: OPENAI_API_KEY not found")
         
-        try:
-            self.embeddings = OpenAIEmbeddings(
-                api_key=self.openai_api_key,
-                model="text-embedding-3-small"
-            )
-        except Exception as e:
-            print(f"Error initializing embeddings: {e}")
-            self.embeddings = None
-        
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        self.user_vector_stores = {}
+        # Vector stores (and their embeddings) are shared with the Gemini chatbot
+        self.vector_stores = vector_store_manager
+        self.embeddings = vector_store_manager.embeddings if vector_store_manager else None
         
         self.gpt_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     
-    # [FIX] Changed to async
-    async def _get_or_create_vector_store(self, user_id: str) -> Chroma:
+    async def _get_or_create_vector_store(self, user_id: str, snapshot: Optional[FinancialSnapshot] = None) -> Optional[Chroma]:
         """Get or create vector store for user"""
-        if user_id not in self.user_vector_stores:
-            processor = FinancialDataProcessor(user_id)
-            
-            # [FIX] Await async document creation
-            documents = await processor.create_financial_documents()
-            
-            if not documents or not self.embeddings:
-                return None
-            
-            try:
-                split_documents = []
-                for doc in documents:
-                    # Never split chronological index or goals overview
-                    if doc.metadata.get("type") in ["chronological_index", "goals_overview"]:
-                        split_documents.append(doc)
-                    else:
-                        split_documents.extend(self.text_splitter.split_documents([doc]))
-                
-                # [NOTE] Chroma.from_documents can be blocking (CPU/Disk), so wrapping in thread is okay here if needed.
-                # However, for simplicity/compatibility we often call it directly or via to_thread.
-                # Since we are in an async method, let's offload the heavy Chroma creation to a thread.
-                vector_store = await asyncio.to_thread(
-                    Chroma.from_documents,
-                    documents=split_documents,
-                    embedding=self.embeddings,
-                    collection_name=f"user_{user_id}_{int(datetime.now().timestamp())}"
-                )
-                self.user_vector_stores[user_id] = vector_store
-                print(f"✅ Created vector store with {len(split_documents)} chunks")
-            except Exception as e:
-                print(f"❌ Error creating vector store: {e}")
-                return None
-        
-        return self.user_vector_stores[user_id]
+        if not self.vector_stores:
+            return None
+        processor = FinancialDataProcessor(user_id, snapshot)
+        return await self.vector_stores.get_or_create(user_id, processor.create_financial_documents)
     
-    def refresh_user_data(self, user_id: str):
+    async def refresh_user_data(self, user_id: str):
         """
-        Invalidate user's vector store cache. 
-        The next call to stream_chat will automatically rebuild it.
+        Mark user's vector store as stale. 
+        The next call to stream_chat re-syncs it, embedding only changed chunks.
         """
-        if user_id in self.user_vector_stores:
-            try:
-                # Optional: Explicitly clean up if needed, though GC handles objects usually
-                self.user_vector_stores[user_id].delete_collection()
-            except Exception as e:
-                print(f"⚠️ Error clearing vector store for {user_id}: {e}")
-            
-            # Just remove it from memory
-            del self.user_vector_stores[user_id]
-            print(f"🗑️ Invalidated cache for user {user_id}")
+        invalidate_financial_snapshot(user_id)
+        if not self.vector_stores:
+            return
+        self.vector_stores.mark_stale(user_id)
+        print(f"🗑️ Marked vector store stale for user {user_id}")
     
     def _build_system_prompt(self, today: str, response_style: str = "normal") -> str:
         """Build enhanced system prompt for GPT-4 with Myanmar language support and response style"""
@@ -873,7 +895,7 @@ Your capabilities:
 1. TEMPORAL QUERIES ("latest", "recent", "last", "newest" or Myanmar: "နောက်ဆုံး", "မကြာသေးသော", "လတ်တလော"):
 - The data includes a CHRONOLOGICAL INDEX sorted NEWEST → OLDEST
 - Transaction #1 in that index is ALWAYS the most recent
-- Look for visual indicators like "🔴 TODAY" or "days ago"
+- The TIME-SENSITIVE FIGURES section shows how many days ago recent transactions were ("🔴 TODAY" / "days ago")
 - NEVER confuse older transactions with newer ones
 
 2. CURRENCY AWARENESS:
@@ -904,8 +926,8 @@ Your capabilities:
 5. DATE ACCURACY:
 - Today is {today}
 - Verify dates carefully before answering
-- Use the "days ago" information as a guide
-- For budgets, calculate days remaining vs days elapsed
+- Use the "days ago" and "days remaining" figures in TIME-SENSITIVE FIGURES as a guide
+- For budgets, compare days remaining vs days elapsed from that section
 
 6. RESPONSE STYLE - {response_style.upper()}:
 {style_instructions.get(response_style, style_instructions["normal"])}
@@ -1060,14 +1082,9 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                 yield "User not found. Please log in again.", None
                 return
             
-            processor = FinancialDataProcessor(user_id)
-            
-            # [FIX] Fetch data concurrently using native async methods
-            summary, goals, budgets = await asyncio.gather(
-                processor.get_financial_summary(),
-                processor.get_user_goals(),
-                processor.get_user_budgets()
-            )
+            # One snapshot feeds the prompt and, if needed, the RAG documents
+            snapshot = await get_financial_snapshot(user_id)
+            summary, goals, budgets = snapshot.summary, snapshot.goals, snapshot.budgets
             
             # Calculate goals summary
             goals_summary = None
@@ -1131,7 +1148,7 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
             context = ""
             
             # [FIX] Await directly (it handles threading internally now)
-            vector_store = await self._get_or_create_vector_store(user_id)
+            vector_store = await self._get_or_create_vector_store(user_id, snapshot)
             
             if vector_store:
                 try:
@@ -1181,6 +1198,9 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                     role = "You" if msg.get("role") == "user" else "Assistant"
                     history_text += f"\n{role}: {msg.get('content', '')}"
             
+            # Relative dates are computed now, never stored in the embedded documents
+            context = build_time_context(snapshot) + "\n\n" + context
+            
             # Get today's date
             today = datetime.now(timezone.utc).strftime("%A, %B %d, %Y")
             
@@ -1202,32 +1222,39 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                 "explanatory": 0.4
             }
             
-            stream = await client.chat.completions.create(
-                model=self.gpt_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature_map.get(response_style, 0.3),
-                max_tokens=1000,
-                stream=True,
-                stream_options={"include_usage": True}
-            )
-
             final_usage_data = None
             
-            async for chunk in stream:
-                if hasattr(chunk, 'usage') and chunk.usage is not None:
-                    final_usage_data = {
-                        'input_tokens': chunk.usage.prompt_tokens,
-                        'output_tokens': chunk.usage.completion_tokens,
-                        'total_tokens': chunk.usage.total_tokens,
-                        'model_name': self.gpt_model
-                    }
+            # The governor slot is held until the stream is fully consumed
+            async with ai_governor.slot(
+                "openai",
+                lane="interactive",
+                estimated_tokens=estimate_tokens(system_prompt, user_prompt, max_output_tokens=1000)
+            ) as slot:
+                stream = await client.chat.completions.create(
+                    model=self.gpt_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=temperature_map.get(response_style, 0.3),
+                    max_tokens=1000,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
                 
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    yield content, None
+                async for chunk in stream:
+                    if hasattr(chunk, 'usage') and chunk.usage is not None:
+                        final_usage_data = {
+                            'input_tokens': chunk.usage.prompt_tokens,
+                            'output_tokens': chunk.usage.completion_tokens,
+                            'total_tokens': chunk.usage.total_tokens,
+                            'model_name': self.gpt_model
+                        }
+                        slot.record_tokens(chunk.usage.total_tokens)
+                    
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content = chunk.choices[0].delta.content
+                        yield content, None
 
             yield "", final_usage_data
             
@@ -4,8 +4,6 @@ import json
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta, timezone
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
@@ -37,7 +35,9 @@ def get_date_only(dt: datetime) -> str:
 
 
 # Import FinancialDataProcessor from the original file
-from ai_chatbot import FinancialDataProcessor
+from ai_chatbot import FinancialDataProcessor, FinancialSnapshot, build_time_context, get_financial_snapshot, invalidate_financial_snapshot
+from vector_store_service import vector_store_manager
+from ai_governor_service import ai_governor
 
 
 class GeminiFinancialChatbot:
@@ -53,22 +53,10 @@ class GeminiFinancialChatbot:
         if not self.openai_api_key:
             print("Warning: OPENAI_API_KEY not found (needed for embeddings)")
         
-        try:
-            # Still use OpenAI embeddings (Gemini doesn't have good embedding API via langchain)
-            self.embeddings = OpenAIEmbeddings(
-                api_key=self.openai_api_key,
-                model="text-embedding-3-small"
-            )
-        except Exception as e:
-            print(f"Error initializing embeddings: {e}")
-            self.embeddings = None
-        
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        self.user_vector_stores = {}
+        # Still use OpenAI embeddings (Gemini doesn't have good embedding API via langchain).
+        # The vector stores are shared with the OpenAI chatbot, so each user is embedded once.
+        self.vector_stores = vector_store_manager
+        self.embeddings = vector_store_manager.embeddings if vector_store_manager else None
         
         self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
         
@@ -82,56 +70,23 @@ class GeminiFinancialChatbot:
             except Exception as e:
                 print(f"❌ Failed to initialize genai client: {e}")
     
-    # [FIX] Changed to async
-    async def _get_or_create_vector_store(self, user_id: str) -> Chroma:
+    async def _get_or_create_vector_store(self, user_id: str, snapshot: Optional[FinancialSnapshot] = None) -> Optional[Chroma]:
         """Get or create vector store for user"""
-        if user_id not in self.user_vector_stores:
-            processor = FinancialDataProcessor(user_id)
-            
-            # [FIX] Await async document creation
-            documents = await processor.create_financial_documents()
-            
-            if not documents or not self.embeddings:
-                return None
-            
-            try:
-                split_documents = []
-                for doc in documents:
-                    if doc.metadata.get("type") in ["chronological_index", "goals_overview"]:
-                        split_documents.append(doc)
-                    else:
-                        split_documents.extend(self.text_splitter.split_documents([doc]))
-                
-                # [FIX] Run blocking Chroma call in a thread
-                vector_store = await asyncio.to_thread(
-                    Chroma.from_documents,
-                    documents=split_documents,
-                    embedding=self.embeddings,
-                    collection_name=f"user_gemini_{user_id}_{int(datetime.now().timestamp())}"
-                )
-                self.user_vector_stores[user_id] = vector_store
-                print(f"✅ Created Gemini vector store with {len(split_documents)} chunks")
-            except Exception as e:
-                print(f"❌ Error creating Gemini vector store: {e}")
-                return None
-        
-        return self.user_vector_stores[user_id]
+        if not self.vector_stores:
+            return None
+        processor = FinancialDataProcessor(user_id, snapshot)
+        return await self.vector_stores.get_or_create(user_id, processor.create_financial_documents)
     
-    def refresh_user_data(self, user_id: str):
+    async def refresh_user_data(self, user_id: str):
         """
-        Invalidate user's vector store cache. 
-        The next call to stream_chat will automatically rebuild it.
+        Mark user's vector store as stale. 
+        The next call to stream_chat re-syncs it, embedding only changed chunks.
         """
-        if user_id in self.user_vector_stores:
-            try:
-                self.user_vector_stores[user_id].delete_collection()
-            except:
-                pass
-            del self.user_vector_stores[user_id]
-        
-        # REMOVED: self._get_or_create_vector_store(user_id)
+        invalidate_financial_snapshot(user_id)
+        if self.vector_stores:
+            self.vector_stores.mark_stale(user_id)
         
-        print(f"✅ Refreshed (Invalidated) data for user {user_id}")
+        print(f"✅ Refreshed (marked stale) data for user {user_id}")
     
     def _build_system_prompt(self, today: str, response_style: str = "normal") -> str:
         """Build enhanced system prompt for Gemini with Myanmar language support and response style"""
@@ -204,7 +159,7 @@ Your capabilities:
 1. TEMPORAL QUERIES ("latest", "recent", "last", "newest" or Myanmar: "နောက်ဆုံး", "မကြာသေးသော", "လတ်တလော"):
 - The data includes a CHRONOLOGICAL INDEX sorted NEWEST → OLDEST
 - Transaction #1 in that index is ALWAYS the most recent
-- Look for visual indicators like "🔴 TODAY" or "days ago"
+- The TIME-SENSITIVE FIGURES section shows how many days ago recent transactions were ("🔴 TODAY" / "days ago")
 - NEVER confuse older transactions with newer ones
 
 2. CURRENCY AWARENESS:
@@ -235,8 +190,8 @@ Your capabilities:
 5. DATE ACCURACY:
 - Today is {today}
 - Verify dates carefully before answering
-- Use the "days ago" information as a guide
-- For budgets, calculate days remaining vs days elapsed
+- Use the "days ago" and "days remaining" figures in TIME-SENSITIVE FIGURES as a guide
+- For budgets, compare days remaining vs days elapsed from that section
 
 6. RESPONSE STYLE - {response_style.upper()}:
 {style_instructions.get(response_style, style_instructions["normal"])}
@@ -393,14 +348,9 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                 yield "User not found. Please log in again.", None
                 return
             
-            processor = FinancialDataProcessor(user_id)
-            
-            # [FIX] Await async methods concurrently
-            summary, goals, budgets = await asyncio.gather(
-                processor.get_financial_summary(),
-                processor.get_user_goals(),
-                processor.get_user_budgets()
-            )
+            # One snapshot feeds the prompt and, if needed, the RAG documents
+            snapshot = await get_financial_snapshot(user_id)
+            summary, goals, budgets = snapshot.summary, snapshot.goals, snapshot.budgets
             
             # Calculate goals summary (Logic remains same)
             goals_summary = None
@@ -464,7 +414,7 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
             context = ""
             
             # [FIX] Await async vector store creation
-            vector_store = await self._get_or_create_vector_store(user_id)
+            vector_store = await self._get_or_create_vector_store(user_id, snapshot)
             
             if vector_store:
                 try:
@@ -505,6 +455,9 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                     role = "You" if msg.get("role") == "user" else "Assistant"
                     history_text += f"\n{role}: {msg.get('content', '')}"
             
+            # Relative dates are computed now, never stored in the embedded documents
+            context = build_time_context(snapshot) + "\n\n" + context
+            
             today = datetime.now(timezone.utc).strftime("%A, %B %d, %Y")
             
             system_prompt = self._build_system_prompt(today, response_style)
@@ -522,15 +475,19 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                 # Approximate token count for logging
                 estimated_input = len(system_prompt + user_prompt) // 4
                 
-                # Gemini streaming call (using sync client in a thread or async client if available)
-                # Assuming 'self.client.models.generate_content_stream' is blocking:
-                # ADD this
                 full_prompt = f"{system_prompt}\n\nUSER QUERY: {user_prompt}"
 
-                def _sync_stream():
-                    chunks = []
-                    usage = None
-                    response = self.client.models.generate_content_stream(
+                full_response_text = ""
+                usage_metadata = None
+
+                # The governor slot is held until the stream is fully consumed
+                async with ai_governor.slot(
+                    "gemini",
+                    lane="interactive",
+                    estimated_tokens=estimated_input + 3000
+                ) as slot:
+                    # Async client: each chunk is forwarded as soon as the SDK yields it
+                    response = await self.client.aio.models.generate_content_stream(
                         model=self.gemini_model,
                         contents=[full_prompt],
                         config={
@@ -538,20 +495,16 @@ Remember: Accuracy is more important than speed. Double-check dates, amounts, AN
                             "max_output_tokens": 3000,
                         }
                     )
-                    for chunk in response:
-                        if chunk.text:
-                            chunks.append(chunk.text)
-                        if hasattr(chunk, 'usage_metadata') and chunk.usage_metadata:
-                            usage = chunk.usage_metadata
-                    return chunks, usage
 
-                full_response_text = ""
-                chunks, usage_metadata = await asyncio.to_thread(_sync_stream)
+                    async for chunk in response:
+                        if getattr(chunk, 'usage_metadata', None):
+                            usage_metadata = chunk.usage_metadata
+                        if chunk.text:
+                            full_response_text += chunk.text
+                            yield chunk.text, None
 
-                for chunk_text in chunks:
-                    full_response_text += chunk_text
-                    yield chunk_text, None
-                    await asyncio.sleep(0.01)
+                    if usage_metadata is not None:
+                        slot.record_tokens(getattr(usage_metadata, 'total_token_count', None))
 
                 # Now estimated_output can be calculated since full_response_text is populated
                 estimated_output = len(full_response_text) // 4
@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes: lower runs first. Interactive requests have a user waiting
+# on the response; batch work (scheduled insights) only uses spare capacity.
+LANE_PRIORITIES = {
+    "interactive": 0,
+    "standard": 1,
+    "batch": 2
+}
+# Share of each rate bucket that batch work may not consume, kept for users
+BATCH_RESERVE_FRACTION = float(os.getenv("AI_BATCH_RESERVE_FRACTION", "0.2"))
+
+# Per-provider limits; defaults match the lowest paid tiers of each API
+PROVIDER_LIMITS = {
+    "openai": {
+        "rpm": int(os.getenv("OPENAI_RPM", "500")),
+        "tpm": int(os.getenv("OPENAI_TPM", "200000")),
+        "max_concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    },
+    "gemini": {
+        "rpm": int(os.getenv("GEMINI_RPM", "1000")),
+        "tpm": int(os.getenv("GEMINI_TPM", "1000000")),
+        "max_concurrency": int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+    }
+}
+
+AI_INITIAL_CONCURRENCY = int(os.getenv("AI_INITIAL_CONCURRENCY", "8"))
+# Calls slower than this count as an overload signal
+AI_LATENCY_TARGET_SECONDS = float(os.getenv("AI_LATENCY_TARGET_SECONDS", "60"))
+# Ignore further decrease signals for this long after backing off once
+AI_DECREASE_COOLDOWN_SECONDS = 2.0
+# Retries (with exponential backoff) when a provider still answers 429
+AI_RATE_LIMIT_RETRIES = int(os.getenv("AI_RATE_LIMIT_RETRIES", "2"))
+
+
+def estimate_tokens(*texts: str, max_output_tokens: int = 0) -> int:
+    """Rough token estimate (~4 characters per token) plus the output budget"""
+    return sum(len(text or "") for text in texts) // 4 + max_output_tokens
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """429 / quota errors from the OpenAI and google-genai SDKs"""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "rate limit" in text.lower()
+
+
+def _usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None) is not None:
+        return usage.total_tokens
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None and getattr(metadata, "total_token_count", None) is not None:
+        return metadata.total_token_count
+    return None
+
+
+class TokenBucket:
+    """Continuously refilling bucket sized for one minute of a rate limit"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` is available while leaving `reserve` untouched"""
+        self._refill()
+        needed = min(amount + reserve, self.capacity) - self.tokens
+        return max(needed / self.rate, 0.0) if needed > 0 else 0.0
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Charge (positive) or refund (negative) once actual usage is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CallSlot:
+    """Handle for one admitted call; report actual usage with record_tokens"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def record_tokens(self, total_tokens: Optional[int]):
+        if total_tokens is not None:
+            self.actual_tokens = total_tokens
+
+
+class ProviderGovernor:
+    """
+    Admission control for one AI provider:
+    - request and token buckets keep us under the provider's RPM/TPM
+    - an AIMD concurrency limit grows on healthy calls and halves on 429s or
+      slow responses
+    - waiters are served by lane priority, then arrival order
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, max_concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(AI_INITIAL_CONCURRENCY, max_concurrency))
+        self.in_flight = 0
+
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+
+        self.admitted = {lane: 0 for lane in LANE_PRIORITIES}
+        self.rate_limited = 0
+        self.slow_calls = 0
+        self.errors = 0
+        self._wait_seconds = {lane: 0.0 for lane in LANE_PRIORITIES}
+
+    # ==================== ADMISSION ====================
+
+    def _dispatch(self):
+        self._timer = None
+        while self._waiters:
+            priority, _, lane, amount, future, queued_at = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return
+
+            reserve = BATCH_RESERVE_FRACTION if lane == "batch" else 0.0
+            wait = max(
+                self.requests.wait_time(1, reserve * self.requests.capacity),
+                self.tokens.wait_time(amount, reserve * self.tokens.capacity)
+            )
+            if wait > 0:
+                # Head of the queue waits for refill; same or lower priority
+                # waiters behind it may not overtake (a higher priority
+                # arrival re-dispatches immediately, see _acquire)
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(amount)
+            self.in_flight += 1
+            self.admitted[lane] += 1
+            self._wait_seconds[lane] += time.monotonic() - queued_at
+            future.set_result(None)
+
+    async def _acquire(self, lane: str, amount: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANE_PRIORITIES[lane], next(self._seq), lane, amount, future, time.monotonic()))
+        if self._timer is None:
+            self._dispatch()
+        elif self._waiters[0][4] is future:
+            # Sorts ahead of a head that is waiting for refill (e.g. a batch
+            # call held back by the reserve); don't make it wait on that timer
+            self._timer.cancel()
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled; hand the slot back
+                self._release(success=True, latency=0.0)
+            raise
+
+    def _release(self, success: bool, latency: float, rate_limited: bool = False):
+        self.in_flight -= 1
+        now = time.monotonic()
+
+        overloaded = rate_limited or latency > AI_LATENCY_TARGET_SECONDS
+        if overloaded:
+            if rate_limited:
+                self.rate_limited += 1
+            else:
+                self.slow_calls += 1
+            if now - self._last_decrease > AI_DECREASE_COOLDOWN_SECONDS:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+                logger.warning(f"⚠️ {self.name} overloaded, AI concurrency limit lowered to {int(self.limit)}")
+        elif success:
+            # +1 per "window" of limit successful calls
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        else:
+            self.errors += 1
+
+        if self._timer is None:
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "standard", estimated_tokens: int = 0):
+        """Hold one admitted call for the duration of the block (including streams)"""
+        await self._acquire(lane, estimated_tokens)
+        slot = CallSlot(estimated_tokens)
+        started = time.monotonic()
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(success=False, latency=time.monotonic() - started, rate_limited=is_rate_limit_error(e))
+            raise
+        else:
+            if slot.actual_tokens is not None:
+                self.tokens.adjust(slot.actual_tokens - estimated_tokens)
+            self._release(success=True, latency=time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": sum(1 for waiter in self._waiters if not waiter[4].done()),
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens),
+            "admitted": dict(self.admitted),
+            "avg_wait_ms": {
+                lane: round(self._wait_seconds[lane] / count * 1000, 1) if count else None
+                for lane, count in self.admitted.items()
+            },
+            "rate_limited": self.rate_limited,
+            "slow_calls": self.slow_calls,
+            "errors": self.errors
+        }
+
+
+class AIGovernor:
+    """Shared entry point for every OpenAI/Gemini call in the process"""
+
+    def __init__(self, limits: Dict[str, dict] = PROVIDER_LIMITS):
+        self.providers = {name: ProviderGovernor(name, **config) for name, config in limits.items()}
+
+    def slot(self, provider: str, lane: str = "standard", estimated_tokens: int = 0):
+        return self.providers[provider].slot(lane, estimated_tokens)
+
+    async def run(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable],
+        lane: str = "standard",
+        estimated_tokens: int = 0,
+        retries: int = AI_RATE_LIMIT_RETRIES
+    ):
+        """
+        Await `call()` once admitted. Token usage is read from the response;
+        429s are retried with backoff after the concurrency limit has dropped.
+        """
+        for attempt in range(retries + 1):
+            try:
+                async with self.slot(provider, lane, estimated_tokens) as slot:
+                    response = await call()
+                    slot.record_tokens(_usage_tokens(response))
+                    return response
+            except Exception as e:
+                if attempt >= retries or not is_rate_limit_error(e):
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    def stats(self) -> dict:
+        return {name: governor.stats() for name, governor in self.providers.items()}
+
+
+# Global governor shared by chat, extraction, insights and budgets
+ai_governor = AIGovernor()
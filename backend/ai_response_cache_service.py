@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, UTC
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from database import ai_response_cache_collection
+from ai_usage_service import track_ai_usage
+from ai_usage_models import AIFeatureType, AIProviderType
+
+logger = logging.getLogger(__name__)
+
+# Responses are reused for this long; the TTL index on expires_at removes them
+AI_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("AI_RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Least recently used entries beyond this are trimmed
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+# Larger responses are returned but not stored
+AI_RESPONSE_CACHE_MAX_RESPONSE_BYTES = int(os.getenv("AI_RESPONSE_CACHE_MAX_RESPONSE_BYTES", "65536"))
+# Only calls at or below this temperature are treated as deterministic
+AI_RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("AI_RESPONSE_CACHE_MAX_TEMPERATURE", "0.5"))
+AI_RESPONSE_CACHE_ENABLED = os.getenv("AI_RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+# Check the entry count once per this many stores instead of on every write
+TRIM_CHECK_INTERVAL = 200
+
+
+def cache_key(provider: str, model: str, temperature: float, prompt: Any, params: Optional[dict] = None) -> str:
+    """sha256 over (provider, model, temperature, prompt hash, request params)"""
+    prompt_hash = hashlib.sha256(
+        json.dumps(prompt, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    payload = json.dumps(
+        [provider, model, round(float(temperature), 3), prompt_hash, params or {}],
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _openai_result(response) -> Tuple[str, Dict[str, int]]:
+    usage = getattr(response, "usage", None)
+    return response.choices[0].message.content, {
+        "input_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0
+    }
+
+
+def _gemini_result(response) -> Tuple[str, Dict[str, int]]:
+    metadata = getattr(response, "usage_metadata", None)
+    return response.text, {
+        "input_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(metadata, "total_token_count", 0) or 0
+    }
+
+
+RESULT_READERS = {
+    "openai": _openai_result,
+    "gemini": _gemini_result
+}
+
+
+class AIResponseCache:
+    """
+    Content-addressed cache for deterministic (low temperature) completions.
+    Entries live in MongoDB so every worker shares them; identical calls that
+    are already in flight in this process wait for the first one instead of
+    calling the provider again. Hits are recorded in ai_usage at zero cost.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stores_since_trim = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.store_errors = 0
+        self.tokens_saved = 0
+
+    # ==================== STORAGE ====================
+
+    async def _lookup(self, key: str) -> Optional[dict]:
+        now = datetime.now(UTC)
+        try:
+            return await ai_response_cache_collection.find_one_and_update(
+                {"_id": key, "expires_at": {"$gt": now}},
+                {"$inc": {"hits": 1}, "$set": {"last_hit_at": now}},
+                projection={"content": 1, "usage": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except PyMongoError as e:
+            logger.warning(f"⚠️ AI response cache lookup failed: {e}")
+            return None
+
+    async def _store(self, key: str, provider: str, model: str, temperature: float, feature: str, content: str, usage: dict):
+        if not content or len(content.encode("utf-8")) > AI_RESPONSE_CACHE_MAX_RESPONSE_BYTES:
+            return
+        now = datetime.now(UTC)
+        try:
+            await ai_response_cache_collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "provider": provider,
+                    "model": model,
+                    "temperature": temperature,
+                    "feature_type": feature,
+                    "content": content,
+                    "usage": usage,
+                    "hits": 0,
+                    "created_at": now,
+                    "last_hit_at": now,
+                    "expires_at": now + timedelta(seconds=AI_RESPONSE_CACHE_TTL_SECONDS)
+                },
+                upsert=True
+            )
+        except PyMongoError as e:
+            self.store_errors += 1
+            logger.warning(f"⚠️ AI response cache write failed: {e}")
+            return
+
+        self._stores_since_trim += 1
+        if self._stores_since_trim >= TRIM_CHECK_INTERVAL:
+            self._stores_since_trim = 0
+            await self.trim()
+
+    async def trim(self) -> int:
+        """Delete the least recently used entries above AI_RESPONSE_CACHE_MAX_ENTRIES"""
+        try:
+            excess = await ai_response_cache_collection.estimated_document_count() - AI_RESPONSE_CACHE_MAX_ENTRIES
+            if excess <= 0:
+                return 0
+            cursor = ai_response_cache_collection.find({}, {"_id": 1}).sort("last_hit_at", 1).limit(excess)
+            stale_ids = [doc["_id"] async for doc in cursor]
+            result = await ai_response_cache_collection.delete_many({"_id": {"$in": stale_ids}})
+            logger.info(f"🧹 Trimmed {result.deleted_count} AI response cache entries")
+            return result.deleted_count
+        except PyMongoError as e:
+            logger.warning(f"⚠️ AI response cache trim failed: {e}")
+            return 0
+
+    # ==================== CALLS ====================
+
+    async def complete(
+        self,
+        provider: str,
+        model: str,
+        temperature: float,
+        prompt: Any,
+        call: Callable[[], Awaitable],
+        user_id: str,
+        feature_type: AIFeatureType,
+        params: Optional[dict] = None
+    ) -> str:
+        """
+        Return the response text for this prompt, calling `call()` (the
+        governed provider request) only on a miss. Usage is tracked either way.
+        """
+        if not AI_RESPONSE_CACHE_ENABLED or temperature > AI_RESPONSE_CACHE_MAX_TEMPERATURE:
+            self.bypassed += 1
+            content, usage = RESULT_READERS[provider](await call())
+            await self._track(user_id, feature_type, provider, model, usage)
+            return content
+
+        key = cache_key(provider, model, temperature, prompt, params)
+
+        while (pending := self._inflight.get(key)) is not None:
+            try:
+                content, usage = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The leader was cancelled, not us: the first waiter to get
+                # here finds no request in flight and takes over as leader
+                continue
+            self.coalesced += 1
+            await self._track(user_id, feature_type, provider, model, usage, cache_hit=True)
+            return content
+
+        # Registered before the lookup so concurrent callers wait on this one
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            cached = await self._lookup(key)
+            if cached:
+                self.hits += 1
+                content, usage = cached["content"], cached.get("usage") or {}
+                future.set_result((content, usage))
+                await self._track(user_id, feature_type, provider, model, usage, cache_hit=True)
+                return content
+
+            self.misses += 1
+            content, usage = RESULT_READERS[provider](await call())
+        except asyncio.CancelledError:
+            # Cancelling one caller must not fail the others; waiters see the
+            # cancelled future and retry
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        else:
+            if not future.done():
+                future.set_result((content, usage))
+        finally:
+            self._inflight.pop(key, None)
+
+        await self._track(user_id, feature_type, provider, model, usage)
+        await self._store(key, provider, model, temperature, feature_type.value, content, usage)
+        return content
+
+    async def _track(self, user_id: str, feature_type: AIFeatureType, provider: str, model: str, usage: dict, cache_hit: bool = False):
+        if cache_hit:
+            self.tokens_saved += usage.get("total_tokens", 0)
+        else:
+            logger.info(f"📊 [{provider.upper()} TOKEN USAGE - {feature_type.value}] User: {user_id}")
+            logger.info(f"   📥 Input tokens: {usage.get('input_tokens', 0):,}")
+            logger.info(f"   📤 Output tokens: {usage.get('output_tokens', 0):,}")
+            logger.info(f"   🤖 Model: {model}")
+
+        await track_ai_usage(
+            user_id=user_id,
+            feature_type=feature_type,
+            provider=AIProviderType(provider),
+            model_name=model,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            cache_hit=cache_hit
+        )
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        stats = {
+            "enabled": AI_RESPONSE_CACHE_ENABLED,
+            "ttl_seconds": AI_RESPONSE_CACHE_TTL_SECONDS,
+            "max_entries": AI_RESPONSE_CACHE_MAX_ENTRIES,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "store_errors": self.store_errors,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "in_flight": len(self._inflight)
+        }
+        try:
+            stats["entries"] = await ai_response_cache_collection.estimated_document_count()
+        except PyMongoError as e:
+            logger.warning(f"⚠️ AI response cache count failed: {e}")
+            stats["entries"] = None
+        return stats
+
+
+# Global cache shared by translation, extraction and budget suggestions
+ai_response_cache = AIResponseCache()
@@ -48,12 +48,13 @@ async def track_ai_usage(
     model_name: str,
     input_tokens: int,
     output_tokens: int,
-    total_tokens: int
+    total_tokens: int,
+    cache_hit: bool = False
 ):
-    """Track AI API usage and cost"""
+    """Track AI API usage and cost (cache hits are recorded at zero cost)"""
     try:
         # Calculate cost
-        estimated_cost = calculate_cost(
+        estimated_cost = 0.0 if cache_hit else calculate_cost(
             provider.value,
             model_name,
             input_tokens,
@@ -73,6 +74,16 @@ async def track_ai_usage(
             "estimated_cost_usd": estimated_cost,
             "created_at": datetime.now(UTC)
         }
+        if cache_hit:
+            # Served from the response cache: nothing was billed, keep the
+            # original token counts only as tokens_saved
+            usage_record.update({
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "total_tokens": 0,
+                "tokens_saved": total_tokens,
+                "cache_hit": True
+            })
         
         # [FIX] Added await for async database insertion
         await ai_usage_collection.insert_one(usage_record)
@@ -80,7 +91,8 @@ async def track_ai_usage(
         logger.info(
             f"💰 [AI USAGE TRACKED] User: {user_id} | "
             f"Feature: {feature_type.value} | Provider: {provider.value} | "
-            f"Tokens: {total_tokens:,} | Cost: ${estimated_cost:.6f}"
+            f"Tokens: {usage_record['total_tokens']:,} | Cost: ${estimated_cost:.6f}"
+            f"{' | ⚡ cache hit' if cache_hit else ''}"
         )
         
         return usage_record
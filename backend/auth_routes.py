@@ -1,14 +1,20 @@
 import uuid
 from datetime import datetime, timedelta, UTC
 
-from fastapi import APIRouter, HTTPException, status, Depends,  Path
-from fastapi.concurrency import run_in_threadpool
+from fastapi import APIRouter, HTTPException, Request, status, Depends,  Path
+from pymongo import ReturnDocument
 
-from utils import create_access_token, get_current_user, get_password_hash, verify_password
+from utils import (
+    PRINCIPAL_PROJECTION, cache_principal, create_access_token, get_current_user, invalidate_principal
+)
+from password_service import (
+    check_login_allowed, client_ip, get_password_hash_async, record_login_failure, record_login_success, verify_password_async
+)
 from models import (
     Currency, CurrencyUpdate, LanguageUpdate, PasswordChange, ProfileUpdate, SubscriptionType, SubscriptionUpdate, UserCreate, UserLogin, UserResponse, Token, CategoryResponse, TransactionType,
 )
 from database import users_collection
+from vector_store_service import vector_store_manager
 from config import settings
 from database import (
     transactions_collection, chat_sessions_collection, goals_collection, insights_collection, budgets_collection, notifications_collection, notification_preferences_collection
@@ -21,14 +27,15 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 # ==================== AUTHENTICATION ====================
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
     """Register new user"""
+    check_login_allowed(client_ip(request))
+
     # [FIX] Added await
     if await users_collection.find_one({"email": user_data.email}):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    # [FIX] Offload blocking hash to thread pool
-    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     
     user_id = str(uuid.uuid4())
     new_user = {
@@ -40,6 +47,8 @@ async def register(user_data: UserCreate):
         "subscription_expires_at": None,
         "default_currency": "usd",
         "language": "en",
+        # Empty balance ledger; kept current by $inc deltas from here on
+        "balances": {},
         "created_at": datetime.now(UTC)
     }
     
@@ -78,14 +87,14 @@ async def update_language(
             detail="Invalid language. Must be 'en' or 'my'"
         )
     
-    # [FIX] Added await
-    await users_collection.update_one(
+    # One round trip: update and read back the principal, then refresh the cache
+    updated_user = await users_collection.find_one_and_update(
         {"_id": current_user["_id"]},
-        {"$set": {"language": language_data.language}}
+        {"$set": {"language": language_data.language}},
+        projection=PRINCIPAL_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    # [FIX] Added await
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
+    cache_principal(updated_user)
     
     return UserResponse(
         id=updated_user["_id"],
@@ -99,13 +108,18 @@ async def update_language(
 
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin):
+async def login(user_credentials: UserLogin, request: Request):
     """Login user"""
+    # Rejected before any DB or bcrypt work is spent on the attempt
+    ip = client_ip(request)
+    check_login_allowed(ip, user_credentials.email)
+
     # [FIX] Added await
     user = await users_collection.find_one({"email": user_credentials.email})
-    # [FIX] Offload blocking verify to thread pool
-    if not user or not await run_in_threadpool(verify_password, user_credentials.password, user["password"]):
+    if not user or not await verify_password_async(user_credentials.password, user["password"]):
+        record_login_failure(ip, user_credentials.email)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    record_login_success(ip, user_credentials.email)
 
     access_token = create_access_token(
         data={"sub": user["email"]},
@@ -160,14 +174,14 @@ async def update_profile(
             detail="Name must be at least 2 characters"
         )
     
-    # [FIX] Added await
-    await users_collection.update_one(
+    # One round trip: update and read back the principal, then refresh the cache
+    updated_user = await users_collection.find_one_and_update(
         {"_id": current_user["_id"]},
-        {"$set": {"name": profile_data.name.strip()}}
+        {"$set": {"name": profile_data.name.strip()}},
+        projection=PRINCIPAL_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    # [FIX] Added await
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
+    cache_principal(updated_user)
     
     return UserResponse(
         id=updated_user["_id"],
@@ -186,14 +200,14 @@ async def update_default_currency(
     current_user: dict = Depends(get_current_user)
 ):
     """Update user's default currency"""
-    # [FIX] Added await
-    await users_collection.update_one(
+    # One round trip: update and read back the principal, then refresh the cache
+    updated_user = await users_collection.find_one_and_update(
         {"_id": current_user["_id"]},
-        {"$set": {"default_currency": currency_data.default_currency.value}}
+        {"$set": {"default_currency": currency_data.default_currency.value}},
+        projection=PRINCIPAL_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    # [FIX] Added await
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
+    cache_principal(updated_user)
     
     return UserResponse(
         id=updated_user["_id"],
@@ -214,7 +228,9 @@ async def change_password(
     """Change user password"""
     # Verify current password
     # [FIX] Offload verification
-    is_correct = await run_in_threadpool(verify_password, password_data.current_password, current_user["password"])
+    # The cached principal never carries the password hash
+    user = await users_collection.find_one({"_id": current_user["_id"]}, {"password": 1})
+    is_correct = await verify_password_async(password_data.current_password, user["password"])
     
     if not is_correct:
         raise HTTPException(
@@ -236,7 +252,7 @@ async def change_password(
         )
     
     # Update password
-    hashed_password = await run_in_threadpool(get_password_hash, password_data.new_password)
+    hashed_password = await get_password_hash_async(password_data.new_password)
     
     # [FIX] Added await
     await users_collection.update_one(
@@ -265,10 +281,14 @@ async def delete_account(
         await insights_collection.delete_many({"user_id": user_id})
         await notifications_collection.delete_many({"user_id": user_id})
         await notification_preferences_collection.delete_many({"user_id": user_id})
+        # Persisted RAG collection (financial text + embeddings)
+        if vector_store_manager:
+            await vector_store_manager.drop(user_id)
         
         # Finally, delete the user account
         # [FIX] Added await
         result = await users_collection.delete_one({"_id": user_id})
+        invalidate_principal(current_user["email"])
         
         if result.deleted_count == 0:
             raise HTTPException(
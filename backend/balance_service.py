@@ -0,0 +1,222 @@
+from datetime import datetime, UTC
+from typing import Dict, Iterable, Optional
+import logging
+
+from database import users_collection, transactions_collection, goals_collection
+
+logger = logging.getLogger(__name__)
+
+# Balances are stored on the user document as a per-currency ledger:
+#   users.balances.<currency> = {currency, balance, available_balance,
+#                                allocated_to_goals, total_inflow, total_outflow}
+# Writes keep it current with atomic $inc deltas. A ledger only exists once it
+# has been built from a full aggregation, so deltas are never applied to a
+# missing ledger (that would start the totals from zero).
+
+# Amounts are floats, so allow a little rounding noise before calling it drift
+DRIFT_TOLERANCE = 0.005
+
+
+def empty_balance(currency: str) -> dict:
+    return {
+        "currency": currency,
+        "balance": 0,
+        "available_balance": 0,
+        "allocated_to_goals": 0,
+        "total_inflow": 0,
+        "total_outflow": 0
+    }
+
+
+# ==================== DELTAS ====================
+
+def _add(deltas: Dict[str, float], currency: str, field: str, amount: float):
+    key = f"{currency}.{field}"
+    deltas[key] = deltas.get(key, 0) + amount
+
+
+def transaction_delta(transaction: dict, sign: int = 1, deltas: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Balance delta for a transaction document.
+    sign=1 when the transaction is added, sign=-1 when it is removed.
+    Pass `deltas` to accumulate several transactions into one update.
+    """
+    deltas = {} if deltas is None else deltas
+    currency = transaction.get("currency", "usd")
+    amount = transaction["amount"] * sign
+
+    if transaction["type"] == "inflow":
+        _add(deltas, currency, "total_inflow", amount)
+        _add(deltas, currency, "balance", amount)
+        _add(deltas, currency, "available_balance", amount)
+    else:
+        _add(deltas, currency, "total_outflow", amount)
+        _add(deltas, currency, "balance", -amount)
+        _add(deltas, currency, "available_balance", -amount)
+    return deltas
+
+
+def transactions_delta(transactions: Iterable[dict], sign: int = 1) -> Dict[str, float]:
+    """Combined balance delta for many transactions (batch create, imports)"""
+    deltas: Dict[str, float] = {}
+    for transaction in transactions:
+        transaction_delta(transaction, sign, deltas)
+    return deltas
+
+
+def goal_allocation_delta(currency: str, amount: float) -> Dict[str, float]:
+    """Balance delta for moving `amount` into (positive) or out of (negative) goals"""
+    deltas: Dict[str, float] = {}
+    _add(deltas, currency, "allocated_to_goals", amount)
+    _add(deltas, currency, "available_balance", -amount)
+    return deltas
+
+
+async def apply_balance_delta(user_id: str, deltas: Dict[str, float]):
+    """Apply a balance delta to the user's ledger with one atomic $inc"""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+
+    currencies = {key.split(".", 1)[0] for key in deltas}
+    await users_collection.update_one(
+        # Only touch a ledger that has been built; otherwise the first read builds it
+        {"_id": user_id, "balances": {"$exists": True}},
+        {
+            "$inc": {f"balances.{key}": value for key, value in deltas.items()},
+            "$set": {f"balances.{currency}.currency": currency for currency in currencies}
+        }
+    )
+
+
+# ==================== FULL AGGREGATION ====================
+
+async def compute_user_balances(user_id: str, default_currency: str = "usd") -> dict:
+    """Compute per-currency balances from scratch (transactions + goal allocations)"""
+    tx_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {
+            "$group": {
+                "_id": "$currency",
+                "total_inflow": {
+                    "$sum": {"$cond": [{"$eq": ["$type", "inflow"]}, "$amount", 0]}
+                },
+                "total_outflow": {
+                    "$sum": {"$cond": [{"$eq": ["$type", "outflow"]}, "$amount", 0]}
+                }
+            }
+        }
+    ]
+    goals_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": "$currency", "total_allocated": {"$sum": "$current_amount"}}}
+    ]
+
+    tx_results = await transactions_collection.aggregate(tx_pipeline).to_list(length=None)
+    goal_results = await goals_collection.aggregate(goals_pipeline).to_list(length=None)
+
+    tx_map = {res["_id"]: res for res in tx_results if res["_id"]}
+    goal_map = {res["_id"]: res["total_allocated"] or 0 for res in goal_results if res["_id"]}
+    all_currencies = set(tx_map.keys()) | set(goal_map.keys())
+
+    if not all_currencies:
+        all_currencies = {default_currency}
+
+    balances = {}
+    for curr in all_currencies:
+        tx_data = tx_map.get(curr, {})
+        allocated = goal_map.get(curr, 0)
+
+        # Ensure values are floats/ints, not None
+        total_inflow = tx_data.get("total_inflow", 0) or 0
+        total_outflow = tx_data.get("total_outflow", 0) or 0
+
+        balance = total_inflow - total_outflow
+        balances[curr] = {
+            "currency": curr,
+            "balance": balance,
+            "available_balance": balance - allocated,
+            "allocated_to_goals": allocated,
+            "total_inflow": total_inflow,
+            "total_outflow": total_outflow
+        }
+    return balances
+
+
+async def build_user_balances(user_id: str, default_currency: str = "usd") -> dict:
+    """Build the ledger for a user who doesn't have one yet (one-time per user)"""
+    balances = await compute_user_balances(user_id, default_currency)
+    await users_collection.update_one(
+        # Don't clobber a ledger another request built in the meantime
+        {"_id": user_id, "balances": {"$exists": False}},
+        {"$set": {"balances": balances, "balances_verified_at": datetime.now(UTC)}}
+    )
+    return balances
+
+
+# ==================== RECONCILIATION ====================
+
+def _has_drift(stored: dict, expected: dict) -> bool:
+    for currency, expected_entry in expected.items():
+        stored_entry = stored.get(currency, {})
+        for field in ("balance", "available_balance", "allocated_to_goals", "total_inflow", "total_outflow"):
+            if abs((stored_entry.get(field) or 0) - (expected_entry[field] or 0)) > DRIFT_TOLERANCE:
+                return True
+    # Currencies in the ledger that no longer have any data must net to zero
+    for currency, stored_entry in stored.items():
+        if currency not in expected and any(
+            abs(stored_entry.get(field) or 0) > DRIFT_TOLERANCE
+            for field in ("balance", "available_balance", "allocated_to_goals")
+        ):
+            return True
+    return False
+
+
+async def reconcile_user_balances(user_id: str, default_currency: str = "usd", stored: Optional[dict] = None) -> bool:
+    """Verify a user's ledger against a full aggregation. Returns True if it was repaired."""
+    if stored is None:
+        user = await users_collection.find_one({"_id": user_id}, {"balances": 1})
+        stored = (user or {}).get("balances")
+
+    expected = await compute_user_balances(user_id, default_currency)
+
+    if stored is not None and not _has_drift(stored, expected):
+        await users_collection.update_one(
+            {"_id": user_id},
+            {"$set": {"balances_verified_at": datetime.now(UTC)}}
+        )
+        return False
+
+    # Optimistic guard: if a delta landed while we were aggregating, skip this
+    # round instead of overwriting it; the next run will verify again.
+    guard = {"_id": user_id, "balances": stored} if stored is not None else {"_id": user_id, "balances": {"$exists": False}}
+    result = await users_collection.update_one(
+        guard,
+        {"$set": {"balances": expected, "balances_verified_at": datetime.now(UTC)}}
+    )
+    if result.modified_count == 0:
+        return False
+    if stored is not None:
+        logger.warning(f"⚠️ Repaired balance drift for user {user_id}")
+    return True
+
+
+async def reconcile_all_balances():
+    """Nightly job: verify every built ledger against a full aggregation and fix drift"""
+    checked = 0
+    repaired = 0
+
+    cursor = users_collection.find(
+        {"balances": {"$exists": True}},
+        {"_id": 1, "balances": 1, "default_currency": 1}
+    )
+    async for user in cursor:
+        try:
+            if await reconcile_user_balances(user["_id"], user.get("default_currency", "usd"), user.get("balances")):
+                repaired += 1
+            checked += 1
+        except Exception as e:
+            logger.error(f"Error reconciling balances for user {user['_id']}: {e}")
+
+    logger.info(f"✅ Balance reconciliation: checked {checked} users, repaired {repaired}")
+    return {"checked": checked, "repaired": repaired}
@@ -0,0 +1,78 @@
+"""
+Event-loop latency under a login storm, with bcrypt run inline on the loop
+versus on the bounded password hashing pool.
+
+    python benchmark_password_hashing.py [--logins 50] [--concurrency 50]
+
+A ticker task sleeps TICK_SECONDS in a loop and records how late it wakes up;
+that lag is what every other in-flight request would experience.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from password_service import PasswordHasher, get_password_hash, verify_password
+
+TICK_SECONDS = 0.005
+
+
+async def measure_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        samples.append(time.perf_counter() - started - TICK_SECONDS)
+
+
+async def inline_login(password: str, hashed: str):
+    # What an async route calling passlib directly does
+    verify_password(password, hashed)
+
+
+async def run_storm(name: str, login, logins: int, concurrency: int):
+    samples = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(samples, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await login()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0
+    print(
+        f"{name:<8} {logins / elapsed:8.1f} logins/s  "
+        f"loop lag p50 {statistics.median(samples) * 1000 if samples else 0:7.1f} ms  "
+        f"p99 {p99 * 1000:7.1f} ms  max {(samples[-1] if samples else 0) * 1000:7.1f} ms  "
+        f"({len(samples)} ticks)"
+    )
+
+
+async def main(logins: int, concurrency: int, workers: int):
+    password = "correct horse battery staple"
+    hashed = get_password_hash(password)
+    hasher = PasswordHasher(workers=workers, max_pending=logins)
+
+    print("=" * 60)
+    print(f"🔐 {logins} logins, {concurrency} concurrent, {workers} hashing worker(s)")
+    print("=" * 60)
+    await run_storm("inline", lambda: inline_login(password, hashed), logins, concurrency)
+    await run_storm("pool", lambda: hasher.verify(password, hashed), logins, concurrency)
+    print("📊 Pool stats:", hasher.stats())
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.workers))
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, UTC
+from typing import List, Optional
+import logging
+
+from pymongo import ReturnDocument
+
+from database import broadcast_jobs_collection, users_collection
+from notification_service import NotificationBatch
+
+logger = logging.getLogger(__name__)
+
+# Users streamed, prefetched and inserted per chunk
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "1000"))
+# A running job whose heartbeat is older than this is taken over on restart
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+BROADCAST_USER_PROJECTION = {"_id": 1, "language": 1, "fcm_token": 1}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC)
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # Motor returns naive datetimes
+    return dt.replace(tzinfo=UTC) if dt and dt.tzinfo is None else dt
+
+
+def broadcast_user_query(target_users: str) -> dict:
+    if target_users in ("free", "premium"):
+        return {"subscription_type": target_users}
+    return {}
+
+
+# ==================== JOBS ====================
+
+async def create_broadcast_job(title: str, message: str, target_users: str, notification_type: str, admin: dict) -> dict:
+    """Record a queued broadcast; raises ValueError if no users match"""
+    query = broadcast_user_query(target_users)
+    total_users = await users_collection.count_documents(query)
+    if total_users == 0:
+        raise ValueError("No users found matching the criteria")
+
+    now = _utcnow()
+    job = {
+        "_id": str(uuid.uuid4()),
+        "title": title,
+        "message": message,
+        "target_users": target_users,
+        "notification_type": notification_type,
+        "status": "queued",
+        "total_users": total_users,
+        "processed": 0,
+        "notifications_sent": 0,
+        "skipped_by_preference": 0,
+        "push_queued": 0,
+        "without_push_token": 0,
+        "duplicates": 0,
+        "last_user_id": None,
+        "created_by": admin["email"],
+        "created_at": now,
+        "started_at": None,
+        "heartbeat_at": None,
+        "finished_at": None,
+        "error": None
+    }
+    await broadcast_jobs_collection.insert_one(job)
+    return job
+
+
+async def _claim_job(job_id: str) -> Optional[dict]:
+    """Take the job unless a live worker already holds it"""
+    now = _utcnow()
+    return await broadcast_jobs_collection.find_one_and_update(
+        {
+            "_id": job_id,
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=BROADCAST_LEASE_SECONDS)}}
+            ]
+        },
+        # Pipeline update so a resumed job keeps its original started_at
+        [{"$set": {
+            "status": "running",
+            "worker": WORKER_ID,
+            "heartbeat_at": now,
+            "started_at": {"$ifNull": ["$started_at", now]}
+        }}],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _process_chunk(job: dict, users: List[dict]) -> dict:
+    """Write one chunk of notifications; the ids are derived from the job so a retried chunk inserts nothing twice"""
+    batch = NotificationBatch()
+    await batch.load_users(users)
+    for user in users:
+        batch.add(
+            user_id=user["_id"],
+            notification_type=job["notification_type"],
+            title=job["title"],
+            message=job["message"],
+            notification_id=f"broadcast:{job['_id']}:{user['_id']}",
+            push_data={"is_broadcast": "true"}
+        )
+    inserted = await batch.flush()
+    return {
+        "processed": len(users),
+        "notifications_sent": len(inserted),
+        "skipped_by_preference": batch.skipped,
+        "push_queued": batch.pushes_queued,
+        "without_push_token": batch.without_token,
+        "duplicates": batch.duplicates
+    }
+
+
+async def run_broadcast_job(job_id: str) -> bool:
+    """Stream matching users by _id in chunks, checkpointing after each one; False if the job could not be claimed"""
+    job = await _claim_job(job_id)
+    if not job:
+        logger.info(f"ℹ️ Broadcast job {job_id} is finished or running elsewhere")
+        return False
+
+    logger.info(f"📣 Running broadcast job {job_id} on {WORKER_ID}...")
+    query = broadcast_user_query(job["target_users"])
+    last_id = job.get("last_user_id")
+
+    try:
+        while True:
+            page_query = dict(query)
+            if last_id is not None:
+                page_query["_id"] = {"$gt": last_id}
+            users = await users_collection.find(page_query, BROADCAST_USER_PROJECTION) \
+                .sort("_id", 1).limit(BROADCAST_CHUNK_SIZE).to_list(length=BROADCAST_CHUNK_SIZE)
+            if not users:
+                break
+
+            counts = await _process_chunk(job, users)
+            last_id = users[-1]["_id"]
+            await broadcast_jobs_collection.update_one(
+                {"_id": job_id},
+                {"$inc": counts, "$set": {"last_user_id": last_id, "heartbeat_at": _utcnow()}}
+            )
+    except Exception as e:
+        logger.error(f"❌ Broadcast job {job_id} failed: {e}")
+        await broadcast_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": _utcnow()}}
+        )
+        return True
+
+    job = await broadcast_jobs_collection.find_one_and_update(
+        {"_id": job_id},
+        {"$set": {"status": "completed", "finished_at": _utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    logger.info(
+        f"✅ Broadcast job {job_id} completed: {job['notifications_sent']} notification(s), "
+        f"{job['push_queued']} push(es) queued"
+    )
+    return True
+
+
+async def resume_broadcast_job(job_id: str):
+    """
+    Run the job, or take it over once its holder's lease expires. After a
+    restart the previous process's heartbeat is still fresh, so the first
+    claim is refused; wait out the lease and try again.
+    """
+    while not await run_broadcast_job(job_id):
+        job = await broadcast_jobs_collection.find_one({"_id": job_id}, {"status": 1, "heartbeat_at": 1})
+        if not job or job["status"] not in ("queued", "running"):
+            return
+        heartbeat_at = _as_utc(job.get("heartbeat_at")) or _utcnow()
+        expires_at = heartbeat_at + timedelta(seconds=BROADCAST_LEASE_SECONDS)
+        await asyncio.sleep(max((expires_at - _utcnow()).total_seconds(), 0) + 1)
+
+
+async def requeue_failed_broadcast_job(job_id: str) -> bool:
+    """Put a failed job back in the queue; it resumes from its last checkpoint"""
+    result = await broadcast_jobs_collection.update_one(
+        {"_id": job_id, "status": "failed"},
+        {"$set": {"status": "queued", "error": None, "finished_at": None}}
+    )
+    return result.modified_count > 0
+
+
+async def _resume_safely(job_id: str):
+    try:
+        await resume_broadcast_job(job_id)
+    except Exception as e:
+        logger.error(f"❌ Broadcast job {job_id} failed: {e}")
+
+
+async def resume_broadcast_jobs():
+    """Pick up broadcasts queued or interrupted before a restart, all at once"""
+    try:
+        jobs = await broadcast_jobs_collection.find(
+            {"status": {"$in": ["queued", "running"]}},
+            {"_id": 1}
+        ).to_list(length=None)
+    except Exception as e:
+        logger.error(f"❌ Failed to look up unfinished broadcast jobs: {e}")
+        return
+    await asyncio.gather(*[_resume_safely(job["_id"]) for job in jobs])
+
+
+# ==================== PROGRESS ====================
+
+def get_broadcast_job_progress(job: dict) -> dict:
+    total = job.get("total_users", 0)
+    processed = job.get("processed", 0)
+    started_at = _as_utc(job.get("started_at"))
+    finished_at = _as_utc(job.get("finished_at"))
+    elapsed = ((finished_at or _utcnow()) - started_at).total_seconds() if started_at else 0
+    per_second = processed / elapsed if elapsed > 0 else 0
+    # Users created after the job started can push processed past the initial count
+    remaining = max(total - processed, 0)
+
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "title": job["title"],
+        "target_users": job["target_users"],
+        "notification_type": job["notification_type"],
+        "created_by": job.get("created_by"),
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "total_users": total,
+        "processed": processed,
+        "notifications_sent": job.get("notifications_sent", 0),
+        "skipped_by_preference": job.get("skipped_by_preference", 0),
+        "push_queued": job.get("push_queued", 0),
+        "without_push_token": job.get("without_push_token", 0),
+        "duplicates": job.get("duplicates", 0),
+        "percent_complete": 100.0 if job["status"] == "completed" else (round(min(processed / total, 1) * 100, 1) if total else 0.0),
+        "users_per_second": round(per_second, 1),
+        "eta_seconds": round(remaining / per_second) if per_second and remaining and not finished_at else None,
+        "error": job.get("error")
+    }
+
+
+async def list_broadcast_jobs(limit: int = 10) -> List[dict]:
+    jobs = await broadcast_jobs_collection.find({}).sort("created_at", -1).limit(limit).to_list(length=None)
+    return [get_broadcast_job_progress(job) for job in jobs]
@@ -1,4 +1,5 @@
 import asyncio
+import copy
 import json
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
@@ -6,12 +7,16 @@ from collections import defaultdict
 import statistics
 import uuid
 
-from notification_service import check_budget_notifications, notify_budget_auto_created
+from notification_service import NotificationBatch, check_budget_notifications, notification_scope, notify_budget_auto_created
 from database import transactions_collection, budgets_collection, goals_collection, categories_collection
 from budget_models import (
     BudgetPeriod, CategoryBudget, AIBudgetSuggestion, BudgetStatus
 )
 from config import settings
+from ai_governor_service import ai_governor, estimate_tokens
+from ai_response_cache_service import ai_response_cache
+from ai_usage_models import AIFeatureType
+from pymongo import UpdateOne
 from pymongo.errors import DuplicateKeyError
 import logging
 
@@ -343,42 +348,33 @@ REMEMBER:
 - Use sub-category budgets when spending patterns show clear distinctions
 - All amounts must be in {currency.upper()}"""
 
-        response = await client.chat.completions.create(
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        content = await ai_response_cache.complete(
+            provider="openai",
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
+            temperature=0.3,
+            prompt=messages,
+            params={"response_format": "json_object"},
+            call=lambda: ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    temperature=0.3
+                ),
+                lane="interactive",
+                estimated_tokens=estimate_tokens(system_prompt, user_prompt, max_output_tokens=1000)
+            ),
+            user_id=self.user_id,
+            feature_type=AIFeatureType.WEEKLY_INSIGHT
         )
 
-        # NEW: Track AI usage
-        if hasattr(response, 'usage'):
-            from ai_usage_service import track_ai_usage
-            from ai_usage_models import AIFeatureType, AIProviderType
-            
-            input_tokens = response.usage.prompt_tokens
-            output_tokens = response.usage.completion_tokens
-            total_tokens = response.usage.total_tokens
-            
-            logger.info(f"📊 [OPENAI TOKEN USAGE - AI Budget Suggestion] User: {self.user_id}")
-            logger.info(f"   📥 Input tokens: {input_tokens:,}")
-            logger.info(f"   📤 Output tokens: {output_tokens:,}")
-            logger.info(f"   📊 Total tokens: {total_tokens:,}")
-            logger.info(f"   🤖 Model: gpt-4o-mini")
-            
-            await track_ai_usage(
-                user_id=self.user_id,
-                feature_type=AIFeatureType.WEEKLY_INSIGHT,  # We'll create a new type
-                provider=AIProviderType.OPENAI,
-                model_name="gpt-4o-mini",
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens
-            )
-        
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
         
         # Validate that all categories exist in the system
         valid_categories = []
@@ -577,228 +573,457 @@ def is_budget_active(budget: Dict, current_date: datetime) -> bool:
     return is_active
 
 
-async def update_budget_spent_amounts(user_id: str, budget_id: str, budget_doc: Optional[Dict] = None):
+# Outflows grouped by (main, sub) category; shared by every spent computation
+BUDGET_SPENT_GROUP = {
+    "_id": {
+        "main": "$main_category",
+        "sub": "$sub_category"
+    },
+    "total_amount": {"$sum": "$amount"}
+}
+
+
+def budget_spent_match(user_id: str, budget: Dict) -> Dict:
+    """$match for the outflows that count towards a budget"""
+    return {
+        "user_id": user_id,
+        "type": "outflow",
+        "currency": budget.get("currency", "usd"),
+        "date": {
+            "$gte": budget["start_date"],
+            "$lte": budget["end_date"]
+        }
+    }
+
+
+def apply_budget_spent(budget: Dict, agg_results: List[Dict]) -> Dict:
     """
-    Recalculate spent amounts for a budget using MongoDB Aggregation for O(1) memory usage.
-    Uses Optimistic Locking to prevent race conditions.
+    Fill spent amounts, percentages and totals of `budget` (in place) from
+    outflow totals grouped with BUDGET_SPENT_GROUP. Returns the budget.
     """
-    max_retries = 3
-    attempt = 0
+    # Create a lookup set for categories actually in the budget
+    budget_category_keys = set(cat["main_category"] for cat in budget["category_budgets"])
     
-    while attempt < max_retries:
-        try:
-            # 1. Get the budget document and its version (updated_at)
-            if attempt == 0 and budget_doc:
-                budget = budget_doc
-            else:
-                budget = await budgets_collection.find_one({"_id": budget_id, "user_id": user_id})
+    # Temporary storage for calculations
+    category_spent_map = defaultdict(float)
+    total_spent = 0.0
+    
+    for res in agg_results:
+        group_key = res["_id"]
+        amount = res["total_amount"]
+        
+        main_cat = group_key.get("main")
+        sub_cat = group_key.get("sub")
+        
+        # Construct keys matching budget format
+        main_key = main_cat
+        sub_key = f"{main_cat} - {sub_cat}"
+        
+        # Determine if this transaction group matches ANY bucket in the budget
+        is_relevant = False
+        
+        # 1. Match Main Category (e.g., "Food")
+        if main_key in budget_category_keys:
+            category_spent_map[main_key] += amount
+            is_relevant = True
             
-            if not budget:
-                return
-
-            # CAPTURE VERSION for optimistic lock
-            current_version_timestamp = budget.get("updated_at")
+        # 2. Match Specific Sub-Category (e.g., "Food - Groceries")
+        if sub_key in budget_category_keys:
+            category_spent_map[sub_key] += amount
+            is_relevant = True
+        
+        # Only add to total spent if it matched a tracked category
+        if is_relevant:
+            total_spent += amount
 
-            # Store old values for notification checks
-            old_total_percentage = budget.get("percentage_used", 0)
-            old_category_percentages = {
-                cat["main_category"]: cat.get("percentage_used", 0) 
-                for cat in budget["category_budgets"]
-            }
-            
-            budget_currency = budget.get("currency", "usd")
+    # Update category objects in the budget dictionary
+    for cat_budget in budget["category_budgets"]:
+        spent = category_spent_map.get(cat_budget["main_category"], 0.0)
+        allocated = cat_budget["allocated_amount"]
+        
+        cat_budget["spent_amount"] = spent
+        cat_budget["percentage_used"] = (spent / allocated * 100) if allocated > 0 else 0
+        cat_budget["is_exceeded"] = spent > allocated
             
-            # 2. AGGREGATION PIPELINE (The Fix)
-            # Instead of fetching all transactions, we ask Mongo to sum them up by category
-            pipeline = [
-                {
-                    "$match": {
-                        "user_id": user_id,
-                        "type": "outflow",
-                        "currency": budget_currency,
-                        "date": {
-                            "$gte": budget["start_date"],
-                            "$lte": budget["end_date"]
-                        }
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "main": "$main_category",
-                            "sub": "$sub_category"
-                        },
-                        "total_amount": {"$sum": "$amount"}
-                    }
-                }
+    # Update Totals
+    total_budget = calculate_total_budget_excluding_subcategories(budget["category_budgets"])
+    budget["total_budget"] = total_budget
+    budget["total_spent"] = total_spent
+    budget["remaining_budget"] = total_budget - total_spent
+    budget["percentage_used"] = (total_spent / total_budget * 100) if total_budget > 0 else 0
+    return budget
+
+
+async def get_budgets_spent_view(user_id: str, budgets: List[Dict]) -> List[Dict]:
+    """
+    Read-only view: fill current spent amounts into `budgets` with a single
+    aggregation. Each outflow is tagged with the budgets whose window contains
+    it and grouped once by (budget, category), so every transaction is read
+    once however many budgets are passed. Writes nothing; persisted spent
+    amounts are maintained by the transaction-driven update path.
+    """
+    if not budgets:
+        return budgets
+    
+    windows = [
+        {"index": index, "currency": budget.get("currency", "usd"), "start": budget["start_date"], "end": budget["end_date"]}
+        for index, budget in enumerate(budgets)
+    ]
+    # One index range per distinct window, so gaps between budgets are never scanned
+    ranges = {(w["currency"], w["start"], w["end"]) for w in windows}
+    pipeline = [
+        {"$match": {
+            "user_id": user_id,
+            "type": "outflow",
+            "$or": [
+                {"currency": currency, "date": {"$gte": start, "$lte": end}}
+                for currency, start, end in ranges
             ]
+        }},
+        {"$project": {
+            "main_category": 1,
+            "sub_category": 1,
+            "amount": 1,
+            "budget": {"$map": {
+                "input": {"$filter": {
+                    "input": {"$literal": windows},
+                    "as": "w",
+                    "cond": {"$and": [
+                        {"$eq": ["$currency", "$$w.currency"]},
+                        {"$gte": ["$date", "$$w.start"]},
+                        {"$lte": ["$date", "$$w.end"]}
+                    ]}
+                }},
+                "as": "w",
+                "in": "$$w.index"
+            }}
+        }},
+        {"$unwind": "$budget"},
+        {"$group": {
+            "_id": {"budget": "$budget", **BUDGET_SPENT_GROUP["_id"]},
+            "total_amount": BUDGET_SPENT_GROUP["total_amount"]
+        }}
+    ]
+    
+    buckets = defaultdict(list)
+    async for res in transactions_collection.aggregate(pipeline):
+        buckets[res["_id"]["budget"]].append(res)
+    
+    for index, budget in enumerate(budgets):
+        apply_budget_spent(budget, buckets.get(index, []))
+    return budgets
+
+
+async def _after_budget_recomputed(
+    user_id: str,
+    budget: Dict,
+    old_total_percentage: float,
+    old_category_percentages: Dict[str, float],
+    status_enum: BudgetStatus,
+    batch: Optional[NotificationBatch] = None
+):
+    """Threshold notifications and auto-create for one successfully written budget"""
+    budget_id = budget["_id"]
+    currency = budget.get("currency", "usd")
+    
+    async with notification_scope(batch) as notifications:
+        for cat_budget in budget["category_budgets"]:
+            cat_name = cat_budget["main_category"]
+            new_pct = cat_budget["percentage_used"]
+            old_pct = old_category_percentages.get(cat_name, 0)
             
-            # Execute aggregation
-            cursor = transactions_collection.aggregate(pipeline)
-            agg_results = await cursor.to_list(length=None)
-            
-            # 3. Process Results in Memory
-            # Create a lookup set for categories actually in the budget
-            budget_category_keys = set(cat["main_category"] for cat in budget["category_budgets"])
-            
-            # Temporary storage for calculations
-            category_spent_map = defaultdict(float)
-            total_spent_accum = 0.0
-            
-            for res in agg_results:
-                group_key = res["_id"]
-                amount = res["total_amount"]
-                
-                main_cat = group_key.get("main")
-                sub_cat = group_key.get("sub")
-                
-                # Construct keys matching budget format
-                main_key = main_cat
-                sub_key = f"{main_cat} - {sub_cat}"
-                
-                # Determine if this transaction group matches ANY bucket in the budget
-                is_relevant = False
-                
-                # 1. Match Main Category (e.g., "Food")
-                if main_key in budget_category_keys:
-                    category_spent_map[main_key] += amount
-                    is_relevant = True
-                    
-                # 2. Match Specific Sub-Category (e.g., "Food - Groceries")
-                if sub_key in budget_category_keys:
-                    category_spent_map[sub_key] += amount
-                    is_relevant = True
-                
-                # Only add to total spent if it matched a tracked category
-                if is_relevant:
-                    total_spent_accum += amount
+            if new_pct != old_pct:
+                await check_budget_notifications(
+                    user_id=user_id,
+                    budget_id=budget_id,
+                    old_percentage=old_pct,
+                    new_percentage=new_pct,
+                    budget_name=budget["name"],
+                    category_name=cat_name,
+                    batch=notifications,
+                    currency=currency
+                )
 
-            # Update category objects in the budget dictionary
-            for cat_budget in budget["category_budgets"]:
-                budget_category = cat_budget["main_category"]
-                
-                spent = category_spent_map.get(budget_category, 0.0)
-                allocated = cat_budget["allocated_amount"]
-                
-                # Calculate percentage
-                new_cat_percentage = (spent / allocated * 100) if allocated > 0 else 0
-                
-                cat_budget["spent_amount"] = spent
-                cat_budget["percentage_used"] = new_cat_percentage
-                cat_budget["is_exceeded"] = spent > allocated
-                    
-            # Update Totals
-            total_budget = calculate_total_budget_excluding_subcategories(budget["category_budgets"])
-            remaining = total_budget - total_spent_accum
-            new_total_percentage = (total_spent_accum / total_budget * 100) if total_budget > 0 else 0
+        # Check total budget notifications
+        if budget["percentage_used"] != old_total_percentage:
+            await check_budget_notifications(
+                user_id=user_id,
+                budget_id=budget_id,
+                old_percentage=old_total_percentage,
+                new_percentage=budget["percentage_used"],
+                budget_name=budget["name"],
+                category_name=None,
+                batch=notifications,
+                currency=currency
+            )
+    
+    # Check Auto-Create Logic
+    if status_enum == BudgetStatus.COMPLETED and budget.get("auto_create_enabled"):
+        updated_budget = await budgets_collection.find_one({"_id": budget_id})
+        try:
+            asyncio.get_running_loop().create_task(auto_create_next_budget(updated_budget))
+        except Exception as e:
+            print(f"Error triggering auto-create: {e}")
+
+
+async def recompute_budgets(user_id: str, budgets: List[Dict], max_retries: int = 3):
+    """
+    Recalculate spent amounts for several budgets of one user in a single pass:
+    one grouped aggregation over their windows, then one bulk_write
+    of optimistic-locked updates (filtered on each budget's `updated_at`).
+    Budgets that lost a race are re-fetched and retried together.
+    Notifications still fire per budget.
+    """
+    attempt = 0
+    
+    while budgets and attempt < max_retries:
+        try:
+            # CAPTURE VERSION and old values before the view overwrites them
+            previous = {
+                budget["_id"]: (
+                    budget.get("updated_at"),
+                    budget.get("percentage_used", 0),
+                    {cat["main_category"]: cat.get("percentage_used", 0) for cat in budget["category_budgets"]}
+                )
+                for budget in budgets
+            }
             
-            # Recalculate status
-            status_enum = calculate_budget_status(budget, datetime.now(timezone.utc))
-            is_active = is_budget_active(budget, datetime.now(timezone.utc))
+            await get_budgets_spent_view(user_id, budgets)
             
-            # 4. Attempt Atomic Update with Optimistic Lock
-            #
-            result = await budgets_collection.update_one(
-                {
-                    "_id": budget_id,
-                    "updated_at": current_version_timestamp
-                },
-                {
-                    "$set": {
+            now = datetime.now(timezone.utc)
+            statuses = {}
+            operations = []
+            for budget in budgets:
+                statuses[budget["_id"]] = calculate_budget_status(budget, now)
+                operations.append(UpdateOne(
+                    {"_id": budget["_id"], "updated_at": previous[budget["_id"]][0]},
+                    {"$set": {
                         "category_budgets": budget["category_budgets"],
-                        "total_budget": total_budget,
-                        "total_spent": total_spent_accum,
-                        "remaining_budget": remaining,
-                        "percentage_used": new_total_percentage,
-                        "status": status_enum.value,
-                        "is_active": is_active,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
+                        "total_budget": budget["total_budget"],
+                        "total_spent": budget["total_spent"],
+                        "remaining_budget": budget["remaining_budget"],
+                        "percentage_used": budget["percentage_used"],
+                        "status": statuses[budget["_id"]].value,
+                        "is_active": is_budget_active(budget, now),
+                        "updated_at": now
+                    }}
+                ))
             
-            if result.modified_count == 1:
-                # === SUCCESS ===
-                
-                # Check notifications (Async - fire and forget if needed, but here we await)
-                for cat_budget in budget["category_budgets"]:
-                    cat_name = cat_budget["main_category"]
-                    new_pct = cat_budget["percentage_used"]
-                    old_pct = old_category_percentages.get(cat_name, 0)
-                    
-                    if new_pct != old_pct:
-                        await check_budget_notifications(
-                            user_id=user_id,
-                            budget_id=budget_id,
-                            old_percentage=old_pct,
-                            new_percentage=new_pct,
-                            budget_name=budget["name"],
-                            category_name=cat_name
-                        )
-
-                # Check total budget notifications
-                if new_total_percentage != old_total_percentage:
-                    await check_budget_notifications(
-                        user_id=user_id,
-                        budget_id=budget_id,
-                        old_percentage=old_total_percentage,
-                        new_percentage=new_total_percentage,
-                        budget_name=budget["name"],
-                        category_name=None
-                    )
-                
-                # Check Auto-Create Logic
-                if status_enum == BudgetStatus.COMPLETED and budget.get("auto_create_enabled"):
-                    updated_budget = await budgets_collection.find_one({"_id": budget_id})
-                    try:
-                        loop = asyncio.get_event_loop()
-                        if loop.is_running():
-                            loop.create_task(auto_create_next_budget(updated_budget))
-                        else:
-                            asyncio.run(auto_create_next_budget(updated_budget))
-                    except Exception as e:
-                        print(f"Error triggering auto-create: {e}")
-                
-                return # Exit successfully
+            result = await budgets_collection.bulk_write(operations, ordered=False)
             
+            if result.modified_count == len(budgets):
+                written = budgets
+                lost = []
             else:
-                # === FAILURE (Race Condition) ===
-                attempt += 1
-                if attempt < max_retries:
-                    budget_doc = None # Force re-fetch
-                    await asyncio.sleep(0.05 * attempt)
-                    continue
-                    
+                # Anything not carrying our timestamp was changed by someone else first
+                ids = [budget["_id"] for budget in budgets]
+                written_ids = set(await budgets_collection.distinct("_id", {"_id": {"$in": ids}, "updated_at": now}))
+                written = [budget for budget in budgets if budget["_id"] in written_ids]
+                lost = [budget_id for budget_id in ids if budget_id not in written_ids]
+            
+            # === SUCCESS ===
+            async with NotificationBatch() as notifications:
+                for budget in written:
+                    _, old_total_percentage, old_category_percentages = previous[budget["_id"]]
+                    await _after_budget_recomputed(
+                        user_id, budget, old_total_percentage, old_category_percentages, statuses[budget["_id"]],
+                        batch=notifications
+                    )
+            
+            if not lost:
+                return
+            
+            # === FAILURE (Race Condition) ===
+            attempt += 1
+            if attempt < max_retries:
+                await asyncio.sleep(0.05 * attempt)
+                cursor = budgets_collection.find({"_id": {"$in": lost}, "user_id": user_id})
+                budgets = await cursor.to_list(length=None)
+                
         except Exception as e:
-            print(f"Error in update_budget_spent_amounts (attempt {attempt}): {str(e)}")
+            print(f"Error in recompute_budgets (attempt {attempt}): {str(e)}")
             import traceback
             traceback.print_exc()
             attempt += 1
             await asyncio.sleep(0.1)
+            # Re-fetch so the retry starts from stored versions, not half-applied dicts
+            cursor = budgets_collection.find({"_id": {"$in": [b["_id"] for b in budgets]}, "user_id": user_id})
+            budgets = await cursor.to_list(length=None)
+
+    if budgets and attempt >= max_retries:
+        print(f"❌ Failed to update budgets {[b['_id'] for b in budgets]} after {max_retries} attempts.")
 
-    print(f"❌ Failed to update budget {budget_id} after {max_retries} attempts.")
+
+async def update_budget_spent_amounts(user_id: str, budget_id: str, budget_doc: Optional[Dict] = None):
+    """Recalculate spent amounts for one budget (see recompute_budgets)"""
+    budget = budget_doc or await budgets_collection.find_one({"_id": budget_id, "user_id": user_id})
+    if budget:
+        await recompute_budgets(user_id, [budget])
                 
                 
                 
-async def update_relevant_budgets(user_id: str, transaction_date: datetime, transaction_currency: str):
-    """Update only budgets that are affected by the transaction"""
+# ==================== INCREMENTAL SPENT COUNTERS ====================
+# Single transaction writes adjust the affected budgets with a delta instead of
+# re-aggregating their whole window. Each delta is written under the same
+# `updated_at` optimistic lock as recompute_budgets, so the two serialize: a
+# budget whose version moved since it was read (a recompute whose aggregation
+# may already include the transaction, or another delta) is recomputed from
+# scratch instead of double counting. Bulk flows (batch create, imports) go
+# through RecomputeQueue, and verify_all_budget_spent corrects drift nightly.
+
+# Amounts are floats, so allow a little rounding noise before calling it drift
+BUDGET_DRIFT_TOLERANCE = 0.005
+
+
+def _budget_delta_pipeline(category_keys: List[str], amount: float, now: datetime) -> List[Dict]:
+    """Update pipeline: add `amount` to matching categories and the total, then refresh derived fields"""
+    return [
+        {"$set": {
+            "category_budgets": {"$map": {
+                "input": "$category_budgets",
+                "as": "cat",
+                "in": {"$cond": [
+                    {"$in": ["$$cat.main_category", category_keys]},
+                    {"$mergeObjects": ["$$cat", {"spent_amount": {"$add": [{"$ifNull": ["$$cat.spent_amount", 0]}, amount]}}]},
+                    "$$cat"
+                ]}
+            }},
+            "total_spent": {"$add": [{"$ifNull": ["$total_spent", 0]}, amount]},
+            "updated_at": now
+        }},
+        {"$set": {
+            "category_budgets": {"$map": {
+                "input": "$category_budgets",
+                "as": "cat",
+                "in": {"$mergeObjects": ["$$cat", {
+                    "percentage_used": {"$cond": [
+                        {"$gt": ["$$cat.allocated_amount", 0]},
+                        {"$multiply": [{"$divide": ["$$cat.spent_amount", "$$cat.allocated_amount"]}, 100]},
+                        0
+                    ]},
+                    "is_exceeded": {"$gt": ["$$cat.spent_amount", "$$cat.allocated_amount"]}
+                }]}
+            }},
+            "remaining_budget": {"$subtract": ["$total_budget", "$total_spent"]},
+            "percentage_used": {"$cond": [
+                {"$gt": ["$total_budget", 0]},
+                {"$multiply": [{"$divide": ["$total_spent", "$total_budget"]}, 100]},
+                0
+            ]}
+        }}
+    ]
+
+
+async def apply_budget_transaction_delta(user_id: str, transaction: Dict, sign: int = 1):
+    """
+    Adjust spent counters of every budget the transaction falls into.
+    sign=1 when the transaction is added, sign=-1 when it is removed; an edit
+    is a removal of the old version followed by an addition of the new one.
+    """
+    if transaction.get("type") != "outflow":
+        return
+    
+    amount = transaction["amount"] * sign
+    transaction_date = transaction["date"]
     if transaction_date.tzinfo is None:
         transaction_date = transaction_date.replace(tzinfo=timezone.utc)
     
+    # Same matching rules as apply_budget_spent: main category or "Main - Sub"
+    main_cat = transaction["main_category"]
+    category_keys = [main_cat, f"{main_cat} - {transaction['sub_category']}"]
+    
     query = {
         "user_id": user_id,
-        "currency": transaction_currency,
+        "currency": transaction.get("currency", "usd"),
         "start_date": {"$lte": transaction_date},
-        "end_date": {"$gte": transaction_date}
+        "end_date": {"$gte": transaction_date},
+        "category_budgets.main_category": {"$in": category_keys}
     }
+    versions = await budgets_collection.find(query, {"updated_at": 1}).to_list(length=None)
+    if not versions:
+        return
     
-    # [FIX] Async find
-    cursor = budgets_collection.find(query)
-    relevant_budgets = await cursor.to_list(length=None)
+    now = datetime.now(timezone.utc)
+    pipeline = _budget_delta_pipeline(category_keys, amount, now)
+    await budgets_collection.bulk_write(
+        [UpdateOne({"_id": b["_id"], "updated_at": b.get("updated_at")}, pipeline) for b in versions],
+        ordered=False
+    )
     
-    for budget in relevant_budgets:
-        # [FIX] Added await
-        await update_budget_spent_amounts(user_id, budget["_id"], budget_doc=budget)
+    ids = [b["_id"] for b in versions]
+    written = await budgets_collection.find({"_id": {"$in": ids}, "updated_at": now}).to_list(length=None)
+    written_ids = {budget["_id"] for budget in written}
+    
+    # Notifications need the before/after percentages; "before" is the new value minus the delta
+    for budget in written:
+        old_category_percentages = {}
+        for cat in budget["category_budgets"]:
+            old_spent = cat["spent_amount"] - amount if cat["main_category"] in category_keys else cat["spent_amount"]
+            allocated = cat["allocated_amount"]
+            old_category_percentages[cat["main_category"]] = (old_spent / allocated * 100) if allocated > 0 else 0
+        
+        total_budget = budget["total_budget"]
+        old_total_percentage = ((budget["total_spent"] - amount) / total_budget * 100) if total_budget > 0 else 0
+        
+        status_enum = calculate_budget_status(budget, now)
+        if status_enum.value != budget.get("status"):
+            await budgets_collection.update_one(
+                {"_id": budget["_id"]},
+                {"$set": {"status": status_enum.value, "is_active": is_budget_active(budget, now)}}
+            )
+        
+        await _after_budget_recomputed(user_id, budget, old_total_percentage, old_category_percentages, status_enum)
+    
+    lost = [budget_id for budget_id in ids if budget_id not in written_ids]
+    if lost:
+        # Another writer got there first; recompute those budgets from the transactions instead
+        cursor = budgets_collection.find({"_id": {"$in": lost}, "user_id": user_id})
+        await recompute_budgets(user_id, await cursor.to_list(length=None))
+
+
+async def apply_budget_transaction_edit(user_id: str, old_transaction: Dict, new_transaction: Dict):
+    """Move an edited transaction's amount out of its old budgets and into its new ones"""
+    await apply_budget_transaction_delta(user_id, old_transaction, -1)
+    await apply_budget_transaction_delta(user_id, new_transaction, 1)
+
+
+def _budget_has_drift(stored: Dict, expected: Dict) -> bool:
+    if abs((stored.get("total_spent") or 0) - expected["total_spent"]) > BUDGET_DRIFT_TOLERANCE:
+        return True
+    expected_spent = {cat["main_category"]: cat["spent_amount"] for cat in expected["category_budgets"]}
+    return any(
+        abs((cat.get("spent_amount") or 0) - expected_spent.get(cat["main_category"], 0)) > BUDGET_DRIFT_TOLERANCE
+        for cat in stored["category_budgets"]
+    )
+
+
+async def verify_all_budget_spent():
+    """Nightly job: compare active budgets' counters with a full aggregation and repair drift"""
+    checked = 0
+    repaired = 0
+    
+    users = budgets_collection.aggregate([
+        {"$match": {"is_active": True}},
+        {"$group": {"_id": "$user_id"}}
+    ])
+    async for user in users:
+        user_id = user["_id"]
+        try:
+            cursor = budgets_collection.find({"user_id": user_id, "is_active": True})
+            budgets = await cursor.to_list(length=None)
+            expected = await get_budgets_spent_view(user_id, copy.deepcopy(budgets))
+            
+            drifted = [stored for stored, exp in zip(budgets, expected) if _budget_has_drift(stored, exp)]
+            checked += len(budgets)
+            if drifted:
+                logger.warning(f"⚠️ Repairing spent drift in {len(drifted)} budget(s) for user {user_id}")
+                await recompute_budgets(user_id, drifted)
+                repaired += len(drifted)
+        except Exception as e:
+            logger.error(f"Error verifying budgets for user {user_id}: {e}")
+    
+    logger.info(f"✅ Budget spent verification: checked {checked} budgets, repaired {repaired}")
+    return {"checked": checked, "repaired": repaired}
 
 
 def calculate_total_budget_excluding_subcategories(category_budgets: List[Dict]) -> float:
@@ -1035,14 +1260,19 @@ Provide realistic budget suggestions that learn from past spending patterns.
 
 REMEMBER: Only use categories/sub-categories from the AVAILABLE CATEGORIES list provided."""
 
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3
+            response = await ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format={"type": "json_object"},
+                    temperature=0.3
+                ),
+                lane="batch",
+                estimated_tokens=estimate_tokens(system_prompt, user_prompt, max_output_tokens=1000)
             )
             
             # NEW: Track AI usage for auto-create
@@ -1144,12 +1374,33 @@ def _generate_adjusted_budgets(parent_budget: Dict, days_in_period: int) -> List
     return adjusted_budgets
 
 
+async def recompute_user_budgets(
+    user_id: str,
+    currency: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Recompute a user's budgets, optionally only those in one currency and only
+    those whose window overlaps start_date..end_date (the changed dates)
+    """
+    query = {"user_id": user_id}
+    if currency:
+        query["currency"] = currency
+    if start_date and end_date:
+        query["start_date"] = {"$lte": end_date}
+        query["end_date"] = {"$gte": start_date}
+    
+    cursor = budgets_collection.find(query)
+    budgets = await cursor.to_list(length=None)
+    
+    await recompute_budgets(user_id, budgets)
+
+
 async def update_all_user_budgets(user_id: str):
     """Update all budgets for a user (called after transaction changes)"""
     # [FIX] Async find
     cursor = budgets_collection.find({"user_id": user_id})
     budgets = await cursor.to_list(length=None)
     
-    for budget in budgets:
-        # [FIX] Added await
-        await update_budget_spent_amounts(user_id, budget["_id"], budget_doc=budget)
\ No newline at end of file
+    await recompute_budgets(user_id, budgets)
\ No newline at end of file
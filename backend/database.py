@@ -1,5 +1,4 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
 from config import settings
 import uuid
 from datetime import datetime, UTC
@@ -23,6 +22,11 @@ notifications_collection = database.notifications
 notification_preferences_collection = database.notification_preferences
 ai_usage_collection = database.ai_usage
 feedback_collection = database.feedback
+recompute_jobs_collection = database.recompute_jobs
+insight_jobs_collection = database.insight_jobs
+broadcast_jobs_collection = database.broadcast_jobs
+insight_job_items_collection = database.insight_job_items
+ai_response_cache_collection = database.ai_response_cache
 
 # Admin collections
 admins_collection = database.admins
@@ -173,18 +177,12 @@ async def initialize_categories():
 
 
 async def create_db_indexes():
-    """Create indexes - Must be async now"""
+    """Reconcile the index catalog (db_indexes.py) against the live database"""
     try:
-        # [FIX] Added await
-        await budgets_collection.create_index(
-            [("user_id", ASCENDING), ("parent_budget_id", ASCENDING), ("start_date", ASCENDING)],
-            unique=True,
-            background=True,
-            partialFilterExpression={
-                "parent_budget_id": {"$type": "string"} 
-            }
-        )
-        print("✅ Database indexes verified/created")
+        from db_indexes import reconcile_indexes, print_index_report
+
+        report = await reconcile_indexes()
+        print_index_report(report)
     except Exception as e:
         print(f"⚠️ Failed to create indexes: {e}")
 
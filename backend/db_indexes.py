@@ -0,0 +1,359 @@
+"""
+Index catalog for every collection the routes and services query.
+
+The catalog is the single source of truth for MongoDB indexes. At startup
+`reconcile_indexes()` creates anything missing and reports indexes that are
+either not in the catalog or have never been used. Run this module directly
+to print the explain() plan for each canonical query:
+
+    python db_indexes.py            # reconcile + explain
+    python db_indexes.py --explain  # explain only
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, UTC
+
+from pymongo import ASCENDING, DESCENDING
+
+from database import database
+
+
+# ==================== CATALOG ====================
+# Each entry: collection name, key pattern, and optional create_index options.
+# Index names are left to MongoDB so existing indexes are matched by key.
+
+INDEX_CATALOG = [
+    # --- users ---
+    {"collection": "users", "keys": [("email", ASCENDING)], "options": {"unique": True}},
+    {"collection": "users", "keys": [("subscription_type", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "users", "keys": [("created_at", DESCENDING)]},
+    # pruning unregistered FCM tokens
+    {"collection": "users", "keys": [("fcm_token", ASCENDING)], "options": {"sparse": True}},
+
+    # --- transactions ---
+    # get_transactions keyset pages + RAG "recent transactions" (sort date, created_at, _id desc)
+    {"collection": "transactions", "keys": [("user_id", ASCENDING), ("date", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]},
+    # budget spent, insights, reports and spending analysis
+    {"collection": "transactions", "keys": [("user_id", ASCENDING), ("type", ASCENDING), ("currency", ASCENDING), ("date", DESCENDING)]},
+    # unusual spending detection across all users (outflows in a date window)
+    {"collection": "transactions", "keys": [("type", ASCENDING), ("date", DESCENDING)]},
+    # admin "last transaction" lookups
+    {"collection": "transactions", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    # admin activity stats
+    {"collection": "transactions", "keys": [("created_at", DESCENDING)]},
+    # statement import dedupe (only imported rows carry import_hash)
+    {
+        "collection": "transactions",
+        "keys": [("user_id", ASCENDING), ("import_hash", ASCENDING)],
+        "options": {"unique": True, "partialFilterExpression": {"import_hash": {"$exists": True}}},
+    },
+    # recurring transaction job only ever scans enabled parents
+    {
+        "collection": "transactions",
+        "keys": [("recurrence.enabled", ASCENDING)],
+        "options": {"partialFilterExpression": {"recurrence.enabled": True}},
+    },
+
+    # --- budgets ---
+    {
+        "collection": "budgets",
+        "keys": [("user_id", ASCENDING), ("parent_budget_id", ASCENDING), ("start_date", ASCENDING)],
+        "options": {"unique": True, "partialFilterExpression": {"parent_budget_id": {"$type": "string"}}},
+    },
+    {"collection": "budgets", "keys": [("user_id", ASCENDING), ("currency", ASCENDING), ("start_date", ASCENDING), ("end_date", ASCENDING)]},
+    {"collection": "budgets", "keys": [("user_id", ASCENDING), ("is_active", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "budgets", "keys": [("status", ASCENDING), ("end_date", ASCENDING)]},
+    {"collection": "budgets", "keys": [("status", ASCENDING), ("start_date", ASCENDING)]},
+
+    # --- goals ---
+    {"collection": "goals", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "goals", "keys": [("status", ASCENDING), ("target_date", ASCENDING)]},
+
+    # --- notifications ---
+    {"collection": "notifications", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "notifications", "keys": [("user_id", ASCENDING), ("is_read", ASCENDING)]},
+    # duplicate-notification checks (user, goal/budget id, type, recent)
+    {"collection": "notifications", "keys": [("user_id", ASCENDING), ("type", ASCENDING), ("goal_id", ASCENDING), ("created_at", DESCENDING)]},
+
+    # --- notification preferences ---
+    {"collection": "notification_preferences", "keys": [("user_id", ASCENDING)], "options": {"unique": True}},
+
+    # --- insights ---
+    {"collection": "insights", "keys": [("user_id", ASCENDING), ("ai_provider", ASCENDING), ("insight_type", ASCENDING), ("generated_at", DESCENDING)]},
+
+    # --- insight jobs ---
+    {"collection": "insight_jobs", "keys": [("status", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "broadcast_jobs", "keys": [("status", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "insight_job_items", "keys": [("job_id", ASCENDING), ("status", ASCENDING), ("next_attempt_at", ASCENDING)]},
+    {"collection": "insight_job_items", "keys": [("claim_token", ASCENDING)], "options": {"sparse": True}},
+
+    # --- chat sessions ---
+    {"collection": "chat_sessions", "keys": [("user_id", ASCENDING), ("updated_at", DESCENDING)]},
+    {"collection": "chat_sessions", "keys": [("updated_at", DESCENDING)]},
+
+    # --- ai usage ---
+    {"collection": "ai_usage", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    {"collection": "ai_usage", "keys": [("created_at", DESCENDING)]},
+
+    # --- ai response cache ---
+    {"collection": "ai_response_cache", "keys": [("expires_at", ASCENDING)], "options": {"expireAfterSeconds": 0}},
+    # LRU trim
+    {"collection": "ai_response_cache", "keys": [("last_hit_at", ASCENDING)]},
+
+    # --- feedback ---
+    {"collection": "feedback", "keys": [("created_at", DESCENDING)]},
+
+    # --- admin ---
+    {"collection": "admins", "keys": [("email", ASCENDING)], "options": {"unique": True}},
+    {"collection": "admin_action_logs", "keys": [("timestamp", DESCENDING)]},
+]
+
+
+# ==================== CANONICAL QUERIES ====================
+# The hot queries from routes/services. Used only by explain_canonical_queries().
+
+def _canonical_queries() -> list:
+    now = datetime.now(UTC)
+    sample_user = "__explain_user__"
+    week_ago = now - timedelta(days=7)
+
+    return [
+        {
+            "name": "transactions: list by user (get_transactions)",
+            "collection": "transactions",
+            "filter": {"user_id": sample_user},
+            "sort": [("date", -1), ("created_at", -1), ("_id", -1)],
+        },
+        {
+            "name": "transactions: list by user + date range",
+            "collection": "transactions",
+            "filter": {"user_id": sample_user, "date": {"$gte": week_ago, "$lte": now}},
+            "sort": [("date", -1), ("created_at", -1), ("_id", -1)],
+        },
+        {
+            "name": "transactions: by user/type/currency/date (budgets, insights)",
+            "collection": "transactions",
+            "filter": {"user_id": sample_user, "type": "outflow", "currency": "usd", "date": {"$gte": week_ago, "$lte": now}},
+        },
+        {
+            "name": "transactions: all outflows in a window (unusual spending)",
+            "collection": "transactions",
+            "filter": {"type": "outflow", "date": {"$gte": now - timedelta(days=35)}},
+        },
+        {
+            "name": "transactions: enabled recurrences (scheduler)",
+            "collection": "transactions",
+            "filter": {"recurrence.enabled": True},
+        },
+        {
+            "name": "users: by email (auth)",
+            "collection": "users",
+            "filter": {"email": "explain@example.com"},
+        },
+        {
+            "name": "budgets: relevant to a transaction",
+            "collection": "budgets",
+            "filter": {"user_id": sample_user, "currency": "usd", "start_date": {"$lte": now}, "end_date": {"$gte": now}},
+        },
+        {
+            "name": "budgets: active for user (chatbot)",
+            "collection": "budgets",
+            "filter": {"user_id": sample_user, "is_active": True, "status": "active"},
+            "sort": [("created_at", -1)],
+        },
+        {
+            "name": "goals: by user",
+            "collection": "goals",
+            "filter": {"user_id": sample_user},
+            "sort": [("created_at", -1)],
+        },
+        {
+            "name": "notifications: list by user",
+            "collection": "notifications",
+            "filter": {"user_id": sample_user},
+            "sort": [("created_at", -1)],
+        },
+        {
+            "name": "notifications: duplicate check",
+            "collection": "notifications",
+            "filter": {"user_id": sample_user, "type": "budget_ending_soon", "goal_id": "x", "created_at": {"$gte": week_ago}},
+        },
+        {
+            "name": "insights: latest by user/provider/type",
+            "collection": "insights",
+            "filter": {"user_id": sample_user, "ai_provider": "openai", "insight_type": "weekly"},
+            "sort": [("generated_at", -1)],
+        },
+        {
+            "name": "chat_sessions: latest by user",
+            "collection": "chat_sessions",
+            "filter": {"user_id": sample_user},
+            "sort": [("updated_at", -1)],
+        },
+        {
+            "name": "notification_preferences: by user",
+            "collection": "notification_preferences",
+            "filter": {"user_id": sample_user},
+        },
+    ]
+
+
+# ==================== RECONCILIATION ====================
+
+def _key_signature(keys) -> tuple:
+    """Normalize a key pattern (list of tuples or SON) to a comparable tuple"""
+    items = keys.items() if hasattr(keys, "items") else keys
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in items)
+
+
+async def _unused_index_names(collection_name: str) -> set:
+    """Return names of indexes with zero recorded accesses since server start"""
+    try:
+        cursor = database[collection_name].aggregate([{"$indexStats": {}}])
+        stats = await cursor.to_list(length=None)
+    except Exception:
+        # $indexStats requires privileges some hosted tiers don't grant
+        return set()
+
+    return {
+        s["name"] for s in stats
+        if s["name"] != "_id_" and s.get("accesses", {}).get("ops", 0) == 0
+    }
+
+
+async def reconcile_indexes(create_missing: bool = True) -> dict:
+    """
+    Compare INDEX_CATALOG against the live database.
+
+    Creates missing indexes (unless create_missing=False) and returns a report:
+    {"created": [...], "missing": [...], "failed": [...], "unknown": [...], "unused": [...]}
+    Indexes that exist but are not in the catalog are reported, never dropped.
+    """
+    report = {"created": [], "missing": [], "failed": [], "unknown": [], "unused": []}
+
+    catalog_by_collection = {}
+    for spec in INDEX_CATALOG:
+        catalog_by_collection.setdefault(spec["collection"], []).append(spec)
+
+    for collection_name, specs in catalog_by_collection.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        existing_by_keys = {_key_signature(info["key"]): name for name, info in existing.items()}
+        wanted_keys = set()
+
+        for spec in specs:
+            signature = _key_signature(spec["keys"])
+            wanted_keys.add(signature)
+            label = f"{collection_name}{list(signature)}"
+
+            if signature in existing_by_keys:
+                continue
+
+            if not create_missing:
+                report["missing"].append(label)
+                continue
+
+            try:
+                await collection.create_index(spec["keys"], **spec.get("options", {}))
+                report["created"].append(label)
+            except Exception as e:
+                report["failed"].append(f"{label}: {e}")
+
+        for signature, name in existing_by_keys.items():
+            if name != "_id_" and signature not in wanted_keys:
+                report["unknown"].append(f"{collection_name}.{name}")
+
+        for name in await _unused_index_names(collection_name):
+            report["unused"].append(f"{collection_name}.{name}")
+
+    return report
+
+
+def print_index_report(report: dict):
+    """Print a reconciliation report in the startup log style"""
+    if report["created"]:
+        print(f"✅ Created {len(report['created'])} indexes:")
+        for label in report["created"]:
+            print(f"   + {label}")
+    for label in report["missing"]:
+        print(f"⚠️ Missing index: {label}")
+    for label in report["failed"]:
+        print(f"❌ Failed to create index: {label}")
+    for label in report["unknown"]:
+        print(f"ℹ️ Index not in catalog: {label}")
+    if report["unused"]:
+        print(f"ℹ️ {len(report['unused'])} indexes have no recorded use since server start: {', '.join(report['unused'])}")
+    if not any(report[k] for k in ("created", "missing", "failed")):
+        print("✅ Database indexes verified")
+
+
+# ==================== EXPLAIN ====================
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten the stage names of a (possibly nested) query plan"""
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    # Slot-based engine nests the classic plan under queryPlan
+    if "queryPlan" in plan:
+        stages += _plan_stages(plan["queryPlan"])
+    return stages
+
+
+async def explain_canonical_queries() -> list:
+    """Run explain() for each canonical query and return (name, stages, index, ok) rows"""
+    rows = []
+    for query in _canonical_queries():
+        cursor = database[query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+
+        explanation = await cursor.explain()
+        winning = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning)
+
+        index_name = None
+        node = winning.get("queryPlan", winning)
+        while isinstance(node, dict):
+            if "indexName" in node:
+                index_name = node["indexName"]
+                break
+            node = node.get("inputStage")
+
+        rows.append({
+            "name": query["name"],
+            "stages": stages,
+            "index": index_name,
+            "ok": "COLLSCAN" not in stages,
+        })
+    return rows
+
+
+def print_explain_rows(rows: list):
+    for row in rows:
+        icon = "✅" if row["ok"] else "❌"
+        print(f"{icon} {row['name']}")
+        print(f"   plan: {' <- '.join(row['stages'])}")
+        if row["index"]:
+            print(f"   index: {row['index']}")
+    collscans = [r for r in rows if not r["ok"]]
+    if collscans:
+        print(f"❌ {len(collscans)} canonical queries fall back to COLLSCAN")
+    else:
+        print(f"✅ All {len(rows)} canonical queries use an index")
+
+
+async def _main(argv: list) -> int:
+    if "--explain" not in argv:
+        print_index_report(await reconcile_indexes())
+    rows = await explain_canonical_queries()
+    print_explain_rows(rows)
+    return 0 if all(r["ok"] for r in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
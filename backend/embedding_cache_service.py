@@ -0,0 +1,134 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional
+import logging
+
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Embeddings are requested synchronously from Chroma's worker threads, so the
+# cache is a local SQLite file (WAL mode, safe to share between workers)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a persistent cache keyed by
+    (model, sha256(text)). Cache misses from one call are de-duplicated and
+    sent to the underlying model in a single embed_documents request.
+    Only documents are cached; queries are one-off chat text and go straight
+    to the underlying model, so the cache grows with the indexed data alone.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, path: str = EMBEDDING_CACHE_PATH):
+        self.underlying = underlying
+        self.model = model
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    # ==================== STORAGE ====================
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model, key, array("f", vector).tobytes()) for key, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+    # ==================== EMBEDDINGS INTERFACE ====================
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup(list(set(hashes)))
+
+        # One API request for all distinct misses
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - sum(1 for key in hashes if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            self.api_calls += 1
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            try:
+                self._store(fresh)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Failed to write embedding cache: {e}")
+            cached.update(fresh)
+
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "api_calls": self.api_calls,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def cached_embeddings(underlying: Embeddings, model: str) -> Optional[Embeddings]:
+    """Wrap `underlying` with the persistent cache, falling back to it uncached"""
+    try:
+        return CachedEmbeddings(underlying, model)
+    except sqlite3.Error as e:
+        print(f"⚠️ Embedding cache unavailable, using uncached embeddings: {e}")
+        return underlying
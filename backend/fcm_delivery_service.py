@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+import logging
+
+from database import users_collection
+from firebase_service import FCM_BATCH_SIZE, send_fcm_batch
+
+logger = logging.getLogger(__name__)
+
+# How long the worker waits for more pushes before sending a partial batch
+FCM_FLUSH_INTERVAL_SECONDS = float(os.getenv("FCM_FLUSH_INTERVAL_SECONDS", "0.5"))
+# Pushes queued beyond this are dropped (and counted) instead of growing memory
+FCM_QUEUE_MAX_SIZE = int(os.getenv("FCM_QUEUE_MAX_SIZE", "100000"))
+FCM_MAX_RETRIES = int(os.getenv("FCM_MAX_RETRIES", "3"))
+FCM_RETRY_BASE_SECONDS = float(os.getenv("FCM_RETRY_BASE_SECONDS", "2"))
+# Seconds stop() keeps sending what is still queued
+FCM_DRAIN_TIMEOUT_SECONDS = float(os.getenv("FCM_DRAIN_TIMEOUT_SECONDS", "5"))
+THROUGHPUT_WINDOW_SECONDS = 60
+
+
+class FCMDeliveryQueue:
+    """
+    In-process queue that sends pushes in send_each batches of up to 500.
+
+    One dedicated sender thread makes every call, so the Firebase SDK's
+    HTTP session is reused instead of a new thread per notification.
+    Transient failures are retried with exponential backoff; tokens FCM
+    reports as unregistered are removed from users.fcm_token.
+    """
+
+    def __init__(
+        self,
+        sender: Callable[[List[dict]], dict] = send_fcm_batch,
+        batch_size: int = FCM_BATCH_SIZE,
+        flush_interval_seconds: float = FCM_FLUSH_INTERVAL_SECONDS,
+        max_size: int = FCM_QUEUE_MAX_SIZE,
+        max_retries: int = FCM_MAX_RETRIES
+    ):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_size = max_size
+        self.max_retries = max_retries
+
+        self._queue: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fcm")
+        # key -> TimerHandle of a push waiting out its retry backoff
+        self._retry_handles: Dict[object, asyncio.TimerHandle] = {}
+        self._sending = 0
+
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped_queue_full = 0
+        self.dropped_after_retries = 0
+        self.tokens_pruned = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+        self._batch_sizes: Deque[int] = deque(maxlen=200)
+        self._send_durations: Deque[float] = deque(maxlen=200)
+        # (monotonic time, delivered count) per batch, for throughput
+        self._deliveries: Deque[tuple] = deque()
+
+    # ==================== QUEUEING ====================
+
+    def enqueue(self, push: dict):
+        """Queue one push ({"token", "title", "body", "data"})"""
+        self.enqueue_many([push])
+
+    def enqueue_many(self, pushes: List[dict]):
+        for push in pushes:
+            if len(self._queue) >= self.max_size:
+                self.dropped_queue_full += 1
+                continue
+            self._queue.append(push)
+            self.enqueued += 1
+
+        if len(self._queue) >= self.max_size:
+            logger.warning(f"⚠️ FCM delivery queue full ({self.max_size}), dropping pushes")
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _requeue(self, handle_key, push: dict):
+        self._retry_handles.pop(handle_key, None)
+        if len(self._queue) >= self.max_size:
+            self.dropped_queue_full += 1
+            return
+        self._queue.append(push)
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _schedule_retry(self, push: dict):
+        attempts = push.get("attempts", 0) + 1
+        if attempts > self.max_retries:
+            self.dropped_after_retries += 1
+            return
+        self.retried += 1
+        retry_push = {**push, "attempts": attempts}
+        delay = FCM_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        handle_key = object()
+        self._retry_handles[handle_key] = asyncio.get_running_loop().call_later(delay, self._requeue, handle_key, retry_push)
+
+    # ==================== DELIVERY ====================
+
+    async def _prune_tokens(self, tokens: List[str]):
+        try:
+            result = await users_collection.update_many(
+                {"fcm_token": {"$in": tokens}},
+                {"$unset": {"fcm_token": ""}}
+            )
+            self.tokens_pruned += result.modified_count
+            if result.modified_count:
+                logger.info(f"🧹 Removed {result.modified_count} unregistered FCM token(s)")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to prune FCM tokens: {e}")
+
+    async def _send(self, batch: List[dict]):
+        self._sending = len(batch)
+        started = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, self.sender, batch)
+        except Exception as e:
+            # The sender itself blew up; treat the whole batch as transient
+            self.last_error = str(e)
+            logger.error(f"❌ FCM batch send failed: {e}")
+            result = {"success": 0, "failure": len(batch), "invalid_tokens": [], "retry": batch}
+        finally:
+            self._sending = 0
+
+        now = time.monotonic()
+        self.batches += 1
+        self._batch_sizes.append(len(batch))
+        self._send_durations.append(now - started)
+        self._deliveries.append((now, result["success"]))
+
+        self.delivered += result["success"]
+        retry = result.get("retry", [])
+        invalid_tokens = result.get("invalid_tokens", [])
+        self.failed += result["failure"] - len(retry)
+        for push in retry:
+            self._schedule_retry(push)
+        if invalid_tokens:
+            await self._prune_tokens(list(set(invalid_tokens)))
+
+    async def _worker_loop(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if len(self._queue) < self.batch_size:
+                # Let a burst of notifications fill the batch before sending
+                await asyncio.sleep(self.flush_interval_seconds)
+
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if batch:
+                try:
+                    await self._send(batch)
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"❌ FCM delivery worker error: {e}")
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            try:
+                self._worker = asyncio.get_running_loop().create_task(self._worker_loop())
+            except RuntimeError:
+                # No running loop (sync script); pushes wait until start()
+                pass
+
+    async def start(self):
+        self._ensure_worker()
+
+    async def stop(self, drain_timeout: float = FCM_DRAIN_TIMEOUT_SECONDS):
+        """Send what is still queued (bounded by drain_timeout), then stop the worker"""
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+        deadline = time.monotonic() + drain_timeout
+        while self._queue and time.monotonic() < deadline:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await asyncio.wait_for(self._send(batch), timeout=max(deadline - time.monotonic(), 0.1))
+            except Exception as e:
+                logger.warning(f"⚠️ FCM drain stopped: {e}")
+                break
+        if self._queue:
+            logger.warning(f"⚠️ {len(self._queue)} FCM push(es) not sent before shutdown")
+        # A retry firing later, including one the drain just scheduled, would
+        # start a new worker on the closed executor
+        if self._retry_handles:
+            logger.warning(f"⚠️ {len(self._retry_handles)} FCM retr(ies) cancelled at shutdown")
+            for handle in self._retry_handles.values():
+                handle.cancel()
+            self._retry_handles.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._deliveries and self._deliveries[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._deliveries.popleft()
+        sizes = self._batch_sizes
+        durations = self._send_durations
+        return {
+            "depth": len(self._queue),
+            "sending": self._sending,
+            "retries_pending": len(self._retry_handles),
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped_queue_full": self.dropped_queue_full,
+            "dropped_after_retries": self.dropped_after_retries,
+            "tokens_pruned": self.tokens_pruned,
+            "batches": self.batches,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 1) if sizes else None,
+            "avg_send_ms": round(sum(durations) / len(durations) * 1000, 1) if durations else None,
+            "delivered_per_second": round(sum(count for _, count in self._deliveries) / THROUGHPUT_WINDOW_SECONDS, 2),
+            "last_error": self.last_error
+        }
+
+
+# Global queue, started with the app
+fcm_delivery_queue = FCMDeliveryQueue()
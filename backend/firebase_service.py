@@ -1,10 +1,13 @@
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials, exceptions, messaging
 from config import settings
 import os
 
 _firebase_app = None
 
+# messaging.send_each accepts at most 500 messages per call
+FCM_BATCH_SIZE = 500
+
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
     global _firebase_app
@@ -38,115 +41,88 @@ def initialize_firebase():
         return None
 
 
-def send_fcm_notification(
-    fcm_token: str,
-    title: str,
-    body: str,
-    data: dict = None
-) -> bool:
-    """Send FCM push notification to a specific device"""
-    if _firebase_app is None:
-        print("⚠️  Firebase not initialized, skipping FCM notification")
-        return False
-    
-    try:
-        # Build the message
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
+def build_fcm_message(fcm_token: str, title: str, body: str, data: dict = None) -> messaging.Message:
+    """Build a push message with the app's Android channel and iOS sound/badge"""
+    return messaging.Message(
+        notification=messaging.Notification(
+            title=title,
+            body=body,
+        ),
+        data=data or {},
+        token=fcm_token,
+        android=messaging.AndroidConfig(
+            priority='high',
+            notification=messaging.AndroidNotification(
+                sound='default',
+                channel_id='flow_finance_notifications',
             ),
-            data=data or {},
-            token=fcm_token,
-            android=messaging.AndroidConfig(
-                priority='high',
-                notification=messaging.AndroidNotification(
+        ),
+        apns=messaging.APNSConfig(
+            payload=messaging.APNSPayload(
+                aps=messaging.Aps(
                     sound='default',
-                    channel_id='flow_finance_notifications',
+                    badge=1,
                 ),
             ),
-            apns=messaging.APNSConfig(
-                payload=messaging.APNSPayload(
-                    aps=messaging.Aps(
-                        sound='default',
-                        badge=1,
-                    ),
-                ),
-            ),
-        )
-        
-        # Send the message
-        response = messaging.send(message)
-        print(f'✅ FCM notification sent successfully: {response}')
-        return True
-        
-    except messaging.UnregisteredError:
-        print(f'❌ FCM token is invalid or unregistered: {fcm_token}')
-        # TODO: Remove this token from database
-        return False
-    except Exception as e:
-        print(f'❌ FCM error: {e}')
-        return False
+        ),
+    )
+
+
+def _is_invalid_token_error(error) -> bool:
+    """The token will never work again and should be removed from the user"""
+    return isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError))
 
 
-def send_fcm_to_multiple(
-    fcm_tokens: list[str],
-    title: str,
-    body: str,
-    data: dict = None
-) -> dict:
-    """Send FCM notification to multiple devices using send_each_for_multicast"""
+def _is_retryable_error(error) -> bool:
+    return isinstance(error, (
+        messaging.QuotaExceededError,
+        exceptions.UnavailableError,
+        exceptions.InternalError,
+        exceptions.DeadlineExceededError
+    ))
+
+
+def send_fcm_batch(pushes: list[dict]) -> dict:
+    """
+    Send individually addressed pushes ({"token", "title", "body", "data"})
+    with one send_each call per FCM_BATCH_SIZE messages.
+    
+    Returns counts plus the tokens that are no longer registered and the
+    pushes that failed transiently and may be retried.
+    """
     if _firebase_app is None:
         print("⚠️  Firebase not initialized, skipping FCM notifications")
-        return {"success": 0, "failure": len(fcm_tokens)}
+        return {"success": 0, "failure": len(pushes), "invalid_tokens": [], "retry": []}
     
-    if not fcm_tokens:
-        return {"success": 0, "failure": 0}
+    success = 0
+    failure = 0
+    invalid_tokens = []
+    retry = []
     
-    try:
-        # Create MulticastMessage
-        multicast_message = messaging.MulticastMessage(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            data=data or {},
-            tokens=fcm_tokens,
-            android=messaging.AndroidConfig(
-                priority='high',
-                notification=messaging.AndroidNotification(
-                    sound='default',
-                    channel_id='flow_finance_notifications',
-                ),
-            ),
-            apns=messaging.APNSConfig(
-                payload=messaging.APNSPayload(
-                    aps=messaging.Aps(
-                        sound='default',
-                        badge=1,
-                    ),
-                ),
-            ),
-        )
+    for start in range(0, len(pushes), FCM_BATCH_SIZE):
+        chunk = pushes[start:start + FCM_BATCH_SIZE]
+        try:
+            response = messaging.send_each([
+                build_fcm_message(push["token"], push["title"], push["body"], push.get("data"))
+                for push in chunk
+            ])
+        except Exception as e:
+            # The whole request failed (network, auth refresh); every message may be retried
+            print(f'❌ FCM batch error: {e}')
+            failure += len(chunk)
+            retry.extend(chunk)
+            continue
         
-        # Send using send_each_for_multicast (correct method for v7.x)
-        response = messaging.send_each_for_multicast(multicast_message)
-        
-        print(f'✅ FCM multicast sent: {response.success_count} success, {response.failure_count} failure')
-        
-        # Log any failures for debugging
-        if response.failure_count > 0:
-            for idx, resp in enumerate(response.responses):
-                if not resp.success:
-                    print(f'❌ Failed to send to token {idx}: {resp.exception}')
-        
-        return {
-            "success": response.success_count,
-            "failure": response.failure_count,
-        }
-        
-    except Exception as e:
-        print(f'❌ FCM multicast error: {e}')
-        import traceback
-        traceback.print_exc()
-        return {"success": 0, "failure": len(fcm_tokens)}
\ No newline at end of file
+        success += response.success_count
+        failure += response.failure_count
+        for push, resp in zip(chunk, response.responses):
+            if resp.success:
+                continue
+            if _is_invalid_token_error(resp.exception):
+                invalid_tokens.append(push["token"])
+            elif _is_retryable_error(resp.exception):
+                retry.append(push)
+            else:
+                print(f'❌ FCM error for notification {push.get("data", {}).get("notification_id", "")}: {resp.exception}')
+    
+    return {"success": success, "failure": failure, "invalid_tokens": invalid_tokens, "retry": retry}
@@ -6,9 +6,11 @@ from fastapi import APIRouter, HTTPException, status, Depends, Path
 
 from models import Currency
 from utils import get_current_user, get_user_balance
+from balance_service import apply_balance_delta, goal_allocation_delta
 from goal_models import CurrencySummary, GoalContribution, GoalCreate, GoalResponse, GoalStatus, GoalType, GoalUpdate, GoalsSummary, MultiCurrencyGoalsSummary
 
 from notification_service import (
+    NotificationBatch,
     check_goal_notifications,
     check_milestone_amount,
 )
@@ -76,13 +78,8 @@ async def create_goal(
         {"$set": {"ai_data_stale": True}}
     )
 
-    # === START FIX: Cache Invalidation ===
-    # [FIX] Added await
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
-    # === END FIX ===
+    # Move the initial contribution into goal allocations
+    await apply_balance_delta(current_user["_id"], goal_allocation_delta(goal_data.currency.value, current_amount))
     
     return GoalResponse(
         id=goal_id,
@@ -259,12 +256,6 @@ async def update_goal(
         {"_id": current_user["_id"]},
         {"$set": {"ai_data_stale": True}}
     )
-
-    # [FIX] Added await
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
     
     return GoalResponse(
         id=updated_goal["_id"],
@@ -376,20 +367,23 @@ async def contribute_to_goal(
     
     if contribution.amount > 0:
         # [FIX] Add await to both of these
-        await check_goal_notifications(
-            user_id=current_user["_id"],
-            goal_id=goal_id,
-            old_progress=old_progress,
-            new_progress=new_progress,
-            goal_name=goal["name"]
-        )
-        await check_milestone_amount(
-            user_id=current_user["_id"],
-            goal_id=goal_id,
-            old_amount=original_amount,
-            new_amount=new_amount,
-            goal_name=goal["name"]
-        )
+        async with NotificationBatch() as notifications:
+            await check_goal_notifications(
+                user_id=current_user["_id"],
+                goal_id=goal_id,
+                old_progress=old_progress,
+                new_progress=new_progress,
+                goal_name=goal["name"],
+                batch=notifications
+            )
+            await check_milestone_amount(
+                user_id=current_user["_id"],
+                goal_id=goal_id,
+                old_amount=original_amount,
+                new_amount=new_amount,
+                goal_name=goal["name"],
+                batch=notifications
+            )
     
     # [FIX] Added await
     updated_goal = await goals_collection.find_one({"_id": goal_id})
@@ -400,11 +394,7 @@ async def contribute_to_goal(
         {"$set": {"ai_data_stale": True}}
     )
 
-    # [FIX] Added await
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
+    await apply_balance_delta(current_user["_id"], goal_allocation_delta(goal_currency, contribution.amount))
     
     return GoalResponse(
         id=updated_goal["_id"],
@@ -460,11 +450,8 @@ async def delete_goal(
         {"$set": {"ai_data_stale": True}}
     )
 
-    # [FIX] Added await
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
+    # Release the goal's allocation back to the available balance
+    await apply_balance_delta(current_user["_id"], goal_allocation_delta(goal.get("currency", "usd"), -returned_amount))
     
     return {
         "message": "Goal deleted successfully",
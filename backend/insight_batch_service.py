@@ -0,0 +1,581 @@
+import asyncio
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, UTC
+from typing import AsyncIterator, Dict, List, Optional
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import (
+    budgets_collection,
+    goals_collection,
+    insight_job_items_collection,
+    insight_jobs_collection,
+    insights_collection,
+    transactions_collection,
+    users_collection
+)
+from insights_service import (
+    generate_monthly_insight,
+    generate_weekly_insight,
+    get_month_date_range,
+    get_previous_month_date_range,
+    get_previous_week_date_range,
+    get_week_date_range
+)
+from notification_service import NotificationBatch, notify_monthly_insights_generated, notify_weekly_insights_generated
+
+logger = logging.getLogger(__name__)
+
+# Users are streamed from a cursor and prefetched this many at a time; every
+# chunk costs a fixed handful of collection-wide queries regardless of size
+INSIGHT_BATCH_SIZE = int(os.getenv("INSIGHT_BATCH_SIZE", "200"))
+# Users generated concurrently (each runs both providers). AI calls are paced
+# by the shared governor's batch lane, so this only bounds in-flight work.
+INSIGHT_BATCH_CONCURRENCY = int(os.getenv("INSIGHT_BATCH_CONCURRENCY", "25"))
+
+INSIGHT_PROVIDERS = ["openai", "gemini"]
+
+USER_PROJECTION = {"_id": 1, "name": 1, "default_currency": 1, "subscription_expires_at": 1}
+
+
+# ==================== USER STREAM ====================
+
+async def iter_premium_user_batches(batch_size: int = INSIGHT_BATCH_SIZE, after_id: Optional[str] = None) -> AsyncIterator[List[Dict]]:
+    """
+    Stream premium users with an unexpired subscription in chunks. Pages are
+    keyed on _id so no server cursor has to survive a chunk's AI calls.
+    """
+    query = {
+        "subscription_type": "premium",
+        "$or": [
+            {"subscription_expires_at": None},
+            {"subscription_expires_at": {"$gte": datetime.now(UTC)}}
+        ]
+    }
+    last_id = after_id
+    while True:
+        page_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        cursor = users_collection.find(page_query, USER_PROJECTION).sort("_id", 1).limit(batch_size)
+
+        batch = []
+        async for user in cursor:
+            batch.append(user)
+        if not batch:
+            return
+
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1]["_id"]
+
+
+# ==================== PRECOMPUTED AGGREGATES ====================
+
+def _period_switch(periods: Dict[str, tuple]) -> dict:
+    return {
+        "$switch": {
+            "branches": [
+                {
+                    "case": {"$and": [{"$gte": ["$date", start]}, {"$lte": ["$date", end]}]},
+                    "then": name
+                }
+                for name, (start, end) in periods.items()
+            ],
+            "default": None
+        }
+    }
+
+
+async def load_period_summaries(user_ids: List[str], periods: Dict[str, tuple]) -> Dict[str, Dict[str, dict]]:
+    """
+    Per-user, per-period totals and top-5 outflow categories for every user in
+    `user_ids`, in the same shape as insights_service.get_financial_summary:
+    {user_id: {period: {"summary": [...], "categories": [...]}}}
+    """
+    match = {
+        "$match": {
+            "user_id": {"$in": user_ids},
+            "date": {
+                "$gte": min(start for start, _ in periods.values()),
+                "$lte": max(end for _, end in periods.values())
+            }
+        }
+    }
+    tag_period = {"$addFields": {"_period": _period_switch(periods)}}
+
+    summary_pipeline = [
+        match,
+        tag_period,
+        {"$match": {"_period": {"$ne": None}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "period": "$_period", "currency": "$currency"},
+            "inflow": {"$sum": {"$cond": [{"$eq": ["$type", "inflow"]}, "$amount", 0]}},
+            "outflow": {"$sum": {"$cond": [{"$eq": ["$type", "outflow"]}, "$amount", 0]}},
+            "count": {"$sum": 1}
+        }}
+    ]
+    categories_pipeline = [
+        {"$match": {**match["$match"], "type": "outflow"}},
+        tag_period,
+        {"$match": {"_period": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "period": "$_period",
+                "currency": "$currency",
+                "name": {"$concat": ["$main_category", " > ", "$sub_category"]}
+            },
+            "amount": {"$sum": "$amount"}
+        }},
+        {"$sort": {"amount": -1}},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "period": "$_id.period", "currency": "$_id.currency"},
+            "top_items": {"$push": {"category": "$_id.name", "amount": "$amount"}}
+        }},
+        {"$project": {"top_items": {"$slice": ["$top_items", 5]}}}
+    ]
+
+    summaries: Dict[str, Dict[str, dict]] = defaultdict(
+        lambda: {name: {"summary": [], "categories": []} for name in periods}
+    )
+
+    async def collect(pipeline, field, to_item):
+        async for row in transactions_collection.aggregate(pipeline, allowDiskUse=True):
+            key = row["_id"]
+            summaries[key["user_id"]][key["period"]][field].append(to_item(key["currency"], row))
+
+    await asyncio.gather(
+        collect(summary_pipeline, "summary", lambda currency, row: {
+            "_id": currency, "inflow": row["inflow"], "outflow": row["outflow"], "count": row["count"]
+        }),
+        collect(categories_pipeline, "categories", lambda currency, row: {
+            "_id": currency, "top_items": row["top_items"]
+        })
+    )
+    return summaries
+
+
+async def load_goals(user_ids: List[str]) -> Dict[str, List[Dict]]:
+    goals = defaultdict(list)
+    async for goal in goals_collection.find({"user_id": {"$in": user_ids}}).sort("created_at", -1):
+        goals[goal["user_id"]].append(goal)
+    return goals
+
+
+async def load_active_budgets(user_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Active budgets with their stored spent counters (see the budget_service counter notes)"""
+    budgets = defaultdict(list)
+    cursor = budgets_collection.find({
+        "user_id": {"$in": user_ids},
+        "is_active": True,
+        "status": "active"
+    }).sort("created_at", -1)
+    async for budget in cursor:
+        budgets[budget["user_id"]].append(budget)
+    return budgets
+
+
+async def load_previous_insights(user_ids: List[str], insight_type: str) -> Dict[str, Dict[str, Dict]]:
+    """Latest insight content per user and provider: {user_id: {provider: {"content": ...}}}"""
+    pipeline = [
+        {"$match": {"user_id": {"$in": user_ids}, "insight_type": insight_type}},
+        {"$sort": {"generated_at": -1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "ai_provider": "$ai_provider"},
+            "content": {"$first": "$content"}
+        }}
+    ]
+    previous = defaultdict(dict)
+    async for row in insights_collection.aggregate(pipeline, allowDiskUse=True):
+        previous[row["_id"]["user_id"]][row["_id"]["ai_provider"]] = {"content": row["content"]}
+    return previous
+
+
+async def prefetch_insight_batch(users: List[Dict], insight_type: str, periods: Dict[str, tuple]) -> Dict[str, dict]:
+    """Everything insight generation reads for a chunk of users, in five queries"""
+    user_ids = [user["_id"] for user in users]
+    summaries, goals, budgets, previous = await asyncio.gather(
+        load_period_summaries(user_ids, periods),
+        load_goals(user_ids),
+        load_active_budgets(user_ids),
+        load_previous_insights(user_ids, insight_type)
+    )
+    return {
+        user["_id"]: {
+            "user": user,
+            "current": summaries[user["_id"]]["current"],
+            "previous": summaries[user["_id"]]["previous"],
+            "goals": goals.get(user["_id"], []),
+            "budgets": budgets.get(user["_id"], []),
+            "previous_insights": previous.get(user["_id"], {}),
+            "period": periods["current"]
+        }
+        for user in users
+    }
+
+
+# ==================== CHECKPOINTED JOBS ====================
+#
+# A run is a persisted job (one per insight type and period, so re-triggering
+# the same period resumes it) plus one item per user. Workers claim pending
+# items in chunks with a lease; a crashed worker's claims expire and are picked
+# up again, failed users are retried with exponential backoff, and providers
+# that already produced an insight are never generated twice.
+
+INSIGHT_JOB_CHUNK_SIZE = int(os.getenv("INSIGHT_JOB_CHUNK_SIZE", "50"))
+INSIGHT_JOB_LEASE_SECONDS = int(os.getenv("INSIGHT_JOB_LEASE_SECONDS", "1800"))
+INSIGHT_JOB_MAX_ATTEMPTS = int(os.getenv("INSIGHT_JOB_MAX_ATTEMPTS", "3"))
+INSIGHT_JOB_RETRY_BASE_SECONDS = int(os.getenv("INSIGHT_JOB_RETRY_BASE_SECONDS", "60"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+INSIGHT_JOB_TYPES = {
+    "weekly": {
+        "periods": lambda: {"current": get_week_date_range(), "previous": get_previous_week_date_range()},
+        "generate": generate_weekly_insight,
+        "notify": notify_weekly_insights_generated,
+        "period_field": "week_start"
+    },
+    "monthly": {
+        "periods": lambda: {"current": get_month_date_range(), "previous": get_previous_month_date_range()},
+        "generate": generate_monthly_insight,
+        "notify": notify_monthly_insights_generated,
+        "period_field": "month_start"
+    }
+}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC)
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # Motor returns naive datetimes
+    return dt.replace(tzinfo=UTC) if dt and dt.tzinfo is None else dt
+
+
+def _job_periods(job: dict) -> Dict[str, tuple]:
+    return {
+        "current": (_as_utc(job["period_start"]), _as_utc(job["period_end"])),
+        "previous": (_as_utc(job["previous_start"]), _as_utc(job["previous_end"]))
+    }
+
+
+async def get_or_create_insight_job(insight_type: str) -> dict:
+    periods = INSIGHT_JOB_TYPES[insight_type]["periods"]()
+    (start, end), (prev_start, prev_end) = periods["current"], periods["previous"]
+    job_id = f"{insight_type}:{start.strftime('%Y-%m-%d')}"
+    now = _utcnow()
+
+    await insight_jobs_collection.update_one(
+        {"_id": job_id},
+        {"$setOnInsert": {
+            "insight_type": insight_type,
+            "period_start": start,
+            "period_end": end,
+            "previous_start": prev_start,
+            "previous_end": prev_end,
+            "status": "seeding",
+            "seed_last_id": None,
+            "total": 0,
+            "created_at": now,
+            "started_at": now,
+            "finished_at": None
+        }},
+        upsert=True
+    )
+    return await insight_jobs_collection.find_one({"_id": job_id})
+
+
+async def _seed_job(job: dict):
+    """Create one pending item per eligible user, checkpointing the last seeded _id"""
+    job_id = job["_id"]
+    last_id = job.get("seed_last_id")
+
+    async for users in iter_premium_user_batches(after_id=last_id):
+        now = _utcnow()
+        items = [
+            {
+                "_id": f"{job_id}:{user['_id']}",
+                "job_id": job_id,
+                "user_id": user["_id"],
+                "status": "pending",
+                "attempts": 0,
+                "providers_done": [],
+                "next_attempt_at": None,
+                "claimed_at": None,
+                "claimed_by": None,
+                "claim_token": None,
+                "last_error": None,
+                "updated_at": now
+            }
+            for user in users
+        ]
+        try:
+            await insight_job_items_collection.insert_many(items, ordered=False)
+        except BulkWriteError:
+            # Items seeded by a previous (crashed) or concurrent run
+            pass
+        await insight_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"seed_last_id": users[-1]["_id"]}}
+        )
+
+    total = await insight_job_items_collection.count_documents({"job_id": job_id})
+    await insight_jobs_collection.update_one(
+        {"_id": job_id, "status": "seeding"},
+        {"$set": {"status": "running", "total": total}}
+    )
+    logger.info(f"🌱 Insight job {job_id} seeded with {total} users")
+
+
+def _claimable_filter(job_id: str, now: datetime) -> dict:
+    return {
+        "job_id": job_id,
+        "$or": [
+            {"status": "pending"},
+            {"status": "retry", "next_attempt_at": {"$lte": now}},
+            # Lease expired: the worker that claimed it died or hung
+            {"status": "claimed", "claimed_at": {"$lt": now - timedelta(seconds=INSIGHT_JOB_LEASE_SECONDS)}}
+        ]
+    }
+
+
+async def _claim_chunk(job_id: str) -> List[dict]:
+    now = _utcnow()
+    claimable = _claimable_filter(job_id, now)
+    candidates = await insight_job_items_collection.find(claimable, {"_id": 1}).limit(INSIGHT_JOB_CHUNK_SIZE).to_list(length=None)
+    if not candidates:
+        return []
+
+    token = uuid.uuid4().hex
+    # Re-checking the claimable filter makes the claim atomic per item
+    await insight_job_items_collection.update_many(
+        {**claimable, "_id": {"$in": [c["_id"] for c in candidates]}},
+        {"$set": {"status": "claimed", "claimed_at": now, "claimed_by": WORKER_ID, "claim_token": token, "updated_at": now}}
+    )
+    return await insight_job_items_collection.find({"claim_token": token}).to_list(length=None)
+
+
+async def _process_chunk(job: dict, items: List[dict]):
+    config = INSIGHT_JOB_TYPES[job["insight_type"]]
+    periods = _job_periods(job)
+    user_ids = [item["user_id"] for item in items]
+
+    users, existing = await asyncio.gather(
+        users_collection.find({"_id": {"$in": user_ids}}, USER_PROJECTION).to_list(length=None),
+        # Insights written before a crash, but not yet checkpointed
+        insights_collection.find(
+            {"user_id": {"$in": user_ids}, "insight_type": job["insight_type"], config["period_field"]: periods["current"][0]},
+            {"user_id": 1, "ai_provider": 1}
+        ).to_list(length=None)
+    )
+    already_generated = defaultdict(set)
+    for insight in existing:
+        already_generated[insight["user_id"]].add(insight["ai_provider"])
+
+    prefetched = await prefetch_insight_batch(users, job["insight_type"], periods) if users else {}
+    sem = asyncio.Semaphore(INSIGHT_BATCH_CONCURRENCY)
+    updates = []
+    notifications = NotificationBatch()
+    await notifications.prefetch(prefetched.keys())
+
+    async def process_item(item: dict):
+        user_id = item["user_id"]
+        done = set(item.get("providers_done", [])) | already_generated[user_id]
+        error = None
+
+        if user_id not in prefetched:
+            # Deleted or downgraded since the job was seeded
+            updates.append(UpdateOne(
+                {"_id": item["_id"], "claim_token": item["claim_token"]},
+                {"$set": {"status": "skipped", "updated_at": _utcnow()}}
+            ))
+            return
+
+        todo = [provider for provider in INSIGHT_PROVIDERS if provider not in done]
+        generated_now = []
+        async with sem:
+            results = await asyncio.gather(
+                *(config["generate"](user_id, provider, prefetched[user_id]) for provider in todo),
+                return_exceptions=True
+            )
+        for provider, result in zip(todo, results):
+            if isinstance(result, Exception) or not result:
+                error = f"{provider}: {result if isinstance(result, Exception) else 'returned None'}"
+                logger.warning(f"⚠️ Failed to generate {provider} {job['insight_type']} insight for user {user_id}: {error}")
+            else:
+                generated_now.append(provider)
+        done |= set(generated_now)
+
+        now = _utcnow()
+        if len(done) == len(INSIGHT_PROVIDERS):
+            update = {"status": "done", "providers_done": sorted(done), "finished_at": now, "last_error": None}
+            if generated_now:
+                try:
+                    await config["notify"](user_id, batch=notifications)
+                except Exception as e:
+                    logger.error(f"Error notifying user {user_id} of {job['insight_type']} insights: {e}")
+        else:
+            attempts = item.get("attempts", 0) + 1
+            update = {"providers_done": sorted(done), "attempts": attempts, "last_error": error}
+            if attempts >= INSIGHT_JOB_MAX_ATTEMPTS:
+                update.update({"status": "failed", "finished_at": now})
+            else:
+                backoff = INSIGHT_JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                update.update({"status": "retry", "next_attempt_at": now + timedelta(seconds=backoff)})
+        update["updated_at"] = now
+        updates.append(UpdateOne({"_id": item["_id"], "claim_token": item["claim_token"]}, {"$set": update}))
+
+    await asyncio.gather(*(process_item(item) for item in items))
+    try:
+        await notifications.flush()
+    except Exception as e:
+        logger.error(f"Error sending {job['insight_type']} insight notifications: {e}")
+    if updates:
+        await insight_job_items_collection.bulk_write(updates, ordered=False)
+
+
+async def _next_wakeup(job_id: str) -> Optional[float]:
+    """Seconds until more items become claimable, or None if the job has no open items"""
+    lease_cutoff = _utcnow() - timedelta(seconds=INSIGHT_JOB_LEASE_SECONDS)
+    pipeline = [
+        {"$match": {"job_id": job_id, "status": {"$in": ["pending", "retry", "claimed"]}}},
+        {"$group": {
+            "_id": None,
+            "retry_at": {"$min": {"$cond": [{"$eq": ["$status", "retry"]}, "$next_attempt_at", None]}},
+            "lease_at": {"$min": {"$cond": [{"$eq": ["$status", "claimed"]}, "$claimed_at", None]}},
+            "pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}}
+        }}
+    ]
+    rows = await insight_job_items_collection.aggregate(pipeline).to_list(length=1)
+    if not rows:
+        return None
+    row = rows[0]
+    if row["pending"]:
+        return 0
+
+    now = _utcnow()
+    candidates = []
+    if row.get("retry_at"):
+        candidates.append((_as_utc(row["retry_at"]) - now).total_seconds())
+    if row.get("lease_at"):
+        candidates.append((_as_utc(row["lease_at"]) - _as_utc(lease_cutoff)).total_seconds())
+    return max(min(candidates), 1) if candidates else 0
+
+
+async def _finish_job(job_id: str):
+    counts = await _status_counts(job_id)
+    result = await insight_jobs_collection.update_one(
+        {"_id": job_id, "status": "running"},
+        {"$set": {"status": "completed", "finished_at": _utcnow(), "counts": counts}}
+    )
+    if result.modified_count:
+        logger.info(f"✅ Insight job {job_id} completed: {counts}")
+
+
+async def run_insight_job(job: dict):
+    """Seed (or finish seeding) the job, then claim and process chunks until nothing is left"""
+    job_id = job["_id"]
+    if job["status"] == "completed":
+        logger.info(f"ℹ️ Insight job {job_id} already completed")
+        return
+
+    logger.info(f"🔄 Running insight job {job_id} on {WORKER_ID}...")
+    if job["status"] == "seeding":
+        await _seed_job(job)
+        job = await insight_jobs_collection.find_one({"_id": job_id})
+
+    while True:
+        items = await _claim_chunk(job_id)
+        if items:
+            await _process_chunk(job, items)
+            continue
+
+        wait = await _next_wakeup(job_id)
+        if wait is None:
+            break
+        # Retries backing off, or chunks leased by another worker
+        await asyncio.sleep(min(max(wait, 1), INSIGHT_JOB_RETRY_BASE_SECONDS))
+
+    await _finish_job(job_id)
+
+
+async def resume_insight_jobs():
+    """Pick up jobs left unfinished by a previous process"""
+    try:
+        jobs = await insight_jobs_collection.find({"status": {"$in": ["seeding", "running"]}}).to_list(length=None)
+    except Exception as e:
+        logger.error(f"❌ Failed to look up unfinished insight jobs: {e}")
+        return
+    for job in jobs:
+        try:
+            await run_insight_job(job)
+        except Exception as e:
+            logger.error(f"❌ Insight job {job['_id']} failed: {e}")
+
+
+async def generate_weekly_insights_for_all_users():
+    """Generate weekly insights for all premium users as a resumable job"""
+    await run_insight_job(await get_or_create_insight_job("weekly"))
+
+
+async def generate_monthly_insights_for_all_users():
+    """Generate monthly insights for all premium users as a resumable job"""
+    await run_insight_job(await get_or_create_insight_job("monthly"))
+
+
+# ==================== PROGRESS ====================
+
+async def _status_counts(job_id: str) -> Dict[str, int]:
+    rows = await insight_job_items_collection.aggregate([
+        {"$match": {"job_id": job_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row["count"] for row in rows}
+
+
+async def get_insight_job_progress(job: dict) -> dict:
+    job_id = job["_id"]
+    counts = job.get("counts") or await _status_counts(job_id)
+    now = _utcnow()
+    started_at = _as_utc(job.get("started_at"))
+    finished_at = _as_utc(job.get("finished_at"))
+
+    finished = sum(counts.get(status, 0) for status in ("done", "failed", "skipped"))
+    total = job.get("total") or sum(counts.values())
+    elapsed = ((finished_at or now) - started_at).total_seconds() if started_at else 0
+    recent = 0
+    if not finished_at:
+        recent = await insight_job_items_collection.count_documents({
+            "job_id": job_id,
+            "status": {"$in": ["done", "failed", "skipped"]},
+            "updated_at": {"$gte": now - timedelta(minutes=5)}
+        })
+    per_minute = recent / 5 if recent else (finished / (elapsed / 60) if elapsed > 0 else 0)
+    remaining = max(total - finished, 0)
+
+    return {
+        "job_id": job_id,
+        "insight_type": job["insight_type"],
+        "status": job["status"],
+        "period_start": job["period_start"],
+        "period_end": job["period_end"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "total": total,
+        "counts": counts,
+        "percent_complete": round(finished / total * 100, 1) if total else 0.0,
+        "users_per_minute": round(per_minute, 2),
+        "eta_minutes": round(remaining / per_minute, 1) if per_minute and remaining else None
+    }
+
+
+async def list_insight_jobs(limit: int = 10) -> List[dict]:
+    jobs = await insight_jobs_collection.find({}).sort("created_at", -1).limit(limit).to_list(length=None)
+    return [await get_insight_job_progress(job) for job in jobs]
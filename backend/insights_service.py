@@ -2,13 +2,16 @@ import asyncio
 import uuid
 import os
 from datetime import datetime, timedelta, UTC
+from typing import Optional
 from notification_service import create_notification, notify_monthly_insights_generated, notify_weekly_insights_generated
 from database import users_collection, insights_collection, budgets_collection, transactions_collection
-from ai_chatbot import financial_chatbot, FinancialDataProcessor
+from ai_chatbot import financial_chatbot, get_financial_snapshot
 from ai_chatbot_gemini import gemini_financial_chatbot
 import logging
 from ai_usage_service import track_ai_usage
 from ai_usage_models import AIFeatureType, AIProviderType
+from ai_governor_service import ai_governor, estimate_tokens
+from ai_response_cache_service import ai_response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +59,12 @@ def get_previous_week_date_range():
     return prev_week_start, prev_week_end
 
 
-async def generate_weekly_insight(user_id: str, ai_provider: str = "openai"):
-    """Generate weekly insight for a specific user"""
+async def generate_weekly_insight(user_id: str, ai_provider: str = "openai", prefetched: Optional[dict] = None):
+    """
+    Generate weekly insight for a specific user. `prefetched` (from the insight
+    batch engine) supplies the user, period summaries, goals, budgets and
+    previous insights so no per-user reads are needed.
+    """
     try:
         # Select chatbot based on provider
         chatbot = gemini_financial_chatbot if ai_provider == "gemini" else financial_chatbot
@@ -70,23 +77,29 @@ async def generate_weekly_insight(user_id: str, ai_provider: str = "openai"):
         week_start, week_end = get_week_date_range()
         prev_week_start, prev_week_end = get_previous_week_date_range()
         
-        # [FIX] Added await
-        user = await users_collection.find_one({"_id": user_id})
-        if not user:
-            logger.error(f"User not found: {user_id}")
-            return None
-        
-        # Get financial data processor for other data (goals/budgets)
-        processor = FinancialDataProcessor(user_id)
-        
-        # [FIX] Added await (Function updated to async below)
-        current_week_data = await get_financial_summary(user_id, week_start, week_end)
-        prev_week_data = await get_financial_summary(user_id, prev_week_start, prev_week_end)
-        
-        # Note: Assuming processor methods handle async internally or return data synchronously for now.
-        # If FinancialDataProcessor uses the same database.py, these might need updates too.
-        goals = await processor.get_user_goals()
-        budgets = await processor.get_user_budgets()
+        if prefetched:
+            # A resumed batch job keeps the period it was started for
+            week_start, week_end = prefetched["period"]
+            user = prefetched["user"]
+            current_week_data = prefetched["current"]
+            prev_week_data = prefetched["previous"]
+            goals = prefetched["goals"]
+            budgets = prefetched["budgets"]
+        else:
+            # [FIX] Added await
+            user = await users_collection.find_one({"_id": user_id})
+            if not user:
+                logger.error(f"User not found: {user_id}")
+                return None
+            
+            # [FIX] Added await (Function updated to async below)
+            current_week_data = await get_financial_summary(user_id, week_start, week_end)
+            prev_week_data = await get_financial_summary(user_id, prev_week_start, prev_week_end)
+            
+            # Goals & budgets come from the shared snapshot (reused if the user just chatted)
+            snapshot = await get_financial_snapshot(user_id)
+            goals = snapshot.goals
+            budgets = snapshot.budgets
         
         # Efficient check for activity
         total_tx_count = sum(item['count'] for item in current_week_data.get('summary', []))
@@ -148,11 +161,14 @@ Start by adding your first transaction or creating a financial goal. The more da
             await insights_collection.insert_one(new_insight)
             return new_insight
         
-        # [FIX] Added await
-        previous_insight = await insights_collection.find_one(
-            {"user_id": user_id, "ai_provider": ai_provider, "insight_type": "weekly"},
-            sort=[("generated_at", -1)]
-        )
+        if prefetched:
+            previous_insight = prefetched["previous_insights"].get(ai_provider)
+        else:
+            # [FIX] Added await
+            previous_insight = await insights_collection.find_one(
+                {"user_id": user_id, "ai_provider": ai_provider, "insight_type": "weekly"},
+                sort=[("generated_at", -1)]
+            )
         
         # Build context
         context = _build_weekly_context(
@@ -179,11 +195,16 @@ Start by adding your first transaction or creating a financial goal. The more da
             client = genai.Client(api_key=GOOGLE_API_KEY)
             full_prompt = f"{system_prompt}\n\n{context}"
             # Note: Gemini generate_content is synchronous in this library version usually
-            response = await asyncio.to_thread(
-                client.models.generate_content,
-                model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
-                contents=full_prompt,
-                config={"temperature": 0.7, "max_output_tokens": 8192}
+            response = await ai_governor.run(
+                "gemini",
+                lambda: asyncio.to_thread(
+                    client.models.generate_content,
+                    model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+                    contents=full_prompt,
+                    config={"temperature": 0.7, "max_output_tokens": 8192}
+                ),
+                lane="batch" if prefetched else "interactive",
+                estimated_tokens=estimate_tokens(full_prompt, max_output_tokens=8192)
             )
             insights_content = response.text
             
@@ -207,14 +228,19 @@ Start by adding your first transaction or creating a financial goal. The more da
                 )
         else:
             client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            response = await client.chat.completions.create(
-                model=chatbot.gpt_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context}
-                ],
-                temperature=0.7,
-                max_tokens=2500
+            response = await ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model=chatbot.gpt_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": context}
+                    ],
+                    temperature=0.7,
+                    max_tokens=2500
+                ),
+                lane="batch" if prefetched else "interactive",
+                estimated_tokens=estimate_tokens(system_prompt, context, max_output_tokens=2500)
             )
             insights_content = response.choices[0].message.content
             
@@ -262,7 +288,9 @@ Start by adding your first transaction or creating a financial goal. The more da
         
         # [FIX] Added await
         await insights_collection.insert_one(new_insight)
-        notify_weekly_insights_generated(user_id)
+        # The batch engine sends one notification per user for both providers
+        if not prefetched:
+            await notify_weekly_insights_generated(user_id)
         logger.info(f"✅ Weekly insight generated for user {user_id} using {ai_provider}")
         return new_insight
         
@@ -571,75 +599,6 @@ Total Transactions: {total_tx}
     return context
 
 
-async def generate_weekly_insights_for_all_users():
-    """Generate weekly insights for all premium users using Bounded Concurrency"""
-    logger.info("🔄 Starting weekly insights generation (Concurrent Mode)...")
-    
-    # 1. Fetch all premium users quickly to release DB cursor
-    # Projection only gets necessary fields to save memory
-    cursor = users_collection.find(
-        {"subscription_type": "premium"},
-        {"_id": 1, "subscription_expires_at": 1}
-    )
-    users = await cursor.to_list(length=None)
-    
-    if not users:
-        logger.info("ℹ️ No premium users found for weekly insights.")
-        return
-
-    logger.info(f"📊 Processing {len(users)} premium users for weekly insights...")
-
-    # 2. Semaphore to limit concurrency (e.g., 5 users at a time = ~10 concurrent AI calls)
-    # Adjust this number based on your OpenAI/Gemini tier limits.
-    sem = asyncio.Semaphore(5)
-    
-    success_count = 0
-    error_count = 0
-
-    async def process_user_weekly(user):
-        nonlocal success_count, error_count
-        user_id = user["_id"]
-        
-        async with sem:  # Wait for a free slot in the semaphore
-            try:
-                # Check subscription validity
-                expires_at = user.get("subscription_expires_at")
-                if expires_at and expires_at < datetime.now(UTC):
-                    logger.info(f"⏭️ Skipping user {user_id} - subscription expired")
-                    return
-
-                # Run both providers concurrently for this user
-                # This cuts processing time per user in half
-                tasks = [
-                    generate_weekly_insight(user_id, "openai"),
-                    generate_weekly_insight(user_id, "gemini")
-                ]
-                
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                for provider, result in zip(["openai", "gemini"], results):
-                    if isinstance(result, Exception):
-                        logger.error(f"❌ Error generating {provider} weekly insight for {user_id}: {str(result)}")
-                        error_count += 1
-                    elif result:
-                        logger.info(f"✅ Generated {provider} weekly insight for user {user_id}")
-                        success_count += 1
-                    else:
-                        logger.warning(f"⚠️ Failed to generate {provider} weekly insight for user {user_id} (Returned None)")
-                        error_count += 1
-
-            except Exception as e:
-                logger.error(f"❌ Critical error processing user {user_id}: {str(e)}")
-                error_count += 1
-
-    # 3. Create and run all tasks
-    # This fires off the workers, which will respect the semaphore limit
-    tasks = [process_user_weekly(user) for user in users]
-    await asyncio.gather(*tasks)
-    
-    logger.info(f"✅ Weekly insights generation completed: {success_count} successful, {error_count} errors")
-
-
 async def translate_insight_to_myanmar(english_content: str, ai_provider: str = "openai", user_id: str = None) -> str:
     """Translate English insights to Myanmar language"""
     try:
@@ -718,37 +677,30 @@ Translate naturally while keeping the professional yet friendly tone."""
             
             prompt = f"{system_prompt}\n\nTranslate this to Myanmar:\n\n{english_content}"
             
-            response = await asyncio.to_thread(
-                client.models.generate_content,
+            myanmar_content = await ai_response_cache.complete(
+                provider="gemini",
                 model="gemini-2.5-pro",
-                contents=prompt,
-                config={
-                    "temperature": 0.3,
-                    "max_output_tokens": 8192,
-                }
+                temperature=0.3,
+                prompt=prompt,
+                params={"max_output_tokens": 8192},
+                call=lambda: ai_governor.run(
+                    "gemini",
+                    lambda: asyncio.to_thread(
+                        client.models.generate_content,
+                        model="gemini-2.5-pro",
+                        contents=prompt,
+                        config={
+                            "temperature": 0.3,
+                            "max_output_tokens": 8192,
+                        }
+                    ),
+                    lane="interactive",
+                    estimated_tokens=estimate_tokens(prompt, max_output_tokens=8192)
+                ),
+                user_id=user_id,
+                feature_type=AIFeatureType.TRANSLATION
             )
             
-            myanmar_content = response.text
-
-
-            # NEW: Track translation usage
-            if hasattr(response, 'usage_metadata'):
-                input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
-                output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-                total_tokens = getattr(response.usage_metadata, 'total_token_count', 0)
-                
-                # Get user_id from the insight being translated
-                # You'll need to pass user_id to this function
-                await track_ai_usage(
-                    user_id=user_id,  # Add user_id parameter to function
-                    feature_type=AIFeatureType.TRANSLATION,
-                    provider=AIProviderType.GEMINI,
-                    model_name="gemini-2.5-pro",
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    total_tokens=total_tokens
-                )
-            
         else:  # OpenAI
             from openai import AsyncOpenAI
             
@@ -756,35 +708,32 @@ Translate naturally while keeping the professional yet friendly tone."""
                 raise Exception("OpenAI API key not configured")
             
             client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Translate this to Myanmar:\n\n{english_content}"}
+            ]
             
-            response = await client.chat.completions.create(
-                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Translate this to Myanmar:\n\n{english_content}"}
-                ],
+            myanmar_content = await ai_response_cache.complete(
+                provider="openai",
+                model=model,
                 temperature=0.3,
-                max_tokens=3000
+                prompt=messages,
+                params={"max_tokens": 3000},
+                call=lambda: ai_governor.run(
+                    "openai",
+                    lambda: client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=3000
+                    ),
+                    lane="interactive",
+                    estimated_tokens=estimate_tokens(system_prompt, english_content, max_output_tokens=3000)
+                ),
+                user_id=user_id,
+                feature_type=AIFeatureType.TRANSLATION
             )
-            
-            myanmar_content = response.choices[0].message.content
-
-
-            # NEW: Track translation usage
-            if hasattr(response, 'usage'):
-                input_tokens = response.usage.prompt_tokens
-                output_tokens = response.usage.completion_tokens
-                total_tokens = response.usage.total_tokens
-                
-                await track_ai_usage(
-                    user_id=user_id,  # Add user_id parameter to function
-                    feature_type=AIFeatureType.TRANSLATION,
-                    provider=AIProviderType.OPENAI,
-                    model_name=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    total_tokens=total_tokens
-                )
         
         return myanmar_content
         
@@ -834,8 +783,12 @@ def get_previous_month_date_range():
     return prev_month_start, prev_month_end
 
 
-async def generate_monthly_insight(user_id: str, ai_provider: str = "openai"):
-    """Generate monthly insight for a specific user"""
+async def generate_monthly_insight(user_id: str, ai_provider: str = "openai", prefetched: Optional[dict] = None):
+    """
+    Generate monthly insight for a specific user. `prefetched` (from the insight
+    batch engine) supplies the user, period summaries, goals, budgets and
+    previous insights so no per-user reads are needed.
+    """
     try:
         # Select chatbot based on provider
         chatbot = gemini_financial_chatbot if ai_provider == "gemini" else financial_chatbot
@@ -848,22 +801,29 @@ async def generate_monthly_insight(user_id: str, ai_provider: str = "openai"):
         month_start, month_end = get_month_date_range()
         prev_month_start, prev_month_end = get_previous_month_date_range()
         
-        # [FIX] Added await
-        user = await users_collection.find_one({"_id": user_id})
-        if not user:
-            logger.error(f"User not found: {user_id}")
-            return None
-        
-        # Get financial data processor
-        processor = FinancialDataProcessor(user_id)
-        
-        # [FIX] Added await (Function is now async)
-        current_month_data = await get_financial_summary(user_id, month_start, month_end)
-        prev_month_data = await get_financial_summary(user_id, prev_month_start, prev_month_end)
-        
-        # Get goals & budgets
-        goals = processor.get_user_goals()
-        budgets = processor.get_user_budgets()
+        if prefetched:
+            # A resumed batch job keeps the period it was started for
+            month_start, month_end = prefetched["period"]
+            user = prefetched["user"]
+            current_month_data = prefetched["current"]
+            prev_month_data = prefetched["previous"]
+            goals = prefetched["goals"]
+            budgets = prefetched["budgets"]
+        else:
+            # [FIX] Added await
+            user = await users_collection.find_one({"_id": user_id})
+            if not user:
+                logger.error(f"User not found: {user_id}")
+                return None
+            
+            # [FIX] Added await (Function is now async)
+            current_month_data = await get_financial_summary(user_id, month_start, month_end)
+            prev_month_data = await get_financial_summary(user_id, prev_month_start, prev_month_end)
+            
+            # Get goals & budgets
+            snapshot = await get_financial_snapshot(user_id)
+            goals = snapshot.goals
+            budgets = snapshot.budgets
         
         # Check for activity
         total_tx_count = sum(item['count'] for item in current_month_data.get('summary', []))
@@ -927,11 +887,14 @@ Start by adding your first transaction or creating a financial goal. The more da
             await insights_collection.insert_one(new_insight)
             return new_insight
         
-        # [FIX] Added await
-        previous_insight = await insights_collection.find_one(
-            {"user_id": user_id, "ai_provider": ai_provider, "insight_type": "monthly"},
-            sort=[("generated_at", -1)]
-        )
+        if prefetched:
+            previous_insight = prefetched["previous_insights"].get(ai_provider)
+        else:
+            # [FIX] Added await
+            previous_insight = await insights_collection.find_one(
+                {"user_id": user_id, "ai_provider": ai_provider, "insight_type": "monthly"},
+                sort=[("generated_at", -1)]
+            )
         
         # Build context
         context = _build_monthly_context(
@@ -954,11 +917,16 @@ Start by adding your first transaction or creating a financial goal. The more da
             client = genai.Client(api_key=GOOGLE_API_KEY)
             full_prompt = f"{system_prompt}\n\n{context}"
             # [FIX] Wrap blocking call in asyncio.to_thread
-            response = await asyncio.to_thread(
-                client.models.generate_content,
-                model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
-                contents=full_prompt,
-                config={"temperature": 0.7, "max_output_tokens": 8192}
+            response = await ai_governor.run(
+                "gemini",
+                lambda: asyncio.to_thread(
+                    client.models.generate_content,
+                    model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+                    contents=full_prompt,
+                    config={"temperature": 0.7, "max_output_tokens": 8192}
+                ),
+                lane="batch" if prefetched else "interactive",
+                estimated_tokens=estimate_tokens(full_prompt, max_output_tokens=8192)
             )
             insights_content = response.text
             
@@ -978,14 +946,19 @@ Start by adding your first transaction or creating a financial goal. The more da
                 )
         else:
             client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            response = await client.chat.completions.create(
-                model=chatbot.gpt_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context}
-                ],
-                temperature=0.7,
-                max_tokens=3000
+            response = await ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model=chatbot.gpt_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": context}
+                    ],
+                    temperature=0.7,
+                    max_tokens=3000
+                ),
+                lane="batch" if prefetched else "interactive",
+                estimated_tokens=estimate_tokens(system_prompt, context, max_output_tokens=3000)
             )
             insights_content = response.choices[0].message.content
             
@@ -1023,7 +996,9 @@ Start by adding your first transaction or creating a financial goal. The more da
         
         # [FIX] Added await
         await insights_collection.insert_one(new_insight)
-        notify_monthly_insights_generated(user_id)
+        # The batch engine sends one notification per user for both providers
+        if not prefetched:
+            await notify_monthly_insights_generated(user_id)
         logger.info(f"✅ Monthly insight generated for user {user_id} using {ai_provider}")
         return new_insight
         
@@ -1265,68 +1240,3 @@ Total Transactions: {total_tx}
     
     context += "\n\nGenerate a comprehensive monthly financial insight report based on the above data."
     return context
-
-
-async def generate_monthly_insights_for_all_users():
-    """Generate monthly insights for all premium users using Bounded Concurrency"""
-    logger.info("📅 Starting monthly insights generation (Concurrent Mode)...")
-    
-    # 1. Fetch all premium users
-    cursor = users_collection.find(
-        {"subscription_type": "premium"},
-        {"_id": 1, "subscription_expires_at": 1}
-    )
-    users = await cursor.to_list(length=None)
-
-    if not users:
-        logger.info("ℹ️ No premium users found for monthly insights.")
-        return
-
-    logger.info(f"📊 Processing {len(users)} premium users for monthly insights...")
-
-    # 2. Semaphore to limit concurrency
-    sem = asyncio.Semaphore(5)
-    
-    success_count = 0
-    error_count = 0
-
-    async def process_user_monthly(user):
-        nonlocal success_count, error_count
-        user_id = user["_id"]
-        
-        async with sem:
-            try:
-                # Check subscription validity
-                expires_at = user.get("subscription_expires_at")
-                if expires_at and expires_at < datetime.now(UTC):
-                    logger.info(f"⏭️ Skipping user {user_id} - subscription expired")
-                    return
-
-                # Run both providers concurrently
-                tasks = [
-                    generate_monthly_insight(user_id, "openai"),
-                    generate_monthly_insight(user_id, "gemini")
-                ]
-                
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                for provider, result in zip(["openai", "gemini"], results):
-                    if isinstance(result, Exception):
-                        logger.error(f"❌ Error generating {provider} monthly insight for {user_id}: {str(result)}")
-                        error_count += 1
-                    elif result:
-                        logger.info(f"✅ Generated {provider} monthly insight for user {user_id}")
-                        success_count += 1
-                    else:
-                        logger.warning(f"⚠️ Failed to generate {provider} monthly insight for user {user_id} (Returned None)")
-                        error_count += 1
-
-            except Exception as e:
-                logger.error(f"❌ Critical error processing user {user_id}: {str(e)}")
-                error_count += 1
-
-    # 3. Run all tasks
-    tasks = [process_user_monthly(user) for user in users]
-    await asyncio.gather(*tasks)
-    
-    logger.info(f"✅ Monthly insights generation completed: {success_count} successful, {error_count} errors")
\ No newline at end of file
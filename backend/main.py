@@ -13,6 +13,11 @@ from firebase_service import initialize_firebase
 from utils import get_current_user, get_user_balance, require_premium
 from notification_preferences_models import NotificationPreferences, NotificationPreferencesResponse, NotificationPreferencesUpdate
 from scheduler import start_scheduler
+from recompute_queue_service import recompute_queue
+from password_service import password_hasher
+from fcm_delivery_service import fcm_delivery_queue
+from insight_batch_service import resume_insight_jobs
+from broadcast_service import resume_broadcast_jobs
 from pdf_generator import generate_financial_report_pdf
 from report_models import CategoryBreakdown, FinancialReport, GoalProgress, ReportPeriod, ReportRequest
 from insight_models import InsightResponse
@@ -64,6 +69,11 @@ async def startup_db_client():
     await initialize_categories()
     await initialize_admin()
     await create_db_indexes()
+    await recompute_queue.start()
+    await fcm_delivery_queue.start()
+    # Insight jobs interrupted by a restart continue where they stopped
+    app.state.insight_jobs_task = asyncio.create_task(resume_insight_jobs())
+    app.state.broadcast_jobs_task = asyncio.create_task(resume_broadcast_jobs())
     
     try:
         from scheduler import start_scheduler
@@ -76,6 +86,9 @@ async def startup_db_client():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await recompute_queue.stop()
+    await fcm_delivery_queue.stop()
+    password_hasher.shutdown()
     if hasattr(app.state, "scheduler"):
         app.state.scheduler.shutdown()
         print("🛑 Scheduler shut down successfully")
@@ -92,6 +105,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -198,12 +212,10 @@ async def stream_chat_with_ai(
             # Refresh the specific provider requested
             if chat_request.ai_provider == AIProvider.GEMINI:
                 if gemini_financial_chatbot:
-                    # [NOTE] These refresh methods might be blocking if they use aggregation internally.
-                    # Ideally, make refresh_user_data async too, but for now we focus on the route.
-                    gemini_financial_chatbot.refresh_user_data(current_user["_id"])
+                    await gemini_financial_chatbot.refresh_user_data(current_user["_id"])
             else:
                 if financial_chatbot:
-                    financial_chatbot.refresh_user_data(current_user["_id"])
+                    await financial_chatbot.refresh_user_data(current_user["_id"])
             
             # [FIX] Added await
             await users_collection.update_one(
@@ -254,7 +266,6 @@ async def stream_chat_with_ai(
                     full_response += chunk_text
                     data = {"chunk": chunk_text, "done": False, "timestamp": datetime.now(UTC).isoformat()}
                     yield f"data: {json.dumps(data)}\n\n"
-                    await asyncio.sleep(0.01)
                 
                 if usage_data:
                     input_tokens = usage_data.get('input_tokens', 0)
@@ -288,7 +299,8 @@ async def stream_chat_with_ai(
             error_data = {"error": str(e).replace('Exception: ', ''), "done": True, "timestamp": datetime.now(UTC).isoformat()}
             yield f"data: {json.dumps(error_data)}\n\n"
     
-    return StreamingResponse(generate_stream(), media_type="text/plain", headers={"Cache-Control": "no-cache", "Connection": "keep-alive"})
+    # X-Accel-Buffering: stop reverse proxies from holding chunks back
+    return StreamingResponse(generate_stream(), media_type="text/plain", headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"})
 
 
 @app.post("/api/chat", response_model=ChatResponse)
@@ -359,7 +371,7 @@ async def refresh_ai_data(
         # Refresh based on provider
         if ai_provider == AIProvider.GEMINI:
             if gemini_financial_chatbot:
-                gemini_financial_chatbot.refresh_user_data(current_user["_id"])
+                await gemini_financial_chatbot.refresh_user_data(current_user["_id"])
             else:
                 raise HTTPException(
                     status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -367,7 +379,7 @@ async def refresh_ai_data(
                 )
         else:
             if financial_chatbot:
-                financial_chatbot.refresh_user_data(current_user["_id"])
+                await financial_chatbot.refresh_user_data(current_user["_id"])
             else:
                 raise HTTPException(
                     status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -889,7 +901,7 @@ async def get_unread_count(current_user: dict = Depends(get_current_user)):
 async def analyze_spending_patterns(current_user: dict = Depends(get_current_user)):
     """Manually trigger unusual spending analysis"""
     try:
-        await analyze_unusual_spending(current_user["_id"])
+        await analyze_unusual_spending([current_user["_id"]])
         return {"message": "Spending analysis completed"}
     except Exception as e:
         print(f"Error analyzing spending: {str(e)}")
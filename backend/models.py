@@ -127,6 +127,19 @@ class MultipleTransactionExtraction(BaseModel):
     analysis: Optional[str] = None
     
     
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class StatementImportResult(BaseModel):
+    total_rows: int
+    imported: int
+    duplicates: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    
+    
 class FeedbackCategory(str, Enum):
     BUG = "bug"
     FEATURE = "feature_request"
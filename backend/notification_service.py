@@ -1,9 +1,12 @@
 import asyncio
 from datetime import datetime, UTC, timedelta
-import threading
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
+import os
 import uuid
-from firebase_service import send_fcm_notification
+import numpy as np
+from pymongo.errors import BulkWriteError
+from fcm_delivery_service import fcm_delivery_queue
 from database import goals_collection, notification_preferences_collection, notifications_collection, budgets_collection, transactions_collection, users_collection
 
 
@@ -103,33 +106,35 @@ def translate(key: str, language: str, **kwargs) -> str:
     return template.format(**kwargs)
 
 
+DEFAULT_NOTIFICATION_PREFERENCES = {
+    "goal_progress": True,
+    "goal_milestone": True,
+    "goal_approaching_date": True,
+    "goal_achieved": True,
+    "budget_started": True,
+    "budget_ending_soon": True,
+    "budget_threshold": True,
+    "budget_exceeded": True,
+    "budget_auto_created": True,
+    "budget_now_active": True,
+    "large_transaction": True,
+    "unusual_spending": True,
+    "payment_reminder": True,
+    "recurring_transaction_created": True,
+    "recurring_transaction_ended": True,
+    "recurring_transaction_disabled": True,
+    "weekly_insights_generated": True,
+    "monthly_insights_generated": True,
+}
+
+
 async def get_user_notification_preferences(user_id: str) -> Dict[str, bool]:
     """Get user's notification preferences, return defaults if not set"""
     # [FIX] Added await
     prefs = await notification_preferences_collection.find_one({"user_id": user_id})
     
     if not prefs:
-        default_prefs = {
-            "goal_progress": True,
-            "goal_milestone": True,
-            "goal_approaching_date": True,
-            "goal_achieved": True,
-            "budget_started": True,
-            "budget_ending_soon": True,
-            "budget_threshold": True,
-            "budget_exceeded": True,
-            "budget_auto_created": True,
-            "budget_now_active": True,
-            "large_transaction": True,
-            "unusual_spending": True,
-            "payment_reminder": True,
-            "recurring_transaction_created": True,
-            "recurring_transaction_ended": True,
-            "recurring_transaction_disabled": True,
-            "weekly_insights_generated": True,
-            "monthly_insights_generated": True,
-        }
-        return default_prefs
+        return dict(DEFAULT_NOTIFICATION_PREFERENCES)
     
     return prefs.get("preferences", {})
 
@@ -141,6 +146,182 @@ async def should_send_notification(user_id: str, notification_type: str) -> bool
     return preferences.get(notification_type, True)
 
 
+# ==================== BATCHED CREATION ====================
+
+# Users whose preferences/tokens are prefetched together by the scheduler jobs
+NOTIFICATION_BATCH_USERS = int(os.getenv("NOTIFICATION_BATCH_USERS", "500"))
+
+class NotificationBatch:
+    """
+    Collects notifications for many users and writes them together.
+
+    prefetch() loads preferences, language and FCM token for a set of users
+    with one query per collection; add() is then synchronous, and flush()
+    inserts everything with one insert_many and hands the pushes to the
+    FCM delivery queue. Use as `async with NotificationBatch() as batch:`
+    to flush on exit.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, dict] = {}
+        self._preferences: Dict[str, Dict[str, bool]] = {}
+        self._notifications: List[dict] = []
+        self._push_data: Dict[str, dict] = {}
+
+        # Running totals across flushes
+        self.skipped = 0
+        self.duplicates = 0
+        self.pushes_queued = 0
+        self.without_token = 0
+
+    async def _load_preferences(self, user_ids: List[str]):
+        cursor = notification_preferences_collection.find(
+            {"user_id": {"$in": user_ids}},
+            {"user_id": 1, "preferences": 1}
+        )
+        async for prefs in cursor:
+            self._preferences[prefs["user_id"]] = prefs.get("preferences", {})
+
+    async def prefetch(self, user_ids):
+        """Load preferences, language and FCM token for users not loaded yet"""
+        missing = list({user_id for user_id in user_ids if user_id not in self._users})
+        if not missing:
+            return
+
+        users, _ = await asyncio.gather(
+            users_collection.find(
+                {"_id": {"$in": missing}},
+                {"language": 1, "fcm_token": 1}
+            ).to_list(length=None),
+            self._load_preferences(missing)
+        )
+
+        for user_id in missing:
+            self._users[user_id] = {}
+        for user in users:
+            self._users[user["_id"]] = user
+
+    async def load_users(self, users: List[dict]):
+        """Use user documents the caller already read (with language and fcm_token); only preferences are queried"""
+        users = [user for user in users if user["_id"] not in self._users]
+        if not users:
+            return
+        for user in users:
+            self._users[user["_id"]] = user
+        await self._load_preferences([user["_id"] for user in users])
+
+    def language(self, user_id: str) -> str:
+        return self._users.get(user_id, {}).get("language", "en")
+
+    def wants(self, user_id: str, notification_type: str) -> bool:
+        preferences = self._preferences.get(user_id, DEFAULT_NOTIFICATION_PREFERENCES)
+        return preferences.get(notification_type, True)
+
+    def add(
+        self,
+        user_id: str,
+        notification_type: str,
+        title: str,
+        message: str,
+        goal_id: Optional[str] = None,
+        goal_name: Optional[str] = None,
+        currency: Optional[str] = None,
+        notification_id: Optional[str] = None,
+        push_data: Optional[dict] = None
+    ) -> Optional[dict]:
+        """
+        Queue a notification (only if user has it enabled); user must be prefetched.
+        A fixed notification_id makes re-adding the same notification a no-op.
+        """
+        if user_id not in self._users:
+            raise ValueError(f"User {user_id} was not prefetched for this notification batch")
+
+        if not self.wants(user_id, notification_type):
+            self.skipped += 1
+            return None
+
+        notification = {
+            "_id": notification_id or str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": notification_type,
+            "title": title,
+            "message": message,
+            "goal_id": goal_id,
+            "goal_name": goal_name,
+            "currency": currency,
+            "created_at": datetime.now(UTC),
+            "is_read": False
+        }
+        self._notifications.append(notification)
+        if push_data:
+            self._push_data[notification["_id"]] = push_data
+        return notification
+
+    async def _insert(self, notifications: List[dict]) -> List[dict]:
+        """insert_many, tolerating notifications that already exist (fixed ids)"""
+        try:
+            await notifications_collection.insert_many(notifications, ordered=False)
+            return notifications
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            duplicate_indexes = {error["index"] for error in errors}
+            self.duplicates += len(duplicate_indexes)
+            return [n for index, n in enumerate(notifications) if index not in duplicate_indexes]
+
+    async def flush(self) -> List[dict]:
+        """Insert queued notifications and send their pushes; returns what was inserted"""
+        notifications, self._notifications = self._notifications, []
+        push_data, self._push_data = self._push_data, {}
+        if not notifications:
+            return []
+
+        notifications = await self._insert(notifications)
+
+        pushes = []
+        for notification in notifications:
+            fcm_token = self._users.get(notification["user_id"], {}).get("fcm_token")
+            if not fcm_token:
+                self.without_token += 1
+                continue
+            pushes.append({
+                "token": fcm_token,
+                "title": notification["title"],
+                "body": notification["message"],
+                "data": {
+                    "notification_id": notification["_id"],
+                    "type": notification["type"],
+                    "goal_id": notification["goal_id"] or "",
+                    "goal_name": notification["goal_name"] or "",
+                    "currency": notification["currency"] or "",
+                    **push_data.get(notification["_id"], {})
+                }
+            })
+        if pushes:
+            fcm_delivery_queue.enqueue_many(pushes)
+            self.pushes_queued += len(pushes)
+
+        print(f"✅ Created {len(notifications)} notification(s), {len(pushes)} push(es) queued")
+        return notifications
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
+
+
+@asynccontextmanager
+async def notification_scope(batch: Optional[NotificationBatch] = None):
+    """Yield the caller's batch, or a new one that is flushed when the block exits"""
+    if batch is not None:
+        yield batch
+    else:
+        async with NotificationBatch() as own_batch:
+            yield own_batch
+
+
 async def create_notification(
     user_id: str,
     notification_type: str,
@@ -151,118 +332,58 @@ async def create_notification(
     currency: Optional[str] = None
 ) -> Optional[dict]:
     """Create a new notification (only if user has it enabled)"""
-    
-    # [FIX] Added await
-    if not await should_send_notification(user_id, notification_type):
-        print(f"Skipping notification {notification_type} for user {user_id} (disabled in preferences)")
-        return None
-    
-    notification_id = str(uuid.uuid4())
-    notification = {
-        "_id": notification_id,
-        "user_id": user_id,
-        "type": notification_type,
-        "title": title,
-        "message": message,
-        "goal_id": goal_id,
-        "goal_name": goal_name,
-        "currency": currency,
-        "created_at": datetime.now(UTC),
-        "is_read": False
-    }
-    
-    # [FIX] Added await
-    await notifications_collection.insert_one(notification)
-    print(f"✅ Created notification {notification_type} for user {user_id}")
-    
-    # [FIX] Fetch user data ASYNC before starting the thread
-    # This prevents running async DB calls inside the sync thread
-    user = await users_collection.find_one({"_id": user_id})
-    fcm_token = user.get("fcm_token") if user else None
-
-    # Send FCM push notification in a separate thread
-    def send_background_fcm():
-        try:
-            if fcm_token:
-                fcm_data = {
-                    "notification_id": notification_id,
-                    "type": notification_type,
-                    "goal_id": goal_id or "",
-                    "goal_name": goal_name or "",
-                    "currency": currency or "",
-                }
-                
-                send_fcm_notification(
-                    fcm_token=fcm_token,
-                    title=title,
-                    body=message,
-                    data=fcm_data
-                )
-            else:
-                print(f"⚠️  User {user_id} has no FCM token")
-        except Exception as e:
-            print(f"❌ Error sending background FCM: {e}")
-
-    # [FIX] Fire and forget using the event loop's thread pool
-    # This prevents blocking the async loop while keeping execution managed
-    try:
-        loop = asyncio.get_running_loop()
-        # Schedule the blocking sync function in a separate thread, managed by the loop
-        loop.create_task(asyncio.to_thread(send_background_fcm))
-    except RuntimeError:
-        # Fallback if no loop is running (e.g., synchronous testing context)
-        threading.Thread(target=send_background_fcm, daemon=True).start()
-    
+    batch = NotificationBatch()
+    await batch.prefetch([user_id])
+    notification = batch.add(user_id, notification_type, title, message, goal_id, goal_name, currency)
+    await batch.flush()
     return notification
 
 
-async def check_goal_notifications(user_id: str, goal_id: str, old_progress: float, new_progress: float, goal_name: str):
+async def check_goal_notifications(user_id: str, goal_id: str, old_progress: float, new_progress: float, goal_name: str, batch: Optional[NotificationBatch] = None):
     """Check and create notifications based on goal progress"""
     # [FIX] Added await
     goal = await goals_collection.find_one({"_id": goal_id})
     currency = goal.get("currency", "usd") if goal else "usd"
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
     
     milestones = [25, 50, 75, 100]
     
-    for milestone in milestones:
-        if old_progress < milestone <= new_progress:
-            if milestone == 100:
-                title = translate("goal_achieved_title", lang)
-                message = translate("goal_achieved_msg", lang, goal_name=goal_name)
-                # [FIX] Added await
-                await create_notification(
-                    user_id=user_id,
-                    notification_type="goal_achieved",
-                    title=title,
-                    message=message,
-                    goal_id=goal_id,
-                    goal_name=goal_name,
-                    currency=currency
-                )
-            elif milestone in [25, 50, 75]:
-                emoji = "💪" if milestone == 25 else "🎯" if milestone == 50 else "🎉"
-                title = translate("goal_progress_title", lang, milestone=milestone, emoji=emoji)
-                message = translate("goal_progress_msg", lang, milestone=milestone, goal_name=goal_name)
-                # [FIX] Added await
-                await create_notification(
-                    user_id=user_id,
-                    notification_type="goal_progress",
-                    title=title,
-                    message=message,
-                    goal_id=goal_id,
-                    goal_name=goal_name,
-                    currency=currency
-                )
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        for milestone in milestones:
+            if old_progress < milestone <= new_progress:
+                if milestone == 100:
+                    title = translate("goal_achieved_title", lang)
+                    message = translate("goal_achieved_msg", lang, goal_name=goal_name)
+                    notifications.add(
+                        user_id=user_id,
+                        notification_type="goal_achieved",
+                        title=title,
+                        message=message,
+                        goal_id=goal_id,
+                        goal_name=goal_name,
+                        currency=currency
+                    )
+                elif milestone in [25, 50, 75]:
+                    emoji = "💪" if milestone == 25 else "🎯" if milestone == 50 else "🎉"
+                    title = translate("goal_progress_title", lang, milestone=milestone, emoji=emoji)
+                    message = translate("goal_progress_msg", lang, milestone=milestone, goal_name=goal_name)
+                    notifications.add(
+                        user_id=user_id,
+                        notification_type="goal_progress",
+                        title=title,
+                        message=message,
+                        goal_id=goal_id,
+                        goal_name=goal_name,
+                        currency=currency
+                    )
 
-async def check_milestone_amount(user_id: str, goal_id: str, old_amount: float, new_amount: float, goal_name: str):
+async def check_milestone_amount(user_id: str, goal_id: str, old_amount: float, new_amount: float, goal_name: str, batch: Optional[NotificationBatch] = None):
     """Check for milestone amounts (every $1000 or 1M K)"""
     # [FIX] Added await
     goal = await goals_collection.find_one({"_id": goal_id})
     currency = goal.get("currency", "usd") if goal else "usd"
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
     
     milestone_interval = 1000000 if currency == "mmk" else 1000
     
@@ -273,27 +394,39 @@ async def check_milestone_amount(user_id: str, goal_id: str, old_amount: float,
         milestone_amount = new_milestone * milestone_interval
         formatted_amount = format_currency_amount(milestone_amount, currency)
         
-        title = translate("goal_milestone_title", lang)
-        message = translate("goal_milestone_msg", lang, amount=formatted_amount, goal_name=goal_name)
-        
-        # [FIX] Added await
-        await create_notification(
-            user_id=user_id,
-            notification_type="goal_milestone",
-            title=title,
-            message=message,
-            goal_id=goal_id,
-            goal_name=goal_name,
-            currency=currency
-        )
+        async with notification_scope(batch) as notifications:
+            await notifications.prefetch([user_id])
+            lang = notifications.language(user_id)
+            
+            title = translate("goal_milestone_title", lang)
+            message = translate("goal_milestone_msg", lang, amount=formatted_amount, goal_name=goal_name)
+            
+            notifications.add(
+                user_id=user_id,
+                notification_type="goal_milestone",
+                title=title,
+                message=message,
+                goal_id=goal_id,
+                goal_name=goal_name,
+                currency=currency
+            )
+
+
+async def _recently_notified(notification_type: str, goal_ids: List[str], since: Optional[datetime] = None) -> set:
+    """(user_id, goal_id) pairs that already have a `notification_type` notification"""
+    if not goal_ids:
+        return set()
+    query = {"type": notification_type, "goal_id": {"$in": goal_ids}}
+    if since is not None:
+        query["created_at"] = {"$gte": since}
+    cursor = notifications_collection.find(query, {"user_id": 1, "goal_id": 1})
+    return {(doc["user_id"], doc["goal_id"]) async for doc in cursor}
 
 
 async def check_approaching_target_dates():
     """Check all goals for approaching target dates (run daily)"""
     now = datetime.now(UTC)
     two_weeks_from_now = now + timedelta(days=14)
-    one_week_from_now = now + timedelta(days=7)
-    three_days_from_now = now + timedelta(days=3)
     
     # [FIX] Async cursor
     cursor = goals_collection.find({
@@ -305,90 +438,106 @@ async def check_approaching_target_dates():
     })
     
     goals = await cursor.to_list(length=None)
+    due_goals = [goal for goal in goals if (goal["target_date"] - now).days in (14, 7, 3)]
+    if not due_goals:
+        return
     
-    for goal in goals:
-        target_date = goal["target_date"]
-        user_id = goal["user_id"]
-        goal_id = goal["_id"]
-        goal_name = goal["name"]
-        remaining = goal["target_amount"] - goal["current_amount"]
-        currency = goal.get("currency", "usd")
-        # [FIX] Added await
-        lang = await get_user_language(user_id)
-        
-        days_until = (target_date - now).days
+    already_notified = await _recently_notified(
+        "goal_approaching_date",
+        [goal["_id"] for goal in due_goals],
+        since=now - timedelta(hours=24)
+    )
+    
+    async with NotificationBatch() as notifications:
+        await notifications.prefetch(goal["user_id"] for goal in due_goals)
         
-        if days_until == 14 or days_until == 7 or days_until == 3:
-            # [FIX] Added await
-            existing = await notifications_collection.find_one({
-                "user_id": user_id,
-                "goal_id": goal_id,
-                "type": "goal_approaching_date",
-                "created_at": {"$gte": now - timedelta(hours=24)}
-            })
+        for goal in due_goals:
+            user_id = goal["user_id"]
+            goal_id = goal["_id"]
+            if (user_id, goal_id) in already_notified:
+                continue
             
-            if not existing:
-                time_text = f"{days_until} days" if days_until > 1 else "1 day"
-                formatted_remaining = format_currency_amount(remaining, currency)
-                
-                title = translate("goal_approaching_title", lang)
-                
-                if remaining > 0:
-                    message = translate("goal_approaching_msg_with_remaining", lang, 
-                                      goal_name=goal_name, days=time_text, remaining=formatted_remaining)
-                else:
-                    message = translate("goal_approaching_msg_achieved", lang, 
-                                      goal_name=goal_name, days=time_text)
-                
-                # [FIX] Added await
-                await create_notification(
-                    user_id=user_id,
-                    notification_type="goal_approaching_date",
-                    title=title,
-                    message=message,
-                    goal_id=goal_id,
-                    goal_name=goal_name,
-                    currency=currency
-                )
+            goal_name = goal["name"]
+            remaining = goal["target_amount"] - goal["current_amount"]
+            currency = goal.get("currency", "usd")
+            lang = notifications.language(user_id)
+            days_until = (goal["target_date"] - now).days
+            
+            time_text = f"{days_until} days" if days_until > 1 else "1 day"
+            formatted_remaining = format_currency_amount(remaining, currency)
+            
+            title = translate("goal_approaching_title", lang)
+            
+            if remaining > 0:
+                message = translate("goal_approaching_msg_with_remaining", lang, 
+                                  goal_name=goal_name, days=time_text, remaining=formatted_remaining)
+            else:
+                message = translate("goal_approaching_msg_achieved", lang, 
+                                  goal_name=goal_name, days=time_text)
+            
+            notifications.add(
+                user_id=user_id,
+                notification_type="goal_approaching_date",
+                title=title,
+                message=message,
+                goal_id=goal_id,
+                goal_name=goal_name,
+                currency=currency
+            )
 
 
-async def check_budget_notifications(user_id: str, budget_id: str, old_percentage: float, new_percentage: float, budget_name: str, category_name: str = None):
+async def check_budget_notifications(
+    user_id: str,
+    budget_id: str,
+    old_percentage: float,
+    new_percentage: float,
+    budget_name: str,
+    category_name: str = None,
+    batch: Optional[NotificationBatch] = None,
+    currency: Optional[str] = None
+):
     """Check and create budget threshold/exceeded notifications"""
-    # [FIX] Added await
-    budget = await budgets_collection.find_one({"_id": budget_id})
-    currency = budget.get("currency", "usd") if budget else "usd"
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
-    
-    budget_label = f"'{category_name}'" if category_name else ("overall" if lang == "en" else "စုစုပေါင်း")
+    crossed_threshold = old_percentage < 80 <= new_percentage < 100
+    crossed_limit = old_percentage < 100 <= new_percentage
+    if not crossed_threshold and not crossed_limit:
+        return
     
-    if old_percentage < 80 <= new_percentage < 100:
-        title = translate("budget_threshold_title", lang)
-        message = translate("budget_threshold_msg", lang, label=budget_label, budget_name=budget_name)
+    if currency is None:
         # [FIX] Added await
-        await create_notification(
-            user_id=user_id,
-            notification_type="budget_threshold",
-            title=title,
-            message=message,
-            goal_id=budget_id,
-            goal_name=budget_name,
-            currency=currency
-        )
+        budget = await budgets_collection.find_one({"_id": budget_id}, {"currency": 1})
+        currency = budget.get("currency", "usd") if budget else "usd"
     
-    if old_percentage < 100 <= new_percentage:
-        title = translate("budget_exceeded_title", lang)
-        message = translate("budget_exceeded_msg", lang, label=budget_label, budget_name=budget_name)
-        # [FIX] Added await
-        await create_notification(
-            user_id=user_id,
-            notification_type="budget_exceeded",
-            title=title,
-            message=message,
-            goal_id=budget_id,
-            goal_name=budget_name,
-            currency=currency
-        )
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        budget_label = f"'{category_name}'" if category_name else ("overall" if lang == "en" else "စုစုပေါင်း")
+        
+        if crossed_threshold:
+            title = translate("budget_threshold_title", lang)
+            message = translate("budget_threshold_msg", lang, label=budget_label, budget_name=budget_name)
+            notifications.add(
+                user_id=user_id,
+                notification_type="budget_threshold",
+                title=title,
+                message=message,
+                goal_id=budget_id,
+                goal_name=budget_name,
+                currency=currency
+            )
+        
+        if crossed_limit:
+            title = translate("budget_exceeded_title", lang)
+            message = translate("budget_exceeded_msg", lang, label=budget_label, budget_name=budget_name)
+            notifications.add(
+                user_id=user_id,
+                notification_type="budget_exceeded",
+                title=title,
+                message=message,
+                goal_id=budget_id,
+                goal_name=budget_name,
+                currency=currency
+            )
 
 
 async def check_budget_period_notifications():
@@ -404,41 +553,10 @@ async def check_budget_period_notifications():
             "$lte": three_days_from_now
         }
     })
-    budgets_ending = await cursor_ending.to_list(length=None)
-    
-    for budget in budgets_ending:
-        user_id = budget["user_id"]
-        budget_id = budget["_id"]
-        budget_name = budget["name"]
-        end_date = budget["end_date"]
-        currency = budget.get("currency", "usd")
-        # [FIX] Added await
-        lang = await get_user_language(user_id)
-        
-        days_until_end = (end_date - now).days
-        
-        if days_until_end == 3:
-            # [FIX] Added await
-            existing = await notifications_collection.find_one({
-                "user_id": user_id,
-                "goal_id": budget_id,
-                "type": "budget_ending_soon",
-                "created_at": {"$gte": now - timedelta(hours=24)}
-            })
-            
-            if not existing:
-                title = translate("budget_ending_soon_title", lang)
-                message = translate("budget_ending_soon_msg", lang, budget_name=budget_name)
-                # [FIX] Added await
-                await create_notification(
-                    user_id=user_id,
-                    notification_type="budget_ending_soon",
-                    title=title,
-                    message=message,
-                    goal_id=budget_id,
-                    goal_name=budget_name,
-                    currency=currency
-                )
+    budgets_ending = [
+        budget for budget in await cursor_ending.to_list(length=None)
+        if (budget["end_date"] - now).days == 3
+    ]
     
     # [FIX] Async cursor
     cursor_active = budgets_collection.find({
@@ -447,28 +565,56 @@ async def check_budget_period_notifications():
     })
     budgets_now_active = await cursor_active.to_list(length=None)
     
-    for budget in budgets_now_active:
-        user_id = budget["user_id"]
-        budget_id = budget["_id"]
-        budget_name = budget["name"]
-        total_budget = budget["total_budget"]
-        currency = budget.get("currency", "usd")
-        # [FIX] Added await
-        lang = await get_user_language(user_id)
-        formatted_budget = format_currency_amount(total_budget, currency)
+    if not budgets_ending and not budgets_now_active:
+        return
+    
+    ending_notified = await _recently_notified(
+        "budget_ending_soon",
+        [budget["_id"] for budget in budgets_ending],
+        since=now - timedelta(hours=24)
+    )
+    active_notified = await _recently_notified(
+        "budget_now_active",
+        [budget["_id"] for budget in budgets_now_active]
+    )
+    
+    async with NotificationBatch() as notifications:
+        await notifications.prefetch(budget["user_id"] for budget in budgets_ending + budgets_now_active)
         
-        # [FIX] Added await
-        existing = await notifications_collection.find_one({
-            "user_id": user_id,
-            "goal_id": budget_id,
-            "type": "budget_now_active"
-        })
+        for budget in budgets_ending:
+            user_id = budget["user_id"]
+            budget_id = budget["_id"]
+            if (user_id, budget_id) in ending_notified:
+                continue
+            
+            budget_name = budget["name"]
+            lang = notifications.language(user_id)
+            title = translate("budget_ending_soon_title", lang)
+            message = translate("budget_ending_soon_msg", lang, budget_name=budget_name)
+            notifications.add(
+                user_id=user_id,
+                notification_type="budget_ending_soon",
+                title=title,
+                message=message,
+                goal_id=budget_id,
+                goal_name=budget_name,
+                currency=budget.get("currency", "usd")
+            )
         
-        if not existing:
+        for budget in budgets_now_active:
+            user_id = budget["user_id"]
+            budget_id = budget["_id"]
+            if (user_id, budget_id) in active_notified:
+                continue
+            
+            budget_name = budget["name"]
+            currency = budget.get("currency", "usd")
+            lang = notifications.language(user_id)
+            formatted_budget = format_currency_amount(budget["total_budget"], currency)
+            
             title = translate("budget_now_active_title", lang)
             message = translate("budget_now_active_msg", lang, budget_name=budget_name, amount=formatted_budget)
-            # [FIX] Added await
-            await create_notification(
+            notifications.add(
                 user_id=user_id,
                 notification_type="budget_now_active",
                 title=title,
@@ -479,55 +625,57 @@ async def check_budget_period_notifications():
             )
 
 
-async def notify_budget_started(user_id: str, budget_id: str, budget_name: str, total_budget: float, period: str):
+async def notify_budget_started(user_id: str, budget_id: str, budget_name: str, total_budget: float, period: str, batch: Optional[NotificationBatch] = None):
     """Notify when a new budget is created and started"""
     # [FIX] Added await
     budget = await budgets_collection.find_one({"_id": budget_id})
     currency = budget.get("currency", "usd") if budget else "usd"
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
     formatted_budget = format_currency_amount(total_budget, currency)
     
-    title = translate("budget_started_title", lang)
-    message = translate("budget_started_msg", lang, budget_name=budget_name, period=period, amount=formatted_budget)
-    
-    # [FIX] Added await
-    await create_notification(
-        user_id=user_id,
-        notification_type="budget_started",
-        title=title,
-        message=message,
-        goal_id=budget_id,
-        goal_name=budget_name,
-        currency=currency
-    )
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        title = translate("budget_started_title", lang)
+        message = translate("budget_started_msg", lang, budget_name=budget_name, period=period, amount=formatted_budget)
+        
+        notifications.add(
+            user_id=user_id,
+            notification_type="budget_started",
+            title=title,
+            message=message,
+            goal_id=budget_id,
+            goal_name=budget_name,
+            currency=currency
+        )
 
 
-async def notify_budget_auto_created(user_id: str, budget_id: str, budget_name: str, was_ai: bool):
+async def notify_budget_auto_created(user_id: str, budget_id: str, budget_name: str, was_ai: bool, batch: Optional[NotificationBatch] = None):
     """Notify when a budget is auto-created"""
     # [FIX] Added await
     budget = await budgets_collection.find_one({"_id": budget_id})
     currency = budget.get("currency", "usd") if budget else "usd"
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
-    
-    title = translate("budget_auto_created_title", lang)
     
-    if was_ai:
-        message = translate("budget_auto_created_msg_ai", lang, budget_name=budget_name)
-    else:
-        message = translate("budget_auto_created_msg", lang, budget_name=budget_name)
-    
-    # [FIX] Added await
-    await create_notification(
-        user_id=user_id,
-        notification_type="budget_auto_created",
-        title=title,
-        message=message,
-        goal_id=budget_id,
-        goal_name=budget_name,
-        currency=currency
-    )
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        title = translate("budget_auto_created_title", lang)
+        
+        if was_ai:
+            message = translate("budget_auto_created_msg_ai", lang, budget_name=budget_name)
+        else:
+            message = translate("budget_auto_created_msg", lang, budget_name=budget_name)
+        
+        notifications.add(
+            user_id=user_id,
+            notification_type="budget_auto_created",
+            title=title,
+            message=message,
+            goal_id=budget_id,
+            goal_name=budget_name,
+            currency=currency
+        )
 
 
 async def check_large_transaction(user_id: str, transaction: Dict, user_spending_profile: Dict = None):
@@ -537,8 +685,6 @@ async def check_large_transaction(user_id: str, transaction: Dict, user_spending
     category = transaction["main_category"]
     description = transaction.get("description", "")
     currency = transaction.get("currency", "usd")
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
     
     if transaction_type != "outflow":
         return
@@ -558,246 +704,377 @@ async def check_large_transaction(user_id: str, transaction: Dict, user_spending
         })
         
         if not existing:
-            merchant_info = f" at {description}" if description else ""
-            if lang == "my" and description:
-                merchant_info = f" {description} တွင်"
-            
-            formatted_amount = format_currency_amount(amount, currency)
-            
-            title = translate("large_transaction_title", lang)
-            message = translate("large_transaction_msg", lang, 
-                              amount=formatted_amount, merchant=merchant_info, category=category)
-            
-            # [FIX] Added await
-            await create_notification(
-                user_id=user_id,
-                notification_type="large_transaction",
-                title=title,
-                message=message,
-                goal_id=transaction["_id"],
-                goal_name=f"Large {category} expense",
-                currency=currency
-            )
+            async with NotificationBatch() as notifications:
+                await notifications.prefetch([user_id])
+                lang = notifications.language(user_id)
+                
+                merchant_info = f" at {description}" if description else ""
+                if lang == "my" and description:
+                    merchant_info = f" {description} တွင်"
+                
+                formatted_amount = format_currency_amount(amount, currency)
+                
+                title = translate("large_transaction_title", lang)
+                message = translate("large_transaction_msg", lang, 
+                                  amount=formatted_amount, merchant=merchant_info, category=category)
+                
+                notifications.add(
+                    user_id=user_id,
+                    notification_type="large_transaction",
+                    title=title,
+                    message=message,
+                    goal_id=transaction["_id"],
+                    goal_name=f"Large {category} expense",
+                    currency=currency
+                )
 
 
-async def analyze_unusual_spending(user_id: str):
-    """Analyze spending patterns and notify about unusual activity"""
-    from collections import defaultdict
-    
-    now = datetime.now(UTC)
-    # [FIX] Async distinct
-    currencies = await transactions_collection.distinct("currency", {"user_id": user_id})
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
-    
-    for currency in currencies:
-        this_week_start = now - timedelta(days=7)
-        # [FIX] Async cursor
-        cursor = transactions_collection.find({
-            "user_id": user_id,
-            "type": "outflow",
-            "currency": currency,
-            "date": {"$gte": this_week_start}
-        })
-        this_week_transactions = await cursor.to_list(length=None)
-        
-        last_month_start = now - timedelta(days=35)
-        last_month_end = this_week_start
-        # [FIX] Async cursor
-        cursor = transactions_collection.find({
-            "user_id": user_id,
-            "type": "outflow",
-            "currency": currency,
-            "date": {"$gte": last_month_start, "$lt": last_month_end}
-        })
-        last_month_transactions = await cursor.to_list(length=None)
-        
-        if len(last_month_transactions) < 5:
-            continue
-        
-        this_week_by_category = defaultdict(float)
-        last_month_by_category = defaultdict(float)
-        
-        for t in this_week_transactions:
-            this_week_by_category[t["main_category"]] += t["amount"]
-        
-        for t in last_month_transactions:
-            last_month_by_category[t["main_category"]] += t["amount"]
-        
-        weeks_in_last_month = 4
-        
-        for category, this_week_amount in this_week_by_category.items():
-            if category not in last_month_by_category:
+# A category is unusual when this week's spend exceeds the trailing weekly
+# average by this ratio and by at least the per-currency minimum difference
+UNUSUAL_SPENDING_RATIO = 1.5
+UNUSUAL_SPENDING_BASELINE_WEEKS = 4
+# Users need this many outflows in the baseline window (per currency) to be judged
+UNUSUAL_SPENDING_MIN_BASELINE_TRANSACTIONS = 5
+
+
+async def find_unusual_spending(user_ids: Optional[List[str]] = None, now: Optional[datetime] = None) -> List[dict]:
+    """
+    This week vs trailing 4-week category totals for every user (or just
+    `user_ids`) in one aggregation; returns the categories that break the rule.
+    """
+    now = now or datetime.now(UTC)
+    this_week_start = now - timedelta(days=7)
+    baseline_start = this_week_start - timedelta(weeks=UNUSUAL_SPENDING_BASELINE_WEEKS)
+
+    match = {"type": "outflow", "date": {"$gte": baseline_start}}
+    if user_ids is not None:
+        match["user_id"] = {"$in": user_ids}
+
+    pipeline = [
+        {"$match": match},
+        {"$project": {
+            "user_id": 1,
+            "currency": 1,
+            "main_category": 1,
+            "amount": 1,
+            "this_week": {"$gte": ["$date", this_week_start]}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "currency": "$currency", "category": "$main_category"},
+            "this_week": {"$sum": {"$cond": ["$this_week", "$amount", 0]}},
+            "baseline": {"$sum": {"$cond": ["$this_week", 0, "$amount"]}},
+            "baseline_count": {"$sum": {"$cond": ["$this_week", 0, 1]}}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "currency": "$_id.currency"},
+            "baseline_count": {"$sum": "$baseline_count"},
+            "categories": {"$push": {
+                "category": "$_id.category",
+                "this_week": "$this_week",
+                "baseline": "$baseline",
+                "baseline_count": "$baseline_count"
+            }}
+        }},
+        {"$match": {"baseline_count": {"$gte": UNUSUAL_SPENDING_MIN_BASELINE_TRANSACTIONS}}}
+    ]
+
+    flagged = []
+    async for group in transactions_collection.aggregate(pipeline, allowDiskUse=True):
+        currency = group["_id"]["currency"]
+        min_diff = 50000 if currency == "mmk" else 50
+        for category in group["categories"]:
+            # Only categories with spending both this week and in the baseline
+            if not category["this_week"] or not category["baseline_count"]:
                 continue
-            
-            weekly_avg = last_month_by_category[category] / weeks_in_last_month
-            min_diff = 50000 if currency == "mmk" else 50
-            
-            if this_week_amount > weekly_avg * 1.5 and this_week_amount - weekly_avg > min_diff:
-                # [FIX] Added await
-                existing = await notifications_collection.find_one({
-                    "user_id": user_id,
-                    "type": "unusual_spending",
-                    "goal_name": category,
+            weekly_avg = category["baseline"] / UNUSUAL_SPENDING_BASELINE_WEEKS
+            this_week_amount = category["this_week"]
+            if this_week_amount > weekly_avg * UNUSUAL_SPENDING_RATIO and this_week_amount - weekly_avg > min_diff:
+                flagged.append({
+                    "user_id": group["_id"]["user_id"],
                     "currency": currency,
-                    "created_at": {"$gte": this_week_start}
+                    "category": category["category"],
+                    "this_week": this_week_amount,
+                    "weekly_avg": weekly_avg
                 })
-                
-                if not existing:
-                    formatted_this_week = format_currency_amount(this_week_amount, currency)
-                    formatted_avg = format_currency_amount(weekly_avg, currency)
-                    
+    return flagged
+
+
+async def analyze_unusual_spending(user_ids: Optional[List[str]] = None, batch: Optional[NotificationBatch] = None) -> int:
+    """Notify about unusual spending for every user (or just `user_ids`); returns notifications queued"""
+    started = datetime.now(UTC)
+    this_week_start = started - timedelta(days=7)
+    flagged = await find_unusual_spending(user_ids, now=started)
+
+    if flagged:
+        # One dedupe query for everything flagged this run
+        cursor = notifications_collection.find(
+            {
+                "user_id": {"$in": list({item["user_id"] for item in flagged})},
+                "type": "unusual_spending",
+                "created_at": {"$gte": this_week_start}
+            },
+            {"user_id": 1, "goal_name": 1, "currency": 1}
+        )
+        already_notified = {(doc["user_id"], doc.get("goal_name"), doc.get("currency")) async for doc in cursor}
+        flagged = [
+            item for item in flagged
+            if (item["user_id"], item["category"], item["currency"]) not in already_notified
+        ]
+
+    by_user: Dict[str, List[dict]] = {}
+    for item in flagged:
+        by_user.setdefault(item["user_id"], []).append(item)
+    flagged_users = list(by_user)
+
+    queued = 0
+    for chunk_start in range(0, len(flagged_users), NOTIFICATION_BATCH_USERS):
+        chunk = flagged_users[chunk_start:chunk_start + NOTIFICATION_BATCH_USERS]
+        async with notification_scope(batch) as notifications:
+            await notifications.prefetch(chunk)
+            for user_id in chunk:
+                lang = notifications.language(user_id)
+                for item in by_user[user_id]:
                     title = translate("unusual_spending_title", lang)
-                    message = translate("unusual_spending_msg", lang, 
-                                      category=category, this_week=formatted_this_week, avg=formatted_avg)
-                    
-                    # [FIX] Added await
-                    await create_notification(
+                    message = translate("unusual_spending_msg", lang,
+                                        category=item["category"],
+                                        this_week=format_currency_amount(item["this_week"], item["currency"]),
+                                        avg=format_currency_amount(item["weekly_avg"], item["currency"]))
+                    if notifications.add(
                         user_id=user_id,
                         notification_type="unusual_spending",
                         title=title,
                         message=message,
                         goal_id=None,
-                        goal_name=category,
-                        currency=currency
-                    )
+                        goal_name=item["category"],
+                        currency=item["currency"]
+                    ):
+                        queued += 1
+
+    elapsed = (datetime.now(UTC) - started).total_seconds()
+    print(f"✅ Unusual spending: {len(flagged)} new finding(s) for {len(flagged_users)} user(s), {queued} notification(s) in {elapsed:.1f}s")
+    return queued
+
+
+# Users per detection shard (one aggregation + one notification batch each)
+RECURRING_PAYMENT_SHARD_USERS = int(os.getenv("RECURRING_PAYMENT_SHARD_USERS", "500"))
+# Shards analyzed at the same time
+RECURRING_PAYMENT_CONCURRENCY = int(os.getenv("RECURRING_PAYMENT_CONCURRENCY", "4"))
+RECURRING_PAYMENT_LOOKBACK_DAYS = 90
+# Users need this many outflows (per currency) in the lookback window to be analyzed
+RECURRING_PAYMENT_MIN_TRANSACTIONS = 10
+# Descriptions too generic to identify a payment
+RECURRING_PAYMENT_GENERIC_KEYS = ["payment", "purchase", "expense"]
+
+
+def _recurring_payment_pipeline(user_ids: List[str], since: datetime) -> list:
+    """Per user/currency, the outflows grouped by description with their dates in order"""
+    return [
+        {"$match": {"user_id": {"$in": user_ids}, "type": "outflow", "date": {"$gte": since}}},
+        {"$sort": {"date": 1}},
+        {"$project": {
+            "user_id": 1,
+            "currency": 1,
+            "date": 1,
+            "amount": 1,
+            "description": {"$ifNull": ["$description", "$sub_category"]},
+            # Lowercased description, or the sub category when there is none
+            "key": {"$let": {
+                "vars": {"description": {"$trim": {"input": {"$toLower": {"$ifNull": ["$description", ""]}}}}},
+                "in": {"$cond": [{"$eq": ["$$description", ""]}, {"$toLower": "$sub_category"}, "$$description"]}
+            }}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "currency": "$currency", "key": "$key"},
+            "dates": {"$push": "$date"},
+            "last_amount": {"$last": "$amount"},
+            "last_description": {"$last": "$description"}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "currency": "$_id.currency"},
+            "transactions": {"$sum": {"$size": "$dates"}},
+            "patterns": {"$push": {
+                "key": "$_id.key",
+                "dates": "$dates",
+                "last_amount": "$last_amount",
+                "last_description": "$last_description"
+            }}
+        }},
+        {"$match": {"transactions": {"$gte": RECURRING_PAYMENT_MIN_TRANSACTIONS}}},
+        {"$project": {
+            "patterns": {"$filter": {
+                "input": "$patterns",
+                "cond": {"$and": [
+                    {"$gte": [{"$size": "$$this.dates"}, 2]},
+                    {"$gte": [{"$strLenCP": "$$this.key"}, 3]},
+                    {"$not": [{"$in": ["$$this.key", RECURRING_PAYMENT_GENERIC_KEYS]}]}
+                ]}
+            }}
+        }},
+        {"$match": {"patterns.0": {"$exists": True}}}
+    ]
+
+
+def find_due_recurring_payments(groups: List[dict], now: datetime) -> List[dict]:
+    """
+    Monthly patterns (average interval 28-32 days) whose next payment is due
+    in 2-4 days. Interval statistics for every pattern are computed at once.
+    """
+    patterns = [(group["_id"], pattern) for group in groups for pattern in group["patterns"]]
+    if not patterns:
+        return []
+
+    # All dates end to end; pattern i occupies starts[i]:starts[i] + counts[i]
+    counts = np.array([len(pattern["dates"]) for _, pattern in patterns])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    seconds = np.array([
+        # Motor returns naive UTC datetimes
+        (date if date.tzinfo else date.replace(tzinfo=UTC)).timestamp()
+        for _, pattern in patterns for date in pattern["dates"]
+    ])
+
+    # Whole days between consecutive payments; the gap from one pattern's
+    # last date to the next pattern's first date is zeroed out
+    intervals = np.append(np.diff(seconds) // 86400, 0)
+    intervals[starts[1:] - 1] = 0
+    avg_interval = np.add.reduceat(intervals, starts) / (counts - 1)
+
+    last_seconds = seconds[starts + counts - 1]
+    days_until = (last_seconds + np.floor(avg_interval) * 86400 - now.timestamp()) // 86400
+
+    due = (avg_interval >= 28) & (avg_interval <= 32) & (days_until >= 2) & (days_until <= 4)
+    return [
+        {
+            "user_id": patterns[i][0]["user_id"],
+            "currency": patterns[i][0]["currency"],
+            "key": patterns[i][1]["key"],
+            "description": patterns[i][1]["last_description"],
+            "amount": patterns[i][1]["last_amount"],
+            "days_until": int(days_until[i])
+        }
+        for i in np.flatnonzero(due)
+    ]
+
+
+async def _detect_recurring_payments_shard(users: List[dict], now: datetime) -> int:
+    """Analyze one shard of users and queue their reminders; returns notifications created"""
+    since = now - timedelta(days=RECURRING_PAYMENT_LOOKBACK_DAYS)
+    groups = await transactions_collection.aggregate(
+        _recurring_payment_pipeline([user["_id"] for user in users], since),
+        allowDiskUse=True
+    ).to_list(length=None)
+    due = find_due_recurring_payments(groups, now)
+    if not due:
+        return 0
+
+    due_users = {item["user_id"] for item in due}
+    cursor = notifications_collection.find(
+        {
+            "user_id": {"$in": list(due_users)},
+            "type": "payment_reminder",
+            "created_at": {"$gte": now - timedelta(days=7)}
+        },
+        {"user_id": 1, "goal_name": 1, "currency": 1}
+    )
+    already_notified = {(doc["user_id"], doc.get("goal_name"), doc.get("currency")) async for doc in cursor}
+
+    async with NotificationBatch() as notifications:
+        await notifications.load_users([user for user in users if user["_id"] in due_users])
+        for item in due:
+            if (item["user_id"], item["key"], item["currency"]) in already_notified:
+                continue
+            lang = notifications.language(item["user_id"])
+            title = translate("payment_reminder_title", lang)
+            message = translate("payment_reminder_msg", lang,
+                                description=item["description"],
+                                amount=format_currency_amount(item["amount"], item["currency"]),
+                                days=item["days_until"])
+            notifications.add(
+                user_id=item["user_id"],
+                notification_type="payment_reminder",
+                title=title,
+                message=message,
+                goal_id=None,
+                goal_name=item["key"],
+                currency=item["currency"]
+            )
+        created = await notifications.flush()
+    return len(created)
 
 
 async def detect_and_notify_recurring_payments():
-    """Detect recurring payments and send reminders"""
-    from collections import defaultdict
-    
+    """Detect recurring payments and send reminders, a shard of users at a time"""
     now = datetime.now(UTC)
-    # [FIX] Async cursor for users
-    cursor_users = users_collection.find({})
-    users = await cursor_users.to_list(length=None)
-    
-    for user in users:
-        user_id = user["_id"]
-        # [FIX] Added await
-        lang = await get_user_language(user_id)
-        # [FIX] Async distinct
-        currencies = await transactions_collection.distinct("currency", {"user_id": user_id})
-        
-        for currency in currencies:
-            ninety_days_ago = now - timedelta(days=90)
-            # [FIX] Async cursor
-            cursor = transactions_collection.find({
-                "user_id": user_id,
-                "type": "outflow",
-                "currency": currency,
-                "date": {"$gte": ninety_days_ago}
-            })
-            transactions = await cursor.to_list(length=None)
-            
-            if len(transactions) < 10:
-                continue
-            
-            recurring_patterns = defaultdict(list)
-            
-            for t in transactions:
-                key = t.get("description", "").lower().strip()
-                if not key:
-                    key = t["sub_category"].lower()
-                
-                if len(key) < 3 or key in ["payment", "purchase", "expense"]:
-                    continue
-                
-                recurring_patterns[key].append({
-                    "date": t["date"],
-                    "amount": t["amount"],
-                    "category": t["main_category"],
-                    "sub_category": t["sub_category"],
-                    "description": t.get("description", t["sub_category"])
-                })
-            
-            for key, occurrences in recurring_patterns.items():
-                if len(occurrences) < 2:
-                    continue
-                
-                occurrences.sort(key=lambda x: x["date"])
-                
-                intervals = []
-                for i in range(1, len(occurrences)):
-                    interval = (occurrences[i]["date"] - occurrences[i-1]["date"]).days
-                    intervals.append(interval)
-                
-                if not intervals:
-                    continue
-                
-                avg_interval = sum(intervals) / len(intervals)
-                
-                if 28 <= avg_interval <= 32:
-                    last_occurrence = occurrences[-1]["date"]
-                    next_expected = last_occurrence + timedelta(days=int(avg_interval))
-                    days_until = (next_expected - now).days
-                    
-                    if 2 <= days_until <= 4:
-                        # [FIX] Added await
-                        existing = await notifications_collection.find_one({
-                            "user_id": user_id,
-                            "type": "payment_reminder",
-                            "goal_name": key,
-                            "currency": currency,
-                            "created_at": {"$gte": now - timedelta(days=7)}
-                        })
-                        
-                        if not existing:
-                            last_amount = occurrences[-1]["amount"]
-                            description = occurrences[-1]["description"]
-                            formatted_amount = format_currency_amount(last_amount, currency)
-                            
-                            title = translate("payment_reminder_title", lang)
-                            message = translate("payment_reminder_msg", lang, 
-                                              description=description, amount=formatted_amount, days=days_until)
-                            
-                            # [FIX] Added await
-                            await create_notification(
-                                user_id=user_id,
-                                notification_type="payment_reminder",
-                                title=title,
-                                message=message,
-                                goal_id=None,
-                                goal_name=key,
-                                currency=currency
-                            )
-
-
-async def notify_monthly_insights_generated(user_id: str):
+    semaphore = asyncio.Semaphore(RECURRING_PAYMENT_CONCURRENCY)
+    shards = []
+    last_id = None
+
+    async def run_shard(users: List[dict]) -> int:
+        try:
+            return await _detect_recurring_payments_shard(users, now)
+        except Exception as e:
+            print(f"❌ Recurring payment detection failed for {len(users)} user(s) starting at {users[0]['_id']}: {e}")
+            return 0
+        finally:
+            semaphore.release()
+
+    while True:
+        # Reading the next shard waits for a free slot, so users are never all in memory
+        await semaphore.acquire()
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        try:
+            users = await users_collection.find(query, {"_id": 1, "language": 1, "fcm_token": 1}) \
+                .sort("_id", 1).limit(RECURRING_PAYMENT_SHARD_USERS).to_list(length=RECURRING_PAYMENT_SHARD_USERS)
+        except Exception as e:
+            # Stop reading, but still wait for the shards already running
+            semaphore.release()
+            print(f"❌ Failed to read users after {last_id}, stopping payment reminder run early: {e}")
+            break
+        if not users:
+            semaphore.release()
+            break
+        last_id = users[-1]["_id"]
+        shards.append(asyncio.create_task(run_shard(users)))
+
+    created = sum(await asyncio.gather(*shards))
+    elapsed = (datetime.now(UTC) - now).total_seconds()
+    print(f"✅ Payment reminders: {created} notification(s) across {len(shards)} shard(s) in {elapsed:.1f}s")
+
+
+async def notify_monthly_insights_generated(user_id: str, batch: Optional[NotificationBatch] = None):
     """Notify when monthly insights are generated"""
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
-    
-    title = translate("monthly_insights_title", lang)
-    message = translate("monthly_insights_msg", lang)
-    
-    # [FIX] Added await
-    await create_notification(
-        user_id=user_id,
-        notification_type="monthly_insights_generated",
-        title=title,
-        message=message,
-        goal_id=None,
-        goal_name="Monthly Insights Tailored For You" if lang == "en" else "သင့်အတွက် ပြင်ဆင်ထားသော လစဉ်ထိုးထွင်းသိမြင်မှုများ",
-        currency=None
-    )
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        title = translate("monthly_insights_title", lang)
+        message = translate("monthly_insights_msg", lang)
+        
+        notifications.add(
+            user_id=user_id,
+            notification_type="monthly_insights_generated",
+            title=title,
+            message=message,
+            goal_id=None,
+            goal_name="Monthly Insights Tailored For You" if lang == "en" else "သင့်အတွက် ပြင်ဆင်ထားသော လစဉ်ထိုးထွင်းသိမြင်မှုများ",
+            currency=None
+        )
 
 
-async def notify_weekly_insights_generated(user_id: str):
+async def notify_weekly_insights_generated(user_id: str, batch: Optional[NotificationBatch] = None):
     """Notify when weekly insights are generated"""
-    # [FIX] Added await
-    lang = await get_user_language(user_id)
-    
-    title = translate("weekly_insights_title", lang)
-    message = translate("weekly_insights_msg", lang)
-    
-    # [FIX] Added await
-    await create_notification(
-        user_id=user_id,
-        notification_type="weekly_insights_generated",
-        title=title,
-        message=message,
-        goal_id=None,
-        goal_name="Weekly Insights Tailored For You" if lang == "en" else "သင့်အတွက် ပြင်ဆင်ထားသော အပတ်စဉ်ထိုးထွင်းသိမြင်မှုများ",
-        currency=None
-    )
\ No newline at end of file
+    async with notification_scope(batch) as notifications:
+        await notifications.prefetch([user_id])
+        lang = notifications.language(user_id)
+        
+        title = translate("weekly_insights_title", lang)
+        message = translate("weekly_insights_msg", lang)
+        
+        notifications.add(
+            user_id=user_id,
+            notification_type="weekly_insights_generated",
+            title=title,
+            message=message,
+            goal_id=None,
+            goal_name="Weekly Insights Tailored For You" if lang == "en" else "သင့်အတွက် ပြင်ဆင်ထားသော အပတ်စဉ်ထိုးထွင်းသိမြင်မှုများ",
+            currency=None
+        )
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Optional
+import logging
+
+from fastapi import HTTPException, Request, status
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt releases the GIL, so a small dedicated thread pool hashes in parallel
+# without touching the event loop or starving Starlette's shared threadpool.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes queued or running before new ones are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Login attempts per client IP, and failed attempts per (client IP, email),
+# inside the window. Failures are keyed by IP too, so bad passwords sent from
+# elsewhere can't lock the owner of an account out.
+LOGIN_RATE_WINDOW_SECONDS = int(os.getenv("LOGIN_RATE_WINDOW_SECONDS", "300"))
+LOGIN_RATE_LIMIT_PER_IP = int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", "30"))
+LOGIN_FAILURE_LIMIT_PER_EMAIL = int(os.getenv("LOGIN_FAILURE_LIMIT_PER_EMAIL", "5"))
+LIMITER_SWEEP_THRESHOLD = 10000
+# Reverse proxies in front of the app that append the peer address to
+# X-Forwarded-For. With the default 0 the header is ignored and the socket peer
+# is used: without a proxy the client writes that header itself. Deployments
+# behind a load balancer opt in by setting the number of proxy hops (usually 1).
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+# ==================== SYNC HELPERS ====================
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash (blocking; prefer verify_password_async)"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    """Hash a password (blocking; prefer get_password_hash_async)"""
+    return pwd_context.hash(password)
+
+
+# ==================== BOUNDED HASHING POOL ====================
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded executor and sheds load once it is saturated"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._durations: Deque[float] = deque(maxlen=500)
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"⚠️ Password hashing pool saturated ({self.pending} pending), shedding request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in requests, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending += 1
+        queued_at = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started - queued_at, time.perf_counter() - started
+
+        try:
+            result, waited, took = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self._waits.append(waited)
+        self._durations.append(took)
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        def avg_ms(values):
+            return round(sum(values) / len(values) * 1000, 1) if values else None
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_avg_ms": avg_ms(self._waits),
+            "hash_avg_ms": avg_ms(self._durations)
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+# ==================== RATE LIMITING ====================
+
+class SlidingWindowLimiter:
+    """In-process sliding-window counter per key"""
+
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._events: Dict[str, Deque[float]] = {}
+
+    def _prune(self, key: str, now: float) -> Deque[float]:
+        events = self._events.get(key)
+        if events is None:
+            return deque()
+        while events and events[0] <= now - self.window_seconds:
+            events.popleft()
+        if not events:
+            del self._events[key]
+        return events
+
+    def retry_after(self, key: str) -> Optional[int]:
+        """Seconds until `key` may try again, or None if it is under the limit"""
+        now = time.monotonic()
+        events = self._prune(key, now)
+        if len(events) < self.limit:
+            return None
+        return max(int(events[0] + self.window_seconds - now) + 1, 1)
+
+    def hit(self, key: str):
+        now = time.monotonic()
+        self._events.setdefault(key, deque()).append(now)
+        # Keys that stopped trying are only pruned on access; sweep them occasionally
+        if len(self._events) > LIMITER_SWEEP_THRESHOLD:
+            for stale_key in list(self._events):
+                self._prune(stale_key, now)
+
+    def reset(self, key: str):
+        self._events.pop(key, None)
+
+    def __len__(self):
+        return len(self._events)
+
+
+ip_limiter = SlidingWindowLimiter(LOGIN_RATE_LIMIT_PER_IP, LOGIN_RATE_WINDOW_SECONDS)
+email_failure_limiter = SlidingWindowLimiter(LOGIN_FAILURE_LIMIT_PER_EMAIL, LOGIN_RATE_WINDOW_SECONDS)
+_rate_limited = {"ip": 0, "email": 0}
+
+
+def _too_many_attempts(retry_after: int):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts, please try again later",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """Client address for rate limiting, read from X-Forwarded-For past TRUSTED_PROXY_HOPS proxies"""
+    peer = request.client.host if request.client else None
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    if not forwarded:
+        return peer
+    # Entries left of the trusted hops were written by the client and can be forged
+    return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+
+
+def _failure_key(client_ip: Optional[str], email: str) -> str:
+    return f"{client_ip or '-'}|{email.lower()}"
+
+
+def check_login_allowed(client_ip: Optional[str], email: Optional[str] = None):
+    """
+    Count an attempt from `client_ip` and raise 429 if the IP, or its recent
+    failures for this email, are over the limit. Runs before any hashing is queued.
+    """
+    if client_ip:
+        retry_after = ip_limiter.retry_after(client_ip)
+        if retry_after:
+            _rate_limited["ip"] += 1
+            raise _too_many_attempts(retry_after)
+        ip_limiter.hit(client_ip)
+
+    if email:
+        retry_after = email_failure_limiter.retry_after(_failure_key(client_ip, email))
+        if retry_after:
+            _rate_limited["email"] += 1
+            raise _too_many_attempts(retry_after)
+
+
+def record_login_failure(client_ip: Optional[str], email: str):
+    email_failure_limiter.hit(_failure_key(client_ip, email))
+
+
+def record_login_success(client_ip: Optional[str], email: str):
+    email_failure_limiter.reset(_failure_key(client_ip, email))
+
+
+def password_service_stats() -> dict:
+    return {
+        "hasher": password_hasher.stats(),
+        "rate_limit": {
+            "window_seconds": LOGIN_RATE_WINDOW_SECONDS,
+            "limit_per_ip": LOGIN_RATE_LIMIT_PER_IP,
+            "trusted_proxy_hops": TRUSTED_PROXY_HOPS,
+            "failure_limit_per_email": LOGIN_FAILURE_LIMIT_PER_EMAIL,
+            "tracked_ips": len(ip_limiter),
+            "tracked_emails": len(email_failure_limiter),
+            "rejected_by_ip": _rate_limited["ip"],
+            "rejected_by_email": _rate_limited["email"]
+        }
+    }
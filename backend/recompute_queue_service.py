@@ -0,0 +1,259 @@
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from budget_service import recompute_user_budgets
+from database import recompute_jobs_collection
+
+logger = logging.getLogger(__name__)
+
+# Requests for the same (user_id, currency) within the debounce window collapse
+# into one recompute. MAX_DELAY bounds how long a steady stream of writes can
+# keep pushing a job back.
+RECOMPUTE_DEBOUNCE_SECONDS = float(os.getenv("RECOMPUTE_DEBOUNCE_SECONDS", "2"))
+RECOMPUTE_MAX_DELAY_SECONDS = float(os.getenv("RECOMPUTE_MAX_DELAY_SECONDS", "10"))
+RECOMPUTE_CONCURRENCY = int(os.getenv("RECOMPUTE_CONCURRENCY", "4"))
+# Mirror pending keys to MongoDB so work scheduled before a restart still runs
+RECOMPUTE_PERSIST = os.getenv("RECOMPUTE_PERSIST", "true").lower() == "true"
+# A restored job claimed by a worker that died before finishing it becomes
+# claimable again after this long
+RECOMPUTE_CLAIM_LEASE_SECONDS = int(os.getenv("RECOMPUTE_CLAIM_LEASE_SECONDS", "300"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# currency=None means every currency of the user
+QueueKey = Tuple[str, Optional[str]]
+
+
+def _job_id(key: QueueKey) -> str:
+    user_id, currency = key
+    return f"{user_id}:{currency or '*'}"
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # Motor returns naive datetimes
+    return dt.replace(tzinfo=UTC) if dt and dt.tzinfo is None else dt
+
+
+def _widen(entry: dict, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    """Grow the entry's date range to cover start..end (None = every budget); True if it changed"""
+    if entry["start"] is None and entry["end"] is None:
+        return False
+    if start is None or end is None:
+        entry["start"] = entry["end"] = None
+        return True
+    widened = start < entry["start"] or end > entry["end"]
+    entry["start"] = min(entry["start"], start)
+    entry["end"] = max(entry["end"], end)
+    return widened
+
+
+class RecomputeQueue:
+    """In-process, debounced, coalescing queue of budget recomputations"""
+
+    def __init__(
+        self,
+        debounce_seconds: float = RECOMPUTE_DEBOUNCE_SECONDS,
+        max_delay_seconds: float = RECOMPUTE_MAX_DELAY_SECONDS,
+        concurrency: int = RECOMPUTE_CONCURRENCY,
+        persist: bool = RECOMPUTE_PERSIST
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.persist = persist
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # key -> {"first": monotonic time of first request, "due": monotonic run time,
+        #         "start"/"end": changed transaction dates (None = every budget)}
+        self._pending: Dict[QueueKey, dict] = {}
+        self._running: set = set()
+        self._tasks: set = set()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.scheduled = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        # Request-to-completion latency of recent jobs, in seconds
+        self._latencies = deque(maxlen=500)
+
+    # ==================== SCHEDULING ====================
+
+    def schedule(
+        self,
+        user_id: str,
+        currency: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ):
+        """
+        Request a recompute of the budgets overlapping start..end (every budget
+        when omitted); repeated requests inside the window are merged
+        """
+        key = (user_id, currency)
+        start, end = _as_utc(start), _as_utc(end)
+        now = time.monotonic()
+        self.scheduled += 1
+
+        entry = self._pending.get(key)
+        if entry:
+            self.coalesced += 1
+            entry["due"] = min(now + self.debounce_seconds, entry["first"] + self.max_delay_seconds)
+            changed = _widen(entry, start, end)
+        else:
+            entry = self._pending[key] = {"first": now, "due": now + self.debounce_seconds, "start": start, "end": end}
+            changed = True
+        if changed and self.persist:
+            self._spawn(self._persist(key, entry["start"], entry["end"]))
+
+        self._wakeup.set()
+
+    def schedule_many(self, user_id: str, currencies):
+        for currency in set(currencies):
+            self.schedule(user_id, currency)
+
+    def schedule_for_transactions(self, user_id: str, transactions: List[Optional[dict]]):
+        """Recompute the budgets covering these transactions' dates (only outflows count toward budgets)"""
+        ranges: Dict[str, Tuple[datetime, datetime]] = {}
+        for t in transactions:
+            if not t or t.get("type") != "outflow":
+                continue
+            currency = t.get("currency", "usd")
+            date = _as_utc(t["date"])
+            low, high = ranges.get(currency, (date, date))
+            ranges[currency] = (min(low, date), max(high, date))
+        for currency, (start, end) in ranges.items():
+            self.schedule(user_id, currency, start, end)
+
+    async def _persist(self, key: QueueKey, start: Optional[datetime], end: Optional[datetime]):
+        try:
+            await recompute_jobs_collection.update_one(
+                {"_id": _job_id(key)},
+                {"$set": {
+                    "user_id": key[0],
+                    "currency": key[1],
+                    "start": start,
+                    "end": end,
+                    "requested_at": datetime.now(UTC)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to persist recompute job {_job_id(key)}: {e}")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ==================== DISPATCH ====================
+
+    async def _run(self, key: QueueKey, entry: dict):
+        user_id, currency = key
+        async with self._semaphore:
+            try:
+                await recompute_user_budgets(user_id, currency, entry["start"], entry["end"])
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error recomputing budgets for {_job_id(key)}: {e}")
+            finally:
+                self._running.discard(key)
+                self._latencies.append(time.monotonic() - entry["first"])
+
+        # Only forget the persisted job if nothing new was requested meanwhile
+        if self.persist and key not in self._pending:
+            try:
+                await recompute_jobs_collection.delete_one({"_id": _job_id(key)})
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to clear recompute job {_job_id(key)}: {e}")
+
+    async def _dispatch_loop(self):
+        while True:
+            now = time.monotonic()
+            # A key that is still running waits for the next pass, so one
+            # user/currency never recomputes concurrently with itself
+            due = [key for key, entry in self._pending.items() if entry["due"] <= now and key not in self._running]
+            for key in due:
+                entry = self._pending.pop(key)
+                self._running.add(key)
+                self._spawn(self._run(key, entry))
+
+            waiting = [entry["due"] for key, entry in self._pending.items() if key not in self._running]
+            timeout = max(min(waiting) - now, 0.05) if waiting else None
+            if self._pending and not waiting:
+                # Everything pending is blocked on a running job; poll until it finishes
+                timeout = 0.1
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_persisted_job(self) -> Optional[dict]:
+        """Atomically take one persisted job, so workers starting together never restore the same one"""
+        now = datetime.now(UTC)
+        return await recompute_jobs_collection.find_one_and_update(
+            {"$or": [
+                {"claimed_at": None},
+                {"claimed_at": {"$lt": now - timedelta(seconds=RECOMPUTE_CLAIM_LEASE_SECONDS)}}
+            ]},
+            {"$set": {"claimed_by": WORKER_ID, "claimed_at": now}}
+        )
+
+    async def start(self):
+        """Start dispatching; re-queues jobs persisted by a previous process"""
+        if self._dispatcher:
+            return
+        if self.persist:
+            try:
+                restored = 0
+                while True:
+                    job = await self._claim_persisted_job()
+                    if not job:
+                        break
+                    key = (job["user_id"], job.get("currency"))
+                    if key not in self._pending:
+                        now = time.monotonic()
+                        self._pending[key] = {
+                            "first": now,
+                            "due": now,
+                            "start": _as_utc(job.get("start")),
+                            "end": _as_utc(job.get("end"))
+                        }
+                        restored += 1
+                if restored:
+                    logger.info(f"🔁 Restored {restored} pending budget recompute job(s)")
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to restore recompute jobs: {e}")
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "depth": len(self._pending),
+            "running": len(self._running),
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+            "latency_avg_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "latency_p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+            "latency_max_seconds": round(latencies[-1], 3) if latencies else None
+        }
+
+
+# Global queue, started with the app
+recompute_queue = RecomputeQueue()
@@ -3,7 +3,9 @@ from datetime import datetime, timedelta, UTC, timezone
 from typing import List, Optional
 from recurrence_models import RecurrenceConfig, RecurrenceFrequency
 from database import transactions_collection
-from notification_service import create_notification
+from balance_service import apply_balance_delta, transaction_delta
+from budget_service import apply_budget_transaction_delta
+from notification_service import NotificationBatch, create_notification
 
 def calculate_next_occurrence(
     last_date: datetime,
@@ -109,6 +111,7 @@ async def check_and_create_recurring_transactions():
     })
     
     created_count = 0
+    notifications = NotificationBatch()
     
     # [FIX] Use async for
     async for transaction in cursor:
@@ -143,8 +146,8 @@ async def check_and_create_recurring_transactions():
             )
             
             # Notify user
-            # [FIX] Added await
-            await create_notification(
+            await notifications.prefetch([transaction["user_id"]])
+            notifications.add(
                 user_id=transaction["user_id"],
                 notification_type="recurring_transaction_ended",
                 title="Recurring Transaction Ended 🏁",
@@ -180,6 +183,8 @@ async def check_and_create_recurring_transactions():
             
             # [FIX] Added await
             await transactions_collection.insert_one(new_transaction)
+            await apply_balance_delta(transaction["user_id"], transaction_delta(new_transaction))
+            await apply_budget_transaction_delta(transaction["user_id"], new_transaction)
             
             # Update parent transaction's last_created_date
             # [FIX] Added await
@@ -195,8 +200,8 @@ async def check_and_create_recurring_transactions():
             currency_symbol = currency_map.get(transaction.get("currency", "usd"), "$")
             
             # Notify user
-            # [FIX] Added await
-            await create_notification(
+            await notifications.prefetch([transaction["user_id"]])
+            notifications.add(
                 user_id=transaction["user_id"],
                 notification_type="recurring_transaction_created",
                 title="Recurring Transaction Created 🔄",
@@ -205,6 +210,8 @@ async def check_and_create_recurring_transactions():
                 goal_name=transaction.get("description", transaction["sub_category"])
             )
     
+    await notifications.flush()
+    
     if created_count > 0:
         print(f"✅ Created {created_count} recurring transactions")
     
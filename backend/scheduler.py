@@ -8,8 +8,9 @@ from notification_service import (
     check_budget_period_notifications, 
     detect_and_notify_recurring_payments
 )
-from database import users_collection
-from insights_service import generate_weekly_insights_for_all_users, generate_monthly_insights_for_all_users
+from balance_service import reconcile_all_balances
+from budget_service import verify_all_budget_spent
+from insight_batch_service import generate_weekly_insights_for_all_users, generate_monthly_insights_for_all_users
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,16 +24,6 @@ def start_scheduler():
     # --- NO WRAPPERS NEEDED ---
     # We can now pass the async functions directly to the scheduler.
     
-    # Special handling for user iteration (Async Cursor)
-    async def analyze_all_users_spending():
-        # [FIX] This now works because it runs on the main loop
-        cursor = users_collection.find({})
-        async for user in cursor:
-            try:
-                await analyze_unusual_spending(user["_id"])
-            except Exception as e:
-                print(f"Error analyzing spending for user {user['_id']}: {e}")
-
     # --- ADD JOBS ---
 
     # Check for approaching goal target dates daily at 9 AM
@@ -55,7 +46,7 @@ def start_scheduler():
     
     # Check for unusual spending patterns daily at 8 AM
     scheduler.add_job(
-        analyze_all_users_spending,
+        analyze_unusual_spending,
         trigger=CronTrigger(hour=8, minute=0),
         id="analyze_unusual_spending",
         name="Analyze unusual spending patterns",
@@ -98,6 +89,24 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Verify balance ledgers against a full aggregation nightly at 3 AM
+    scheduler.add_job(
+        reconcile_all_balances,
+        trigger=CronTrigger(hour=3, minute=0),
+        id="balance_reconciliation",
+        name="Reconcile balance ledgers and repair drift",
+        replace_existing=True
+    )
+    
+    # Verify incremental budget spent counters nightly at 3:30 AM
+    scheduler.add_job(
+        verify_all_budget_spent,
+        trigger=CronTrigger(hour=3, minute=30),
+        id="budget_spent_verification",
+        name="Verify budget spent counters and repair drift",
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("✅ Async Notification scheduler started")
     
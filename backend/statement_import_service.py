@@ -0,0 +1,325 @@
+import csv
+import hashlib
+import io
+import re
+import uuid
+from datetime import datetime, UTC, timezone
+from itertools import islice
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from balance_service import apply_balance_delta, transactions_delta
+from database import categories_collection, transactions_collection
+from models import Currency, ImportRowError, StatementImportResult
+from recompute_queue_service import recompute_queue
+
+logger = logging.getLogger(__name__)
+
+# Rows parsed and written per bulk_write round trip
+IMPORT_CHUNK_SIZE = 1000
+# Cap the per-row error list so a broken file doesn't produce a huge response
+MAX_REPORTED_ERRORS = 200
+
+# Used when a row carries no category (always the case for OFX)
+DEFAULT_CATEGORIES = {
+    "inflow": ("Other Income", "Other Income"),
+    "outflow": ("Other & Adjustments", "Miscellaneous"),
+}
+
+TYPE_ALIASES = {
+    "inflow": "inflow", "income": "inflow", "credit": "inflow", "cr": "inflow", "deposit": "inflow",
+    "outflow": "outflow", "expense": "outflow", "debit": "outflow", "dr": "outflow", "withdrawal": "outflow",
+}
+
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%Y%m%d"]
+
+
+# ==================== PARSERS ====================
+# Both parsers are generators over a text stream, so only the current chunk
+# of rows is ever held in memory. They yield (row_number, raw_row).
+
+def iter_csv_rows(stream: io.TextIOBase) -> Iterator[Tuple[int, dict]]:
+    """
+    CSV with a header row. Recognised columns (case-insensitive):
+    date, amount, type, main_category, sub_category, description, currency
+    """
+    reader = csv.DictReader(stream)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+
+    # Row 1 is the header
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, row
+
+
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.S | re.I)
+_OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+_OFX_CURRENCY = re.compile(r"<CURDEF>\s*([A-Za-z]{3})", re.I)
+
+
+def iter_ofx_rows(stream: io.TextIOBase, read_size: int = 64 * 1024) -> Iterator[Tuple[int, dict]]:
+    """OFX/QFX (SGML or XML flavour). Reads the file in blocks and yields each <STMTTRN>."""
+    buffer = ""
+    row_number = 0
+    currency = None
+
+    while True:
+        chunk = stream.read(read_size)
+        buffer += chunk
+
+        if currency is None:
+            match = _OFX_CURRENCY.search(buffer)
+            if match:
+                currency = match.group(1).lower()
+
+        consumed = 0
+        for match in _OFX_TRANSACTION.finditer(buffer):
+            row_number += 1
+            fields = {tag.upper(): value.strip() for tag, value in _OFX_FIELD.findall(match.group(1))}
+            yield row_number, {
+                "date": fields.get("DTPOSTED", ""),
+                "amount": fields.get("TRNAMT", ""),
+                "type": "",
+                "description": fields.get("NAME") or fields.get("MEMO") or "",
+                "currency": currency or "",
+                "fitid": fields.get("FITID", ""),
+            }
+            consumed = match.end()
+
+        # Keep only the unfinished tail (a transaction split across blocks)
+        buffer = buffer[consumed:]
+        if not chunk:
+            break
+
+
+# ==================== ROW VALIDATION ====================
+
+async def load_category_tree() -> Dict[str, Dict[str, set]]:
+    """{"inflow": {main_category: {sub_categories}}, "outflow": {...}}"""
+    tree = {"inflow": {}, "outflow": {}}
+    async for doc in categories_collection.find({}):
+        if doc["_id"] in tree:
+            tree[doc["_id"]] = {
+                cat["main_category"]: set(cat["sub_categories"]) for cat in doc.get("categories", [])
+            }
+    return tree
+
+
+def _parse_date(value: str) -> datetime:
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("Missing date")
+
+    # OFX dates look like 20240115120000[-5:EST]
+    if re.match(r"^\d{8}", value) and not re.match(r"^\d{4}-", value):
+        value = value[:8]
+
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        parsed = None
+        for fmt in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        if parsed is None:
+            raise ValueError(f"Unrecognised date '{value}'")
+
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+def _parse_amount(value: str) -> float:
+    cleaned = (value or "").strip().replace(",", "").replace(" ", "")
+    if not cleaned:
+        raise ValueError("Missing amount")
+    # Accounting style negatives: (12.50)
+    if cleaned.startswith("(") and cleaned.endswith(")"):
+        cleaned = "-" + cleaned[1:-1]
+    try:
+        return float(cleaned)
+    except ValueError:
+        raise ValueError(f"Invalid amount '{value}'")
+
+
+def build_import_transaction(
+    raw: dict,
+    user_id: str,
+    default_currency: str,
+    category_tree: Dict[str, Dict[str, set]],
+    now: datetime
+) -> dict:
+    """Validate one parsed row and turn it into a transaction document (raises ValueError)"""
+    signed_amount = _parse_amount(raw.get("amount"))
+    amount = abs(signed_amount)
+    if amount == 0:
+        raise ValueError("Amount must be non-zero")
+
+    raw_type = (raw.get("type") or "").strip().lower()
+    if raw_type:
+        if raw_type not in TYPE_ALIASES:
+            raise ValueError(f"Unknown type '{raw.get('type')}'")
+        tx_type = TYPE_ALIASES[raw_type]
+    else:
+        tx_type = "outflow" if signed_amount < 0 else "inflow"
+
+    currency = (raw.get("currency") or "").strip().lower() or default_currency
+    if currency not in {c.value for c in Currency}:
+        raise ValueError(f"Unsupported currency '{raw.get('currency')}'")
+
+    main_category = (raw.get("main_category") or "").strip()
+    sub_category = (raw.get("sub_category") or "").strip()
+    if not main_category and not sub_category:
+        main_category, sub_category = DEFAULT_CATEGORIES[tx_type]
+
+    sub_categories = category_tree[tx_type].get(main_category)
+    if sub_categories is None:
+        raise ValueError(f"Unknown {tx_type} category '{main_category}'")
+    if sub_category not in sub_categories:
+        raise ValueError(f"Unknown sub-category '{sub_category}' for '{main_category}'")
+
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "type": tx_type,
+        "main_category": main_category,
+        "sub_category": sub_category,
+        "date": _parse_date(raw.get("date")),
+        "description": (raw.get("description") or "").strip() or None,
+        "amount": amount,
+        "currency": currency,
+        "created_at": now,
+        "updated_at": now,
+        "recurrence": {
+            "enabled": False,
+            "config": None,
+            "last_created_date": None,
+            "parent_transaction_id": None
+        }
+    }
+
+
+def import_content_hash(doc: dict, fitid: str, occurrence: int) -> str:
+    """
+    Stable hash of a row's content. `occurrence` numbers identical rows within one
+    statement (two identical coffees on the same day) so re-importing the same
+    statement dedupes exactly, without collapsing genuine repeats.
+    """
+    parts = [
+        doc["user_id"],
+        doc["type"],
+        doc["date"].strftime("%Y-%m-%d"),
+        f"{doc['amount']:.2f}",
+        doc["currency"],
+        (doc.get("description") or "").strip().lower(),
+        fitid or "",
+        str(occurrence),
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+# ==================== PIPELINE ====================
+
+async def import_statement(
+    user_id: str,
+    file: BinaryIO,
+    file_format: str,
+    default_currency: str = "usd"
+) -> StatementImportResult:
+    """
+    Parse a CSV/OFX statement incrementally and insert it in bounded chunks.
+    Balances are updated and budget recomputes queued after every chunk, so a
+    failure part-way through leaves the ledger matching the rows actually written.
+    """
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    rows = iter_ofx_rows(stream) if file_format == "ofx" else iter_csv_rows(stream)
+
+    category_tree = await load_category_tree()
+    now = datetime.now(UTC)
+
+    total_rows = imported = duplicates = failed = 0
+    errors: List[ImportRowError] = []
+    occurrences: Dict[str, int] = {}
+
+    def record_error(row_number: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(ImportRowError(row=row_number, error=message))
+
+    try:
+        while True:
+            # File reads and CSV parsing are blocking; keep them off the event loop
+            chunk = await run_in_threadpool(lambda: list(islice(rows, IMPORT_CHUNK_SIZE)))
+            if not chunk:
+                break
+
+            docs = []
+            doc_rows = []
+
+            for row_number, raw in chunk:
+                total_rows += 1
+                try:
+                    doc = build_import_transaction(raw, user_id, default_currency, category_tree, now)
+                except ValueError as e:
+                    record_error(row_number, str(e))
+                    continue
+
+                fitid = raw.get("fitid", "")
+                base_key = import_content_hash(doc, fitid, 0)
+                occurrence = occurrences.get(base_key, 0)
+                occurrences[base_key] = occurrence + 1
+                doc["import_hash"] = base_key if occurrence == 0 else import_content_hash(doc, fitid, occurrence)
+
+                docs.append(doc)
+                doc_rows.append(row_number)
+
+            if not docs:
+                continue
+
+            # Unique (user_id, import_hash) index turns re-imported rows into
+            # duplicate-key errors, which ordered=False skips past
+            rejected = set()
+            try:
+                await transactions_collection.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+            except BulkWriteError as bwe:
+                for err in bwe.details.get("writeErrors", []):
+                    rejected.add(err["index"])
+                    if err.get("code") == 11000:
+                        duplicates += 1
+                    else:
+                        record_error(doc_rows[err["index"]], err.get("errmsg", "Insert failed"))
+
+            inserted = [doc for index, doc in enumerate(docs) if index not in rejected]
+            if inserted:
+                imported += len(inserted)
+                await apply_balance_delta(user_id, transactions_delta(inserted))
+                # Debounced and merged per currency, so one recompute runs after the last chunk
+                recompute_queue.schedule_for_transactions(user_id, inserted)
+    finally:
+        # Leave the upload's file object open for the framework to clean up
+        stream.detach()
+
+    logger.info(f"📥 Statement import for user {user_id}: {imported} imported, {duplicates} duplicates, {failed} failed of {total_rows}")
+
+    result = StatementImportResult(
+        total_rows=total_rows,
+        imported=imported,
+        duplicates=duplicates,
+        failed=failed,
+        errors=errors,
+        errors_truncated=failed > len(errors)
+    )
+    return result
+
+
+def detect_statement_format(filename: Optional[str]) -> str:
+    """Guess the statement format from the upload's file name"""
+    if filename and filename.lower().endswith((".ofx", ".qfx")):
+        return "ofx"
+    return "csv"
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Backend modules import each other by flat name, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py builds its Motor client at import time; it only connects on first use
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "test")
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+import ai_governor_service
+from ai_governor_service import ProviderGovernor, TokenBucket
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def make_governor(rpm: int = 1000, tpm: int = 1_000_000, max_concurrency: int = 32) -> ProviderGovernor:
+    return ProviderGovernor("test", rpm=rpm, tpm=tpm, max_concurrency=max_concurrency)
+
+
+async def hold(governor: ProviderGovernor, lane: str, order: list, release: asyncio.Event):
+    async with governor.slot(lane):
+        order.append(lane)
+        await release.wait()
+
+
+# ==================== LANES ====================
+
+def test_waiters_are_admitted_by_lane_then_arrival():
+    async def scenario():
+        governor = make_governor(max_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        # Occupy the only slot so everything after it queues
+        holder = asyncio.create_task(hold(governor, "standard", order, release))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(hold(governor, lane, order, release))
+            for lane in ["batch", "standard", "interactive", "batch", "interactive"]
+        ]
+        await asyncio.sleep(0)
+        assert governor.stats()["queued"] == 5
+
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["standard", "interactive", "interactive", "standard", "batch", "batch"]
+
+
+# ==================== RESERVE ====================
+
+def test_bucket_reserve_holds_back_batch_amounts():
+    bucket = TokenBucket(per_minute=10)
+    bucket.take(8)
+
+    assert bucket.wait_time(1) == 0.0
+    assert bucket.wait_time(1, reserve=2) > 0
+
+
+def test_interactive_call_overtakes_batch_waiting_on_reserve():
+    async def scenario():
+        governor = make_governor(rpm=10)
+        governor.requests.take(8)  # 2 of 10 left, exactly the batch reserve
+
+        batch = asyncio.create_task(governor.slot("batch").__aenter__())
+        await asyncio.sleep(0.01)
+        assert not batch.done()
+
+        async def interactive_call():
+            async with governor.slot("interactive"):
+                return True
+
+        # The batch head would hold the queue for ~6 s waiting on refill
+        interactive_admitted = await asyncio.wait_for(interactive_call(), timeout=1)
+        assert not batch.done()
+
+        batch.cancel()
+        return interactive_admitted, governor.admitted
+
+    admitted, counts = asyncio.run(scenario())
+    assert admitted
+    assert counts["interactive"] == 1
+    assert counts["batch"] == 0
+
+
+# ==================== AIMD ====================
+
+def test_success_grows_limit_additively():
+    async def scenario():
+        governor = make_governor()
+        start = governor.limit
+        async with governor.slot():
+            pass
+        return start, governor.limit
+
+    start, limit = asyncio.run(scenario())
+    assert limit == pytest.approx(start + 1 / start)
+
+
+def test_rate_limit_halves_limit_once_per_cooldown():
+    async def scenario():
+        governor = make_governor()
+        start = governor.limit
+        for _ in range(2):
+            with pytest.raises(RateLimitError):
+                async with governor.slot():
+                    raise RateLimitError("429 Too Many Requests")
+        return start, governor.limit, governor.rate_limited
+
+    start, limit, rate_limited = asyncio.run(scenario())
+    # The second 429 lands inside the cooldown and does not halve again
+    assert limit == start / 2
+    assert rate_limited == 2
+
+
+def test_slow_call_counts_as_overload(monkeypatch):
+    monkeypatch.setattr(ai_governor_service, "AI_LATENCY_TARGET_SECONDS", 0.0)
+
+    async def scenario():
+        governor = make_governor()
+        start = governor.limit
+        async with governor.slot():
+            await asyncio.sleep(0.001)
+        return start, governor.limit, governor.slow_calls
+
+    start, limit, slow_calls = asyncio.run(scenario())
+    assert limit == start / 2
+    assert slow_calls == 1
+
+
+def test_limit_stays_within_bounds():
+    async def scenario():
+        governor = make_governor(max_concurrency=2)
+        for _ in range(50):
+            async with governor.slot():
+                pass
+        high = governor.limit
+
+        for _ in range(10):
+            governor._last_decrease = 0.0
+            with pytest.raises(RateLimitError):
+                async with governor.slot():
+                    raise RateLimitError()
+        return high, governor.limit
+
+    high, low = asyncio.run(scenario())
+    assert high == 2.0
+    assert low == 1.0
@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("motor")
+
+import fcm_delivery_service
+from fcm_delivery_service import FCMDeliveryQueue
+
+
+class FakeUsers:
+    def __init__(self):
+        self.calls = []
+
+    async def update_many(self, query, update):
+        self.calls.append((query, update))
+        return SimpleNamespace(modified_count=len(query["fcm_token"]["$in"]))
+
+
+def push(token: str, **extra) -> dict:
+    return {"token": token, "title": "T", "body": "B", "data": {}, **extra}
+
+
+def make_queue(sender, **kwargs) -> FCMDeliveryQueue:
+    # A long flush interval keeps the worker from re-sending requeued pushes mid-test
+    return FCMDeliveryQueue(sender=sender, flush_interval_seconds=10, **kwargs)
+
+
+def test_retryable_pushes_are_requeued_with_backoff(monkeypatch):
+    monkeypatch.setattr(fcm_delivery_service, "FCM_RETRY_BASE_SECONDS", 0.01)
+    busy = push("busy")
+
+    async def scenario():
+        queue = make_queue(lambda batch: {"success": 1, "failure": 1, "invalid_tokens": [], "retry": [busy]})
+        await queue._send([push("ok"), busy])
+        assert queue.stats()["retries_pending"] == 1
+        await asyncio.sleep(0.05)
+        queue._executor.shutdown()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert list(queue._queue) == [{**busy, "attempts": 1}]
+    assert queue.delivered == 1
+    assert queue.retried == 1
+    assert queue.failed == 0
+    assert queue.stats()["retries_pending"] == 0
+
+
+def test_push_is_dropped_after_max_retries():
+    exhausted = push("busy", attempts=3)
+
+    async def scenario():
+        queue = make_queue(lambda batch: {"success": 0, "failure": 1, "invalid_tokens": [], "retry": [exhausted]}, max_retries=3)
+        await queue._send([exhausted])
+        queue._executor.shutdown()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.retried == 0
+    assert queue.dropped_after_retries == 1
+    assert queue.stats()["retries_pending"] == 0
+
+
+def test_sender_crash_retries_the_whole_batch(monkeypatch):
+    monkeypatch.setattr(fcm_delivery_service, "FCM_RETRY_BASE_SECONDS", 60)
+
+    def sender(batch):
+        raise RuntimeError("session closed")
+
+    async def scenario():
+        queue = make_queue(sender)
+        await queue._send([push("a"), push("b")])
+        queue._executor.shutdown()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.retried == 2
+    assert queue.failed == 0
+    assert queue.last_error == "session closed"
+
+
+def test_invalid_tokens_are_pruned_once(monkeypatch):
+    users = FakeUsers()
+    monkeypatch.setattr(fcm_delivery_service, "users_collection", users)
+
+    async def scenario():
+        queue = make_queue(lambda batch: {"success": 0, "failure": 3, "invalid_tokens": ["gone", "gone", "stale"], "retry": []})
+        await queue._send([push("gone"), push("gone"), push("stale")])
+        queue._executor.shutdown()
+        return queue
+
+    queue = asyncio.run(scenario())
+    (query, update), = users.calls
+    assert sorted(query["fcm_token"]["$in"]) == ["gone", "stale"]
+    assert update == {"$unset": {"fcm_token": ""}}
+    assert queue.tokens_pruned == 2
+    assert queue.failed == 3
+    assert queue.retried == 0
+
+
+def test_stop_cancels_pending_retries(monkeypatch):
+    monkeypatch.setattr(fcm_delivery_service, "FCM_RETRY_BASE_SECONDS", 0.01)
+    busy = push("busy")
+
+    async def scenario():
+        queue = make_queue(lambda batch: {"success": 0, "failure": 1, "invalid_tokens": [], "retry": [busy]})
+        await queue._send([busy])
+        await queue.stop(drain_timeout=0)
+        # Past the backoff: a retry that still fired would requeue and start a worker
+        await asyncio.sleep(0.05)
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert not queue._queue
+    assert queue._worker is None
+    assert queue.stats()["retries_pending"] == 0
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+from firebase_admin import exceptions, messaging
+
+import firebase_service
+from firebase_service import _is_invalid_token_error, _is_retryable_error, send_fcm_batch
+
+
+@pytest.mark.parametrize("error", [
+    messaging.UnregisteredError("gone"),
+    messaging.SenderIdMismatchError("other project")
+])
+def test_dead_tokens_are_pruned_not_retried(error):
+    assert _is_invalid_token_error(error)
+    assert not _is_retryable_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    messaging.QuotaExceededError("slow down"),
+    exceptions.UnavailableError("503"),
+    exceptions.InternalError("500"),
+    exceptions.DeadlineExceededError("timeout")
+])
+def test_transient_errors_are_retried(error):
+    assert _is_retryable_error(error)
+    assert not _is_invalid_token_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    exceptions.InvalidArgumentError("bad payload"),
+    messaging.ThirdPartyAuthError("apns cert"),
+    None
+])
+def test_permanent_errors_are_neither(error):
+    assert not _is_retryable_error(error)
+    assert not _is_invalid_token_error(error)
+
+
+def push(token: str) -> dict:
+    return {"token": token, "title": "T", "body": "B", "data": {"notification_id": token}}
+
+
+def batch_response(*exceptions_by_message):
+    responses = [SimpleNamespace(success=error is None, exception=error) for error in exceptions_by_message]
+    return SimpleNamespace(
+        success_count=sum(1 for r in responses if r.success),
+        failure_count=sum(1 for r in responses if not r.success),
+        responses=responses
+    )
+
+
+@pytest.fixture
+def firebase_app(monkeypatch):
+    monkeypatch.setattr(firebase_service, "_firebase_app", object())
+
+
+def test_send_fcm_batch_sorts_failures(monkeypatch, firebase_app):
+    pushes = [push("ok"), push("gone"), push("busy"), push("bad")]
+    monkeypatch.setattr(messaging, "send_each", lambda messages: batch_response(
+        None,
+        messaging.UnregisteredError("gone"),
+        exceptions.UnavailableError("503"),
+        exceptions.InvalidArgumentError("bad payload")
+    ))
+
+    result = send_fcm_batch(pushes)
+
+    assert result["success"] == 1
+    assert result["failure"] == 3
+    assert result["invalid_tokens"] == ["gone"]
+    assert result["retry"] == [pushes[2]]
+
+
+def test_send_fcm_batch_retries_whole_chunk_on_request_failure(monkeypatch, firebase_app):
+    monkeypatch.setattr(firebase_service, "FCM_BATCH_SIZE", 2)
+    calls = []
+
+    def send_each(messages):
+        calls.append(len(messages))
+        if len(calls) == 1:
+            raise exceptions.UnavailableError("connection reset")
+        return batch_response(*[None] * len(messages))
+
+    monkeypatch.setattr(messaging, "send_each", send_each)
+    pushes = [push(f"t{i}") for i in range(3)]
+
+    result = send_fcm_batch(pushes)
+
+    assert calls == [2, 1]
+    assert result["success"] == 1
+    assert result["failure"] == 2
+    assert result["retry"] == pushes[:2]
+
+
+def test_send_fcm_batch_without_firebase(monkeypatch):
+    monkeypatch.setattr(firebase_service, "_firebase_app", None)
+    result = send_fcm_batch([push("t")])
+    assert result == {"success": 0, "failure": 1, "invalid_tokens": [], "retry": []}
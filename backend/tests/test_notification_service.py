@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("motor")
+
+from notification_service import find_due_recurring_payments
+
+
+def reference_due_recurring_payments(groups, now):
+    """The per-pattern loop find_due_recurring_payments replaced"""
+    due = []
+    for group in groups:
+        for pattern in group["patterns"]:
+            dates = [date if date.tzinfo else date.replace(tzinfo=UTC) for date in pattern["dates"]]
+            intervals = [(dates[i] - dates[i - 1]).days for i in range(1, len(dates))]
+            avg_interval = sum(intervals) / len(intervals)
+            if not 28 <= avg_interval <= 32:
+                continue
+            next_expected = dates[-1] + timedelta(days=int(avg_interval))
+            days_until = (next_expected - now).days
+            if 2 <= days_until <= 4:
+                due.append({
+                    "user_id": group["_id"]["user_id"],
+                    "currency": group["_id"]["currency"],
+                    "key": pattern["key"],
+                    "description": pattern["last_description"],
+                    "amount": pattern["last_amount"],
+                    "days_until": days_until
+                })
+    return due
+
+
+def random_groups(rng: random.Random, now: datetime, users: int):
+    groups = []
+    for u in range(users):
+        for currency in rng.sample(["usd", "mmk"], rng.randint(1, 2)):
+            patterns = []
+            for p in range(rng.randint(1, 4)):
+                interval = rng.randint(20, 40)
+                # Place the next payment roughly a week either side of now
+                last = now - timedelta(days=interval) + timedelta(days=rng.randint(-7, 7), minutes=rng.randint(0, 1439))
+                dates = [last - timedelta(days=interval * i, minutes=rng.randint(-720, 720)) for i in range(rng.randint(2, 6))]
+                dates.sort()
+                if rng.random() < 0.5:
+                    # Motor hands back naive UTC datetimes
+                    dates = [date.replace(tzinfo=None) for date in dates]
+                patterns.append({
+                    "key": f"bill {p}",
+                    "dates": dates,
+                    "last_amount": rng.randint(5, 500),
+                    "last_description": f"Bill {p}"
+                })
+            groups.append({"_id": {"user_id": f"user-{u}", "currency": currency}, "patterns": patterns})
+    return groups
+
+
+def test_matches_reference_loop_on_random_patterns():
+    now = datetime(2026, 10, 17, 9, 30, tzinfo=UTC)
+    rng = random.Random(1234)
+    groups = random_groups(rng, now, users=300)
+
+    expected = reference_due_recurring_payments(groups, now)
+    assert expected, "fixture should produce some due payments"
+    assert find_due_recurring_payments(groups, now) == expected
+
+
+def test_monthly_payment_due_in_three_days():
+    now = datetime(2026, 10, 17, 12, 0, tzinfo=UTC)
+    last = now - timedelta(days=27)
+    groups = [{
+        "_id": {"user_id": "u1", "currency": "usd"},
+        "patterns": [
+            {"key": "netflix", "dates": [last - timedelta(days=60), last - timedelta(days=30), last], "last_amount": 15, "last_description": "Netflix"},
+            # Weekly, not monthly
+            {"key": "groceries", "dates": [now - timedelta(days=d) for d in (21, 14, 7)], "last_amount": 80, "last_description": "Groceries"}
+        ]
+    }]
+
+    assert find_due_recurring_payments(groups, now) == [{
+        "user_id": "u1",
+        "currency": "usd",
+        "key": "netflix",
+        "description": "Netflix",
+        "amount": 15,
+        "days_until": 3
+    }]
+
+
+def test_no_patterns():
+    assert find_due_recurring_payments([], datetime.now(UTC)) == []
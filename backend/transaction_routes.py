@@ -1,4 +1,5 @@
 import base64
+import csv
 import io
 import json
 import os
@@ -11,18 +12,24 @@ from typing import List, Optional
 import logging
 
 # Added BackgroundTasks to imports
-from fastapi import APIRouter, File, HTTPException, UploadFile, status, Depends, Query, Path, BackgroundTasks
+from fastapi import APIRouter, File, HTTPException, Response, UploadFile, status, Depends, Query, Path, BackgroundTasks
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pymongo.errors import BulkWriteError  # <--- PRO FIX IMPORT
 
 from ai_usage_models import AIFeatureType, AIProviderType
 from ai_usage_service import track_ai_usage
+from ai_governor_service import ai_governor, estimate_tokens
+from ai_response_cache_service import ai_response_cache
 from utils import get_current_user, require_premium
 from recurring_transaction_service import disable_recurrence_for_parent, disable_recurrence_for_transaction, get_recurring_transaction_preview
 from recurrence_models import RecurrenceConfig, RecurrencePreviewRequest, TransactionRecurrence
-from budget_service import update_all_user_budgets, update_relevant_budgets
+from budget_service import apply_budget_transaction_delta, apply_budget_transaction_edit
+from recompute_queue_service import recompute_queue
+from balance_service import apply_balance_delta, transaction_delta, transactions_delta
+from statement_import_service import detect_statement_format, import_statement
 from models import (
-    Currency, MultipleTransactionExtraction,TextExtractionRequest, TransactionExtraction, 
+    Currency, MultipleTransactionExtraction, StatementImportResult, TextExtractionRequest, TransactionExtraction, 
     TransactionCreate, TransactionResponse, TransactionType,
     TransactionUpdate
 )
@@ -81,16 +88,11 @@ async def create_transaction(
 
     result = await transactions_collection.insert_one(new_transaction)
 
-    # === FIX: Cache Invalidation Strategy ===
-    # We simply wipe the cache. The next time get_balance() is called, 
-    # it will automatically re-aggregate all transactions for 100% accuracy.
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
-
     if not result.inserted_id:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create transaction")
+
+    # Keep the balance ledger current with an atomic delta (no re-aggregation)
+    await apply_balance_delta(current_user["_id"], transaction_delta(new_transaction))
     
     # Check for large transaction
     try:
@@ -116,12 +118,7 @@ async def create_transaction(
     except Exception as e:
         print(f"Error checking large transaction: {e}")
     
-    background_tasks.add_task(
-        update_relevant_budgets,
-        current_user["_id"], 
-        transaction_data.date,
-        transaction_data.currency.value
-    )
+    background_tasks.add_task(apply_budget_transaction_delta, current_user["_id"], new_transaction)
 
     # 2. Mark AI Data as Stale
     await users_collection.update_one(
@@ -150,18 +147,15 @@ async def create_transaction(
     )
 
 
-@router.get("", response_model=List[TransactionResponse])
-async def get_transactions(
-    current_user: dict = Depends(get_current_user),
-    limit: int = Query(default=50, le=10000),
-    skip: int = Query(default=0, ge=0),
+def _build_transactions_query(
+    user_id: str,
     transaction_type: Optional[TransactionType] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     currency: Optional[Currency] = None
-):
-    """Get user transactions with filters"""
-    query = {"user_id": current_user["_id"]}
+) -> dict:
+    """Build the transactions filter shared by listing and export"""
+    query = {"user_id": user_id}
     
     if transaction_type:
         query["type"] = transaction_type.value
@@ -177,12 +171,77 @@ async def get_transactions(
             date_filter["$lte"] = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
         query["date"] = date_filter
 
-    cursor = transactions_collection.find(query)\
-        .sort([("date", -1), ("created_at", -1)])\
-        .skip(skip)\
-        .limit(limit)
+    return query
+
+
+# Listing order; _id breaks ties so the keyset cursor is unambiguous
+TRANSACTIONS_SORT = [("date", -1), ("created_at", -1), ("_id", -1)]
+# Largest page one request may return; deeper reads page with X-Next-Cursor
+TRANSACTIONS_MAX_PAGE_SIZE = 500
+
+
+def encode_transactions_cursor(transaction: dict) -> str:
+    """Opaque cursor pointing just after `transaction` in TRANSACTIONS_SORT order"""
+    payload = {
+        "d": transaction["date"].isoformat(),
+        "c": transaction["created_at"].isoformat(),
+        "i": transaction["_id"]
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_transactions_cursor(cursor: str) -> dict:
+    """Turn a cursor back into a range predicate over (date, created_at, _id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        date = datetime.fromisoformat(payload["d"])
+        created_at = datetime.fromisoformat(payload["c"])
+        last_id = payload["i"]
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+    return {
+        "$or": [
+            {"date": {"$lt": date}},
+            {"date": date, "created_at": {"$lt": created_at}},
+            {"date": date, "created_at": created_at, "_id": {"$lt": last_id}}
+        ]
+    }
+
+
+@router.get("", response_model=List[TransactionResponse])
+async def get_transactions(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    limit: int = Query(default=50, ge=1, le=TRANSACTIONS_MAX_PAGE_SIZE),
+    skip: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    currency: Optional[Currency] = None
+):
+    """
+    Get user transactions with filters.
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page;
+    cursor paging resumes with a range predicate, so it stays flat at any depth
+    (`skip` is still accepted for older clients).
+    """
+    query = _build_transactions_query(current_user["_id"], transaction_type, start_date, end_date, currency)
+
+    if cursor:
+        query = {"$and": [query, decode_transactions_cursor(cursor)]}
+
+    db_cursor = transactions_collection.find(query).sort(TRANSACTIONS_SORT)
+    if skip and not cursor:
+        db_cursor = db_cursor.skip(skip)
+    db_cursor = db_cursor.limit(limit)
     
-    transactions = await cursor.to_list(length=limit)
+    transactions = await db_cursor.to_list(length=limit)
+
+    if len(transactions) == limit:
+        response.headers["X-Next-Cursor"] = encode_transactions_cursor(transactions[-1])
 
     result = []
     for t in transactions:
@@ -209,6 +268,78 @@ async def get_transactions(
     return result
 
 
+# Columns for /export, in CSV column order
+EXPORT_FIELDS = [
+    "id", "type", "main_category", "sub_category", "date", "description",
+    "amount", "currency", "created_at", "updated_at", "parent_transaction_id"
+]
+EXPORT_BATCH_SIZE = 500
+
+
+def _export_row(t: dict) -> dict:
+    """Flatten a transaction document into an export row"""
+    return {
+        "id": t["_id"],
+        "type": t["type"],
+        "main_category": t["main_category"],
+        "sub_category": t["sub_category"],
+        "date": t["date"].isoformat(),
+        "description": t.get("description") or "",
+        "amount": t["amount"],
+        "currency": t.get("currency", "usd"),
+        "created_at": t["created_at"].isoformat(),
+        "updated_at": t.get("updated_at", t["created_at"]).isoformat(),
+        "parent_transaction_id": (t.get("recurrence") or {}).get("parent_transaction_id") or ""
+    }
+
+
+@router.get("/export")
+async def export_transactions(
+    current_user: dict = Depends(get_current_user),
+    format: str = Query(default="ndjson", regex="^(ndjson|csv)$"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    currency: Optional[Currency] = None
+):
+    """
+    Stream the user's full transaction history as NDJSON or CSV.
+    Rows are read from the cursor in batches and written as they arrive,
+    so memory stays flat regardless of history size.
+    """
+    query = _build_transactions_query(current_user["_id"], transaction_type, start_date, end_date, currency)
+    projection = {"user_id": 0, "recurrence.config": 0, "recurrence.last_created_date": 0}
+
+    async def generate_rows():
+        db_cursor = transactions_collection.find(query, projection)\
+            .sort(TRANSACTIONS_SORT)\
+            .batch_size(EXPORT_BATCH_SIZE)
+
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            async for t in db_cursor:
+                writer.writerow(_export_row(t))
+                # Flush roughly one batch at a time
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            yield buffer.getvalue()
+        else:
+            async for t in db_cursor:
+                yield json.dumps(_export_row(t)) + "\n"
+
+    timestamp = datetime.now(UTC).strftime("%Y%m%d")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generate_rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions_{timestamp}.{format}"'}
+    )
+
+
 @router.post("/{transaction_id}/disable-recurrence")
 async def disable_transaction_recurrence(
     background_tasks: BackgroundTasks,
@@ -377,24 +508,22 @@ async def update_transaction(
         if transaction_data.recurrence.enabled and not transaction.get("recurrence", {}).get("enabled"):
             update_data["recurrence"]["last_created_date"] = update_data.get("date", transaction["date"])
 
-    await transactions_collection.update_one(
-    {"_id": transaction_id, "user_id": current_user["_id"]}, 
-    {"$set": update_data}
-    )
-
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
+    # Return the pre-image so the balance delta is computed against what was
+    # actually replaced, even if another request edited it in between
+    previous_transaction = await transactions_collection.find_one_and_update(
+        {"_id": transaction_id, "user_id": current_user["_id"]}, 
+        {"$set": update_data}
     )
 
     updated_transaction = await transactions_collection.find_one({"_id": transaction_id})
+
+    if previous_transaction and updated_transaction:
+        deltas = transaction_delta(previous_transaction, sign=-1)
+        transaction_delta(updated_transaction, sign=1, deltas=deltas)
+        await apply_balance_delta(current_user["_id"], deltas)
     
-    background_tasks.add_task(
-        update_relevant_budgets,
-        current_user["_id"], 
-        transaction["date"], 
-        transaction["currency"]
-    )
+    if previous_transaction and updated_transaction:
+        background_tasks.add_task(apply_budget_transaction_edit, current_user["_id"], previous_transaction, updated_transaction)
 
     await users_collection.update_one(
         {"_id": current_user["_id"]},
@@ -444,11 +573,6 @@ async def delete_transaction(
         "_id": transaction_id, 
         "user_id": current_user["_id"]
     })
-
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$unset": {"balances": ""}}
-    )
     
     if result.deleted_count == 0:
         raise HTTPException(
@@ -456,12 +580,9 @@ async def delete_transaction(
             detail="Failed to delete transaction"
         )
 
-    background_tasks.add_task(
-        update_relevant_budgets,
-        current_user["_id"], 
-        transaction["date"],
-        transaction["currency"]
-    )
+    await apply_balance_delta(current_user["_id"], transaction_delta(transaction, sign=-1))
+
+    background_tasks.add_task(apply_budget_transaction_delta, current_user["_id"], transaction, -1)
 
     await users_collection.update_one(
         {"_id": current_user["_id"]},
@@ -506,10 +627,17 @@ async def transcribe_audio(
             client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
             
             with open(temp_path, 'rb') as audio_file:
-                transcript = await client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="en" 
+                transcript = await ai_governor.run(
+                    "openai",
+                    lambda: client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio_file,
+                        language="en" 
+                    ),
+                    lane="interactive",
+                    estimated_tokens=0,
+                    # The upload stream is consumed by the first attempt
+                    retries=0
                 )
             
             transcription_length = len(transcript.text)
@@ -627,44 +755,33 @@ Respond in JSON format:
         from openai import AsyncOpenAI
         client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         
-        response = await client.chat.completions.create(
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Extract transaction from: {request.text}"}
+        ]
+
+        content = await ai_response_cache.complete(
+            provider="openai",
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Extract transaction from: {request.text}"}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
+            temperature=0.3,
+            prompt=messages,
+            params={"response_format": "json_object"},
+            call=lambda: ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    temperature=0.3
+                ),
+                lane="interactive",
+                estimated_tokens=estimate_tokens(system_prompt, request.text, max_output_tokens=500)
+            ),
+            user_id=current_user["_id"],
+            feature_type=AIFeatureType.TRANSACTION_TEXT_EXTRACTION
         )
 
-        if hasattr(response, 'usage'):
-            from ai_usage_service import track_ai_usage
-            from ai_usage_models import AIFeatureType, AIProviderType
-            import logging
-            
-            
-            
-            input_tokens = response.usage.prompt_tokens
-            output_tokens = response.usage.completion_tokens
-            total_tokens = response.usage.total_tokens
-            
-            logger.info(f"📝 [OPENAI TOKEN USAGE - Text Extraction] User: {current_user['_id']}")
-            logger.info(f"   📥 Input tokens: {input_tokens:,}")
-            logger.info(f"   📤 Output tokens: {output_tokens:,}")
-            logger.info(f"   📊 Total tokens: {total_tokens:,}")
-            logger.info(f"   🤖 Model: gpt-4o-mini")
-            
-            await track_ai_usage(
-                user_id=current_user["_id"],
-                feature_type=AIFeatureType.TRANSACTION_TEXT_EXTRACTION,
-                provider=AIProviderType.OPENAI,
-                model_name="gpt-4o-mini",
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens
-            )
-        
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
         
         return TransactionExtraction(
             type=result["type"],
@@ -768,45 +885,33 @@ Respond in JSON format:
         from openai import AsyncOpenAI
         client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         
-        response = await client.chat.completions.create(
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Extract all transactions from: {request.text}"}
+        ]
+
+        content = await ai_response_cache.complete(
+            provider="openai",
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Extract all transactions from: {request.text}"}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
+            temperature=0.3,
+            prompt=messages,
+            params={"response_format": "json_object"},
+            call=lambda: ai_governor.run(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    temperature=0.3
+                ),
+                lane="interactive",
+                estimated_tokens=estimate_tokens(system_prompt, request.text, max_output_tokens=1000)
+            ),
+            user_id=current_user["_id"],
+            feature_type=AIFeatureType.TRANSACTION_TEXT_EXTRACTION
         )
 
-
-        if hasattr(response, 'usage'):
-            from ai_usage_service import track_ai_usage
-            from ai_usage_models import AIFeatureType, AIProviderType
-            import logging
-            
-            
-            
-            input_tokens = response.usage.prompt_tokens
-            output_tokens = response.usage.completion_tokens
-            total_tokens = response.usage.total_tokens
-            
-            logger.info(f"📝 [OPENAI TOKEN USAGE - Multiple Text Extraction] User: {current_user['_id']}")
-            logger.info(f"   📥 Input tokens: {input_tokens:,}")
-            logger.info(f"   📤 Output tokens: {output_tokens:,}")
-            logger.info(f"   📊 Total tokens: {total_tokens:,}")
-            logger.info(f"   🤖 Model: gpt-4o-mini")
-            
-            await track_ai_usage(
-                user_id=current_user["_id"],
-                feature_type=AIFeatureType.TRANSACTION_TEXT_EXTRACTION,
-                provider=AIProviderType.OPENAI,
-                model_name="gpt-4o-mini",
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens
-            )
-        
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
         
         transactions = []
         for tx_data in result.get("transactions", []):
@@ -840,7 +945,6 @@ Respond in JSON format:
 @router.post("/batch-create", response_model=List[TransactionResponse])
 async def batch_create_transactions(
     transactions_data: List[TransactionCreate],
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(require_premium)
 ):
     """Create multiple transactions at once (Optimized with BulkWriteError handling)"""
@@ -908,6 +1012,7 @@ async def batch_create_transactions(
         try:
             # ordered=False continues inserting even if one fails
             await transactions_collection.insert_many(new_transactions, ordered=False)
+            inserted_transactions = new_transactions
             
         except BulkWriteError as bwe:
             # === PRO FIX: Handle partial failures ===
@@ -922,6 +1027,9 @@ async def batch_create_transactions(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="All batch transactions failed to insert."
                 )
+            
+            failed_indexes = {err["index"] for err in bwe.details["writeErrors"]}
+            inserted_transactions = [doc for i, doc in enumerate(new_transactions) if i not in failed_indexes]
         
         except Exception as e:
             # Catch other unexpected errors
@@ -933,16 +1041,61 @@ async def batch_create_transactions(
 
         # 3. Post-processing (Background tasks & Cache invalidation)
         # We run this if at least one transaction succeeded (either normal flow or partial BulkWriteError)
-        background_tasks.add_task(update_all_user_budgets, current_user["_id"])
+        # Coalesced with any other pending recompute for the same user/currency;
+        # only budgets covering the inserted dates are recomputed
+        recompute_queue.schedule_for_transactions(current_user["_id"], inserted_transactions)
+
+        # One combined $inc for the whole batch
+        await apply_balance_delta(current_user["_id"], transactions_delta(inserted_transactions))
 
         await users_collection.update_one(
             {"_id": current_user["_id"]},
-            {"$unset": {"balances": ""}, "$set": {"ai_data_stale": True}}
+            {"$set": {"ai_data_stale": True}}
         )
 
     return response_models
 
 
+@router.post("/import", response_model=StatementImportResult)
+async def import_statement_file(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, regex="^(csv|ofx)$"),
+    currency: Optional[Currency] = None,
+    current_user: dict = Depends(require_premium)
+):
+    """
+    Import a bank statement (CSV or OFX/QFX).
+    Rows are parsed and written in bounded chunks, rows already imported are skipped
+    by content hash, and balances/budgets are updated as each chunk lands.
+    """
+    file_format = format or detect_statement_format(file.filename)
+    default_currency = currency.value if currency else current_user.get("default_currency", "usd")
+
+    try:
+        result = await import_statement(
+            current_user["_id"], file.file, file_format, default_currency
+        )
+    except Exception as e:
+        logger.error(f"Statement import failed: {str(e)}")
+        # Chunks written before the failure have already updated balances and budgets
+        await users_collection.update_one(
+            {"_id": current_user["_id"]},
+            {"$set": {"ai_data_stale": True}}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Statement import failed: {str(e)}"
+        )
+
+    if result.imported:
+        await users_collection.update_one(
+            {"_id": current_user["_id"]},
+            {"$set": {"ai_data_stale": True}}
+        )
+
+    return result
+
+
 # Constants
 MAX_IMAGE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB Hard Limit
 TARGET_IMAGE_SIZE = (1024, 1024)         # Resize target for Vision API
@@ -1081,32 +1234,37 @@ Respond in JSON format:
         from openai import AsyncOpenAI
         client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this receipt and extract transaction details:"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+        response = await ai_governor.run(
+            "openai",
+            lambda: client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": system_prompt
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Analyze this receipt and extract transaction details:"
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=1000,
-            temperature=0.3
+                        ]
+                    }
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=1000,
+                temperature=0.3
+            ),
+            lane="interactive",
+            estimated_tokens=estimate_tokens(system_prompt, max_output_tokens=1000) + 1000
         )
 
         # 8. Track AI Usage
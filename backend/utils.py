@@ -1,12 +1,16 @@
+import os
+import time
+from collections import OrderedDict
 from datetime import UTC, datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException , status
 from fastapi import security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from ai_chatbot import financial_chatbot
-from database import users_collection, transactions_collection, goals_collection
+from database import users_collection
+from balance_service import build_user_balances, empty_balance
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from password_service import get_password_hash, verify_password
 
 
 from config import settings
@@ -14,17 +18,30 @@ from config import settings
 
 security = HTTPBearer()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# ==================== PRINCIPAL CACHE ====================
 
+# Authenticated users are served from a small in-process cache keyed by token
+# subject. Updates made through this process invalidate the entry immediately;
+# the TTL bounds how long another worker can serve a stale principal.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+# Everything routes read from current_user; the password hash and the
+# balances ledger are never needed on the request path
+PRINCIPAL_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "email": 1,
+    "created_at": 1,
+    "subscription_type": 1,
+    "subscription_expires_at": 1,
+    "default_currency": 1,
+    "language": 1
+}
 
-
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+# email -> (monotonic expiry, projected user), least recently used first
+_principal_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_principal_stats = {"hits": 0, "misses": 0, "invalidations": 0}
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -53,13 +70,50 @@ def verify_token(token: str) -> str:
         )
 
 
+def cache_principal(user: dict):
+    """Store a (projected) user document as the principal for its email"""
+    email = user["email"]
+    principal = {key: user[key] for key in PRINCIPAL_PROJECTION if key in user}
+    _principal_cache.pop(email, None)
+    _principal_cache[email] = (time.monotonic() + PRINCIPAL_CACHE_TTL_SECONDS, principal)
+    while len(_principal_cache) > PRINCIPAL_CACHE_MAX_SIZE:
+        _principal_cache.popitem(last=False)
+
+
+def invalidate_principal(email: Optional[str]):
+    """Drop the cached principal after the user's document changed"""
+    if email and _principal_cache.pop(email, None) is not None:
+        _principal_stats["invalidations"] += 1
+
+
+def principal_cache_stats() -> dict:
+    lookups = _principal_stats["hits"] + _principal_stats["misses"]
+    return {
+        "size": len(_principal_cache),
+        "max_size": PRINCIPAL_CACHE_MAX_SIZE,
+        "ttl_seconds": PRINCIPAL_CACHE_TTL_SECONDS,
+        **_principal_stats,
+        "hit_rate": round(_principal_stats["hits"] / lookups, 4) if lookups else 0.0
+    }
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current authenticated user"""
+    """Get current authenticated user (projected, without password or balances)"""
     email = verify_token(credentials.credentials)
-    # [FIX] Added await
-    user = await users_collection.find_one({"email": email})
+
+    entry = _principal_cache.get(email)
+    if entry and entry[0] > time.monotonic():
+        _principal_cache.move_to_end(email)
+        _principal_stats["hits"] += 1
+        # Copy so a route mutating its current_user can't leak into the cache
+        return dict(entry[1])
+
+    _principal_stats["misses"] += 1
+    user = await users_collection.find_one({"email": email}, PRINCIPAL_PROJECTION)
     if not user:
+        _principal_cache.pop(email, None)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    cache_principal(user)
     return user
 
 
@@ -84,9 +138,10 @@ def ensure_utc_datetime(dt) -> datetime:
 
 async def get_user_balance(user_id: str, currency: Optional[str] = None) -> dict:
     """
-    Get balance with Read-Through Caching to fix scalability.
+    Get balance from the per-currency ledger on the user document.
+    The ledger is kept current by $inc deltas on every write (see balance_service),
+    so this is a single O(1) read. Only users without a ledger yet get a one-time build.
     """
-    # 1. FAST PATH: Check cache
     # [FIX] Added await
     user = await users_collection.find_one({"_id": user_id}, {"balances": 1, "default_currency": 1})
     
@@ -94,85 +149,17 @@ async def get_user_balance(user_id: str, currency: Optional[str] = None) -> dict
     if not user:
          return {"balances": {}}
          
-    cached_balances = user.get("balances")
-
-    # If we have a cache, use it immediately
-    if cached_balances:
-        if currency:
-            data = cached_balances.get(currency, {
-                "balance": 0, "available_balance": 0, 
-                "allocated_to_goals": 0, "total_inflow": 0, "total_outflow": 0,
-                "currency": currency
-            })
-            return data
-        else:
-            return {"balances": cached_balances}
-
-    # 2. SLOW PATH: Aggregation (Run only if cache is missing/invalidated)
-    tx_pipeline = [
-        {"$match": {"user_id": user_id}},
-        {
-            "$group": {
-                "_id": "$currency",
-                "total_inflow": {
-                    "$sum": {"$cond": [{"$eq": ["$type", "inflow"]}, "$amount", 0]}
-                },
-                "total_outflow": {
-                    "$sum": {"$cond": [{"$eq": ["$type", "outflow"]}, "$amount", 0]}
-                }
-            }
-        }
-    ]
-    goals_pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$group": {"_id": "$currency", "total_allocated": {"$sum": "$current_amount"}}}
-    ]
-    
-    # [FIX] Async Aggregation
-    tx_cursor = transactions_collection.aggregate(tx_pipeline)
-    tx_results = await tx_cursor.to_list(length=None)
-    
-    goal_cursor = goals_collection.aggregate(goals_pipeline)
-    goal_results = await goal_cursor.to_list(length=None)
-    
-    tx_map = {res["_id"]: res for res in tx_results if res["_id"]}
-    all_currencies = set(tx_map.keys()) | {g["_id"] for g in goal_results if g["_id"]}
-    
-    if not all_currencies:
-        all_currencies = {user.get("default_currency", "usd")}
-    
-    balances = {}
-    for curr in all_currencies:
-        tx_data = tx_map.get(curr, {"total_inflow": 0, "total_outflow": 0})
-        # Safe generator expression for goals
-        allocated = next((g["total_allocated"] for g in goal_results if g["_id"] == curr), 0)
-        
-        # Ensure values are floats/ints, not None
-        total_inflow = tx_data.get("total_inflow", 0) or 0
-        total_outflow = tx_data.get("total_outflow", 0) or 0
-        
-        balance = total_inflow - total_outflow
-        balances[curr] = {
-            "currency": curr,
-            "balance": balance,
-            "available_balance": balance - allocated,
-            "allocated_to_goals": allocated,
-            "total_inflow": total_inflow,
-            "total_outflow": total_outflow
-        }
-
-    # 3. CACHE UPDATE: Save the result so next time is O(1)
-    # [FIX] Added await
-    await users_collection.update_one(
-        {"_id": user_id},
-        {"$set": {"balances": balances}}
-    )
+    balances = user.get("balances")
+
+    if balances is None:
+        balances = await build_user_balances(user_id, user.get("default_currency", "usd"))
 
     if currency:
-        return balances.get(currency, {
-            "currency": currency, "balance": 0, "available_balance": 0, 
-            "allocated_to_goals": 0, "total_inflow": 0, "total_outflow": 0
-        })
+        return balances.get(currency, empty_balance(currency))
+
+    if not balances:
+        default_currency = user.get("default_currency", "usd")
+        balances = {default_currency: empty_balance(default_currency)}
     return {"balances": balances}
 
 
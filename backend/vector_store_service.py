@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import logging
+
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from dotenv import load_dotenv
+
+from embedding_cache_service import cached_embeddings
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Each user gets one collection (`user_<id>`); collections survive restarts,
+# and only the most recently used ones are kept open in memory.
+#
+# With CHROMA_SERVER_HOST set, every worker talks to one Chroma server and
+# shares its collections. Otherwise the process embeds Chroma on disk at
+# CHROMA_PERSIST_DIR: PersistentClient is not safe across processes, so that
+# mode requires a single uvicorn worker (or a separate directory per worker).
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST")
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", "8000"))
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_data")
+VECTOR_STORE_MEMORY_BUDGET_MB = int(os.getenv("VECTOR_STORE_MEMORY_BUDGET_MB", "512"))
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+
+# Rough in-memory footprint of one chunk: float32 vector + text + index overhead
+ESTIMATED_CHUNK_BYTES = EMBEDDING_DIMENSIONS * 4 + CHUNK_SIZE + 512
+
+# Documents that must reach the model whole
+UNSPLIT_DOCUMENT_TYPES = ["chronological_index", "goals_overview"]
+
+
+def collection_name_for(user_id: str) -> str:
+    return f"user_{user_id}"
+
+
+def document_content_hash(doc: Document) -> str:
+    """Stable hash of a document's text and metadata (hash fields excluded)"""
+    metadata = {k: v for k, v in doc.metadata.items() if k not in ("content_hash", "source_hash")}
+    payload = doc.page_content + "\0" + json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VectorStoreManager:
+    """
+    Persistent, memory-bounded store of per-user RAG collections.
+
+    - Hit: the user's collection is already open in this process.
+    - Miss: it is opened from disk (no embedding calls) or, if it doesn't
+      exist yet, built from the user's financial documents.
+    - Stale: the user's data changed, so the documents are regenerated and
+      synced by content hash; only new or changed chunks are embedded.
+    - Eviction: least recently used collections are closed once the
+      estimated footprint exceeds the memory budget.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        memory_budget_bytes: int = VECTOR_STORE_MEMORY_BUDGET_MB * 1024 * 1024
+    ):
+        self.persist_directory = persist_directory
+        self.memory_budget_bytes = memory_budget_bytes
+
+        if CHROMA_SERVER_HOST:
+            self.client = chromadb.HttpClient(
+                host=CHROMA_SERVER_HOST,
+                port=CHROMA_SERVER_PORT,
+                settings=ChromaSettings(anonymized_telemetry=False)
+            )
+        else:
+            # Chroma's own segment cache follows the same budget, so closing a
+            # collection here actually lets its index be unloaded
+            self.client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=ChromaSettings(
+                    anonymized_telemetry=False,
+                    chroma_segment_cache_policy="LRU",
+                    chroma_memory_limit_bytes=memory_budget_bytes
+                )
+            )
+
+        self.embeddings = None
+        try:
+            # Unchanged chunks (and identical text across users) are served from the cache
+            self.embeddings = cached_embeddings(
+                OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"), model=EMBEDDING_MODEL),
+                EMBEDDING_MODEL
+            )
+        except Exception as e:
+            print(f"Error initializing embeddings: {e}")
+
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", " ", ""]
+        )
+
+        # user_id -> (vector store, estimated bytes), least recently used first
+        self._open: "OrderedDict[str, tuple]" = OrderedDict()
+        self._open_bytes = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._stale: Set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_loads = 0
+        self.syncs = 0
+        self.evictions = 0
+        self.chunks_embedded = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+
+    # ==================== LRU BOOKKEEPING ====================
+
+    def _lock_for(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    def _remember(self, user_id: str, vector_store: Chroma, chunk_count: int):
+        self._forget(user_id)
+        size = max(chunk_count, 1) * ESTIMATED_CHUNK_BYTES
+        self._open[user_id] = (vector_store, size)
+        self._open_bytes += size
+
+        # Always keep the collection that was just opened
+        while self._open_bytes > self.memory_budget_bytes and len(self._open) > 1:
+            evicted_user, (_, evicted_size) = self._open.popitem(last=False)
+            self._open_bytes -= evicted_size
+            self._locks.pop(evicted_user, None)
+            self.evictions += 1
+
+    def _forget(self, user_id: str):
+        entry = self._open.pop(user_id, None)
+        if entry:
+            self._open_bytes -= entry[1]
+
+    # ==================== COLLECTIONS ====================
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Split documents into chunks. Every chunk carries `source_hash` (its
+        document) and `content_hash` (itself), which doubles as its id.
+        """
+        split = []
+        for doc in documents:
+            doc.metadata["source_hash"] = document_content_hash(doc)
+            if doc.metadata.get("type") in UNSPLIT_DOCUMENT_TYPES:
+                chunks = [doc]
+            else:
+                chunks = self.text_splitter.split_documents([doc])
+            for chunk in chunks:
+                chunk.metadata["content_hash"] = document_content_hash(chunk)
+            split.extend(chunks)
+        return split
+
+    def _open_collection(self, user_id: str) -> Chroma:
+        return Chroma(
+            client=self.client,
+            collection_name=collection_name_for(user_id),
+            embedding_function=self.embeddings
+        )
+
+    def _load_from_disk(self, user_id: str) -> Optional[tuple]:
+        """(vector store, chunk count) if the user's collection was persisted earlier"""
+        try:
+            collection = self.client.get_collection(collection_name_for(user_id))
+        except Exception:
+            return None
+        count = collection.count()
+        if count == 0:
+            return None
+        return self._open_collection(user_id), count
+
+    def _sync(self, user_id: str, documents: List[Document]) -> tuple:
+        """
+        Bring the user's collection in line with `documents`: embed chunks whose
+        hash is new, delete chunks whose hash vanished, keep the rest.
+        Returns (vector store, chunk count, embedded, deleted).
+        """
+        wanted: Dict[str, Document] = {}
+        for chunk in self.split_documents(documents):
+            wanted.setdefault(chunk.metadata["content_hash"], chunk)
+
+        vector_store = self._open_collection(user_id)
+        existing = set(vector_store.get(include=[])["ids"])
+
+        vanished = list(existing - wanted.keys())
+        new_ids = [content_hash for content_hash in wanted if content_hash not in existing]
+
+        if vanished:
+            vector_store.delete(ids=vanished)
+        if new_ids:
+            vector_store.add_documents([wanted[content_hash] for content_hash in new_ids], ids=new_ids)
+
+        return vector_store, len(wanted), len(new_ids), len(vanished)
+
+    async def get_or_create(
+        self,
+        user_id: str,
+        load_documents: Callable[[], Awaitable[List[Document]]]
+    ) -> Optional[Chroma]:
+        """
+        Return the user's vector store. `load_documents` is only called when
+        nothing is persisted for the user yet or their data was marked stale.
+        """
+        if not self.embeddings:
+            return None
+
+        if user_id in self._open and user_id not in self._stale:
+            self._open.move_to_end(user_id)
+            self.hits += 1
+            return self._open[user_id][0]
+
+        async with self._lock_for(user_id):
+            # Another request may have opened or synced it while we waited
+            if user_id in self._open and user_id not in self._stale:
+                self._open.move_to_end(user_id)
+                self.hits += 1
+                return self._open[user_id][0]
+
+            if user_id not in self._open:
+                self.misses += 1
+
+            if user_id not in self._stale:
+                loaded = await asyncio.to_thread(self._load_from_disk, user_id)
+                if loaded:
+                    self.disk_loads += 1
+                    self._remember(user_id, *loaded)
+                    return loaded[0]
+
+            # Cleared up front so a write that lands mid-sync marks it stale again
+            was_stale = user_id in self._stale
+            self._stale.discard(user_id)
+            synced = None
+            try:
+                documents = await load_documents()
+                if documents:
+                    synced = await asyncio.to_thread(self._sync, user_id, documents)
+            except Exception as e:
+                print(f"❌ Error syncing vector store: {e}")
+            if synced is None:
+                if was_stale:
+                    self._stale.add(user_id)
+                return None
+
+            vector_store, chunk_count, embedded, deleted = synced
+
+            self.syncs += 1
+            self.chunks_embedded += embedded
+            self.chunks_reused += chunk_count - embedded
+            self.chunks_deleted += deleted
+            print(f"✅ Synced vector store for user {user_id}: {chunk_count} chunks, {embedded} embedded, {deleted} deleted")
+
+            self._remember(user_id, vector_store, chunk_count)
+            return vector_store
+
+    def mark_stale(self, user_id: str):
+        """The user's data changed; re-sync their collection on next use"""
+        self._stale.add(user_id)
+
+    async def drop(self, user_id: str):
+        """Close the user's collection and delete it from disk (account deletion)"""
+        async with self._lock_for(user_id):
+            self._forget(user_id)
+            self._stale.discard(user_id)
+            try:
+                await asyncio.to_thread(self.client.delete_collection, collection_name_for(user_id))
+            except Exception as e:
+                # Chroma raises ValueError/NotFoundError depending on version when it was never created
+                if "does not exist" not in str(e).lower() and type(e).__name__ not in ("NotFoundError", "InvalidCollectionException"):
+                    raise
+        self._locks.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "open_collections": len(self._open),
+            "estimated_bytes": self._open_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_loads": self.disk_loads,
+            "syncs": self.syncs,
+            "evictions": self.evictions,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_reused": self.chunks_reused,
+            "chunks_deleted": self.chunks_deleted,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global manager shared by the OpenAI and Gemini chatbots
+try:
+    vector_store_manager = VectorStoreManager()
+    print(f"✅ Vector store manager initialized at {f'{CHROMA_SERVER_HOST}:{CHROMA_SERVER_PORT}' if CHROMA_SERVER_HOST else CHROMA_PERSIST_DIR}")
+except Exception as e:
+    print(f"❌ Failed to initialize vector store manager: {e}")
+    vector_store_manager = None
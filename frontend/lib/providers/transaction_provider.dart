@@ -11,6 +11,8 @@ class TransactionProvider with ChangeNotifier {
   Balance? _balance;
   bool _isLoading = false;
   String? _error;
+  // Cursor for the page after the loaded transactions; null when there is none
+  String? _nextCursor;
 
   List<Transaction> get transactions => _transactions;
   Balance? get balance => _balance;
@@ -50,20 +52,25 @@ Future<void> loadMoreTransactions({
   required int limit,
   required int currentCount,
 }) async {
+  // Nothing after the last page
+  if (_nextCursor == null) return;
+
   // Don't set loading state to avoid full rebuild
   try {
-    final newTransactions = await ApiService.getTransactions(
+    final page = await ApiService.getTransactionsPage(
       type: type,
       startDate: startDate,
       endDate: endDate,
       currency: currency, // ADD THIS LINE
-      limit: limit,
-      skip: 0,
+      // Fetch only the next page, following the cursor of the last one
+      limit: (limit - currentCount).clamp(1, ApiService.transactionsPageSize),
+      cursor: _nextCursor,
     );
+    _nextCursor = page.nextCursor;
     
-    // Only update if we got more transactions than we already have
-    if (newTransactions.length > currentCount) {
-      _transactions = newTransactions;
+    // Append the new page if there was one
+    if (page.transactions.isNotEmpty) {
+      _transactions = [..._transactions, ...page.transactions];
       notifyListeners();
     }
   } catch (e) {
@@ -197,7 +204,7 @@ Future<bool> updateTransaction({
     final int nonNullableLimit = limit ?? 50;
     final int nonNullableSkip = skip ?? 0;
 
-    _transactions = await ApiService.getTransactions(
+    final page = await ApiService.getTransactionsPage(
       type: type,
       startDate: startDate,
       endDate: endDate,
@@ -205,6 +212,33 @@ Future<bool> updateTransaction({
       limit: nonNullableLimit,
       skip: nonNullableSkip,
     );
+    _transactions = page.transactions;
+    _nextCursor = page.nextCursor;
+    _setLoading(false);
+  } catch (e) {
+    _setError(e.toString().replaceAll('Exception: ', ''));
+    _setLoading(false);
+  }
+}
+
+  // Fetch every transaction matching the filters (analytics), page by page
+  Future<void> fetchAllTransactions({
+  TransactionType? type,
+  DateTime? startDate,
+  DateTime? endDate,
+  Currency? currency,
+}) async {
+  _setLoading(true);
+  _setError(null);
+
+  try {
+    _transactions = await ApiService.getAllTransactions(
+      type: type,
+      startDate: startDate,
+      endDate: endDate,
+      currency: currency,
+    );
+    _nextCursor = null;
     _setLoading(false);
   } catch (e) {
     _setError(e.toString().replaceAll('Exception: ', ''));
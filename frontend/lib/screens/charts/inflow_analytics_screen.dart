@@ -83,12 +83,11 @@ void initState() {
   endDate = DateTime.utc(endDate.year, endDate.month, endDate.day, 23, 59, 59);
 
   try {
-    await transactionProvider.fetchTransactions(
+    await transactionProvider.fetchAllTransactions(
       type: TransactionType.inflow,
       startDate: startDate,
       endDate: endDate,
       currency: _selectedCurrency,  // ADD THIS LINE
-      limit: 10000,
     );
 
     setState(() {
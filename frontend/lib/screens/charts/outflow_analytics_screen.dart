@@ -86,12 +86,11 @@ Future<void> _loadBalance() async {
     endDate = DateTime.utc(endDate.year, endDate.month, endDate.day, 23, 59, 59);
 
     try {
-      await transactionProvider.fetchTransactions(
+      await transactionProvider.fetchAllTransactions(
         type: TransactionType.outflow,
         startDate: startDate,
         endDate: endDate,
         currency: _selectedCurrency,
-        limit: 10000,
       );
 
       setState(() {
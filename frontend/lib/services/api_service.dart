@@ -401,6 +401,9 @@ class ApiService {
     }
   }
 
+  // Largest page GET /api/transactions returns; deeper reads follow X-Next-Cursor
+  static const int transactionsPageSize = 500;
+
   static Future<List<Transaction>> getTransactions({
     int limit = 50,
     int skip = 0,
@@ -409,7 +412,33 @@ class ApiService {
     DateTime? endDate,
     Currency? currency, // NEW
   }) async {
-    String url = '$baseUrl/api/transactions?limit=$limit&skip=$skip';
+    final page = await getTransactionsPage(
+      limit: limit,
+      skip: skip,
+      type: type,
+      startDate: startDate,
+      endDate: endDate,
+      currency: currency,
+    );
+    return page.transactions;
+  }
+
+  // One page plus the cursor for the next one (null when there is no next page)
+  static Future<({List<Transaction> transactions, String? nextCursor})> getTransactionsPage({
+    int limit = 50,
+    int skip = 0,
+    String? cursor,
+    TransactionType? type,
+    DateTime? startDate,
+    DateTime? endDate,
+    Currency? currency,
+  }) async {
+    String url = '$baseUrl/api/transactions?limit=$limit';
+    if (cursor != null) {
+      url += '&cursor=${Uri.encodeComponent(cursor)}';
+    } else {
+      url += '&skip=$skip';
+    }
 
     if (type != null) {
       url += '&transaction_type=${type.name}';
@@ -434,12 +463,39 @@ class ApiService {
     );
     if (response.statusCode == 200) {
       final List<dynamic> data = jsonDecode(response.body);
-      return data.map((json) => Transaction.fromJson(json)).toList();
+      return (
+        transactions: data.map((json) => Transaction.fromJson(json)).toList(),
+        nextCursor: response.headers['x-next-cursor'],
+      );
     } else {
       throw Exception('Failed to get transactions: ${response.body}');
     }
   }
 
+  // Every matching transaction, read page by page
+  static Future<List<Transaction>> getAllTransactions({
+    TransactionType? type,
+    DateTime? startDate,
+    DateTime? endDate,
+    Currency? currency,
+  }) async {
+    final transactions = <Transaction>[];
+    String? cursor;
+    do {
+      final page = await getTransactionsPage(
+        limit: transactionsPageSize,
+        cursor: cursor,
+        type: type,
+        startDate: startDate,
+        endDate: endDate,
+        currency: currency,
+      );
+      transactions.addAll(page.transactions);
+      cursor = page.nextCursor;
+    } while (cursor != null);
+    return transactions;
+  }
+
   static Future<Transaction> getTransaction(String transactionId) async {
     final response = await http.get(
       Uri.parse('$baseUrl/api/transactions/$transactionId'),